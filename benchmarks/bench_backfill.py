@@ -0,0 +1,102 @@
+'''
+Benchmark the time-windowed backfill of bot_attribution_explore against exploring the
+same transactions in one pass.
+
+Synthetic transactions are backfilled in windows by a fake client that holds every query
+for `--latency` seconds, with one worker and with `--workers`. Both must tag the same
+contracts, signatures and callers, with the same invocations and burst stats, as explore()
+over every transaction at once. A backfill whose window fails is then rerun over the same
+range and must only query the failed window again.
+
+usage: python -m benchmarks.bench_backfill [--transactions 300000] [--window 6h] [--workers 4] [--latency 0.2]
+'''
+import argparse
+import sys
+import tempfile
+import time
+from unittest import mock
+
+import pandas as pd
+
+from benchmarks.fakes import FakeWriter, load_stage, transactions_client
+from benchmarks.synthetic import START, generate_transactions
+
+
+explore = load_stage('explore')
+# backfill imports main by its Cloud Function name, so it shares the patched stage
+sys.modules['main'] = explore
+import backfill
+from ingest import query_batches, window_signature_query
+
+
+KEYS = {'contracts': ['to_address_hash'], 'signatures': ['to_address_hash', 'signature'],
+        'callers': ['caller', 'to_address_hash']}
+
+
+class WindowReader:
+    def __init__(self, client, fail_at=None):
+        self.client = client
+        self.fail_at = fail_at
+        self.windows = []
+
+    def __call__(self, start, end):
+        self.windows.append((start, end))
+        if start == self.fail_at:
+            raise RuntimeError(f'query of window {start} - {end} failed')
+        return query_batches(self.client, window_signature_query.format(start=start, end=end))
+
+
+def assert_same_tables(expected, actual):
+    for expected_df, actual_df, (table, keys) in zip(expected, actual, KEYS.items()):
+        columns = [column for column in expected_df.columns if column != 'updated_at']
+        pd.testing.assert_frame_equal(expected_df[columns].sort_values(keys).reset_index(drop=True),
+                                      actual_df[columns].sort_values(keys).reset_index(drop=True),
+                                      check_dtype=False, obj=table)
+
+
+def bench(transactions, window, workers, latency):
+    transactions_df = generate_transactions(transactions)
+    start, end = START, transactions_df['block_timestamp'].max() + pd.Timedelta(seconds=1)
+    client = transactions_client(transactions_df, latency=latency)
+    windows = backfill.split_windows(start, end, window)
+
+    timings = {}
+    with mock.patch.object(explore, 'bqclient', client), mock.patch('pandas_gbq.to_gbq', FakeWriter().to_gbq):
+        expected = explore.explore(transactions_df, engine='pandas', workers=1)
+        for count in sorted({1, workers}):
+            began = time.perf_counter()
+            results = backfill.backfill(start, end, window, count, checkpoint_dir=None, read_window=WindowReader(client))
+            timings[f'workers={count}'] = round(time.perf_counter() - began, 3)
+            assert_same_tables(expected, results)
+
+        with tempfile.TemporaryDirectory() as directory:
+            failing = WindowReader(client, fail_at=windows[len(windows) // 2][0])
+            try:
+                backfill.backfill(start, end, window, workers, checkpoint_dir=directory, read_window=failing)
+                raise AssertionError('the failed window did not fail the backfill')
+            except RuntimeError as error:
+                print(f'failed: {error}')
+
+            resuming = WindowReader(client)
+            began = time.perf_counter()
+            results = backfill.backfill(start, end, window, workers, checkpoint_dir=directory, read_window=resuming)
+            timings['resumed'] = round(time.perf_counter() - began, 3)
+            assert_same_tables(expected, results)
+            # the failed window and its lead-in
+            assert [read_start for read_start, _ in resuming.windows] == \
+                   [failing.fail_at - backfill.LEAD_IN, failing.fail_at], resuming.windows
+
+    return len(windows), timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=300000)
+    parser.add_argument('--window', default='6h')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.2)
+    args = parser.parse_args()
+
+    windows, timings = bench(args.transactions, args.window, args.workers, args.latency)
+    print(f'{args.transactions} transactions in {windows} windows of {args.window}')
+    print(pd.Series(timings, name='wall_s').to_string())
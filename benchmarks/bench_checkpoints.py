@@ -0,0 +1,153 @@
+'''
+Benchmark resuming explore and analyze runs from their stage checkpoints.
+
+Every run is first completed without failures. Then an attempt fails on its last write,
+and a second attempt over the same window resumes it. The resumed attempt must skip the
+fetch and the tagging, write only what the failed attempt did not, and leave the same
+tables as the clean run. Explore also resumes from its aggregated counts alone.
+
+usage: python -m benchmarks.bench_checkpoints [--transactions 1000000]
+'''
+import argparse
+import functools
+import os
+import tempfile
+import time
+from unittest import mock
+
+import pandas as pd
+
+from benchmarks.bench_fetch import tagged_tables
+from benchmarks.fakes import FakeWriter, load_stage, transactions_client
+from benchmarks.synthetic import generate_smart_contracts, generate_transactions
+
+
+explore = load_stage('explore')
+analyze = load_stage('analyze')
+# importable once load_stage() put both stages on sys.path
+from checkpoint import Checkpoints
+from writer import LocalBackend
+
+
+KEYS = {'contracts': ['to_address_hash'], 'signatures': ['to_address_hash', 'signature'],
+        'callers': ['caller', 'to_address_hash']}
+
+class FailingWriter(FakeWriter):
+    def __init__(self, fail_on=None):
+        super().__init__()
+        self.fail_on = fail_on
+
+    def to_gbq(self, df, table_id, project_id=None, **kwargs):
+        if table_id == self.fail_on:
+            self.fail_on = None
+            raise RuntimeError(f'write to {table_id} failed')
+        super().to_gbq(df, table_id, project_id, **kwargs)
+
+
+def counted(calls, name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        calls[name] = calls.get(name, 0) + 1
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def attempt(run, timings, name):
+    start = time.perf_counter()
+    try:
+        return run()
+    except RuntimeError as error:
+        print(f'{name}: {error}')
+    finally:
+        timings[name] = round(time.perf_counter() - start, 3)
+
+
+def bench_explore(transactions_df, directory):
+    path = os.path.join(directory, 'transactions.parquet')
+    transactions_df.to_parquet(path, row_group_size=100000)
+    client = transactions_client(transactions_df, generate_smart_contracts(transactions_df))
+    checkpoints = lambda: Checkpoints('explore', window='bench', directory=os.path.join(directory, 'checkpoints'))
+    run = lambda: explore.write_tables(*explore.explore_latest(current), current)
+
+    timings, calls, writers = {}, {}, {}
+    for name, fail_on in (('clean', None), ('failed', '1_attributions.callers'), ('resumed', None)):
+        writers[name] = FailingWriter(fail_on)
+        counts = counted(calls, name, functools.partial(explore.get_signature_counts, source=path))
+        with mock.patch.object(explore, 'bqclient', client), \
+             mock.patch.object(explore, 'get_signature_counts', counts), \
+             mock.patch('pandas_gbq.to_gbq', writers[name].to_gbq):
+            current = checkpoints()
+            attempt(run, timings, name)
+            if name == 'clean':
+                current.clear()
+
+    assert calls == {'clean': 1, 'failed': 1}, calls
+    assert sorted(writers['failed'].tables) == ['1_attributions.contracts', '1_attributions.signatures']
+    assert sorted(writers['resumed'].tables) == ['1_attributions.callers']
+    for table_id, frames in writers['clean'].tables.items():
+        written = writers['failed'].tables.get(table_id, []) + writers['resumed'].tables.get(table_id, [])
+        assert len(written) == 1, table_id
+        columns = [column for column in frames[0].columns if column != 'updated_at']
+        pd.testing.assert_frame_equal(frames[0][columns].reset_index(drop=True),
+                                      written[0][columns].reset_index(drop=True), check_dtype=False)
+
+    # without the tagged tables, a rerun tags the aggregated counts again without streaming them
+    current = checkpoints()
+    os.remove(current._marker('tag'))
+    with mock.patch.object(explore, 'bqclient', client), \
+         mock.patch.object(explore, 'get_signature_counts', counted(calls, 'aggregate', explore.get_signature_counts)):
+        start = time.perf_counter()
+        resumed = explore.explore_latest(current)
+        timings['from_aggregate'] = round(time.perf_counter() - start, 3)
+    assert 'aggregate' not in calls
+    for frame, (table, keys) in zip(resumed, KEYS.items()):
+        clean = writers['clean'].tables[f'1_attributions.{table}'][0]
+        columns = [column for column in clean.columns if column != 'updated_at']
+        pd.testing.assert_frame_equal(clean[columns].sort_values(keys).reset_index(drop=True),
+                                      frame[columns].sort_values(keys).reset_index(drop=True), check_dtype=False)
+    current.clear()
+    return timings
+
+
+def bench_analyze(transactions_df, directory):
+    smart_contracts_df = generate_smart_contracts(transactions_df)
+    client = transactions_client(transactions_df, smart_contracts_df, tagged_tables(transactions_df, smart_contracts_df))
+    caches = {'whitelist_path': os.path.join(directory, 'smart_contracts.parquet'),
+              'fingerprint_path': os.path.join(directory, 'fingerprints.parquet')}
+
+    timings, calls, backends = {}, {}, {}
+    for name, fail in (('clean', False), ('failed', True), ('resumed', False)):
+        backends[name] = LocalBackend()
+
+        def write_df(*frames, backend=backends[name], fail=fail, tagged=None):
+            if fail:
+                raise RuntimeError('merge failed')
+            return analyze.write_results(backend, *frames)
+
+        with mock.patch.object(analyze, 'bqclient', client), \
+             mock.patch.object(analyze, 'get_tagged_data',
+                               counted(calls, name, functools.partial(analyze.get_tagged_data, **caches))), \
+             mock.patch.object(analyze, 'write_df', write_df):
+            current = Checkpoints('analyze', window='bench', directory=os.path.join(directory, 'checkpoints'))
+            # a completed run removes its own checkpoints
+            attempt(lambda: analyze.analyze_latest('local', current), timings, name)
+
+    assert calls == {'clean': 1, 'failed': 1}, calls
+    for table, clean_df in backends['clean'].tables.items():
+        resumed_df = backends['resumed'].tables[table]
+        keys = [column for column in clean_df.columns if column != 'updated_at']
+        pd.testing.assert_frame_equal(clean_df[keys].sort_values(keys).reset_index(drop=True),
+                                      resumed_df[keys].sort_values(keys).reset_index(drop=True), check_dtype=False)
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=1000000)
+    args = parser.parse_args()
+
+    transactions_df = generate_transactions(args.transactions)
+    with tempfile.TemporaryDirectory() as directory:
+        timings = {'explore': bench_explore(transactions_df, directory),
+                   'analyze': bench_analyze(transactions_df, directory)}
+    print(pd.DataFrame(timings).rename_axis('attempt').to_string())
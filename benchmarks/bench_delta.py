@@ -0,0 +1,128 @@
+'''
+Benchmark delta writes against a snapshot of the attribution state.
+
+Explore appends the tables of a run, the same run again, and a run over more transactions,
+once writing every row and once through a Snapshot. Analyze upserts its results, the same
+results again, results with changed confidence levels, and those results again once explore
+appended suspicious rows for some of their keys, into a LocalBackend the same two ways. The
+snapshot must skip the unchanged rows, write the new, changed and appended ones, and leave
+tables holding the same latest content per key as writing every row.
+
+usage: python -m benchmarks.bench_delta [--transactions 300000] [--changed 0.1]
+'''
+import argparse
+import os
+import tempfile
+import time
+from unittest import mock
+
+import pandas as pd
+
+from benchmarks.bench_fetch import tagged_tables
+from benchmarks.fakes import FakeWriter, load_stage, transactions_client
+from benchmarks.synthetic import generate_smart_contracts, generate_transactions
+
+
+explore = load_stage('explore')
+analyze = load_stage('analyze')
+# importable once load_stage() put both stages on sys.path
+from delta import Snapshot
+from writer import TABLES, LocalBackend
+
+
+def timed(timings, name, func):
+    start = time.perf_counter()
+    result = func()
+    timings[name] = {'wall_s': round(time.perf_counter() - start, 3), **(timings.get(name) or {})}
+    return result
+
+
+'''
+The latest appended row of every key, without updated_at.
+'''
+def latest_rows(frames, keys):
+    df = pd.concat(frames, ignore_index=True).drop(columns='updated_at')
+    return df.drop_duplicates(keys, keep='last').sort_values(keys).reset_index(drop=True)
+
+
+def bench_explore(transactions_df, directory):
+    client = transactions_client(transactions_df, generate_smart_contracts(transactions_df))
+    with mock.patch.object(explore, 'bqclient', client):
+        earlier = explore.explore(transactions_df.iloc[:int(len(transactions_df.index) * 0.9)], 'pandas')
+        later = explore.explore(transactions_df, 'pandas')
+
+    timings, writers = {}, {'full': FakeWriter(), 'delta': FakeWriter()}
+    snapshot = Snapshot('explore', directory)
+    for mode, writer in writers.items():
+        for name, results in (('first', earlier), ('rerun', earlier), ('more_blocks', later)):
+            with mock.patch('pandas_gbq.to_gbq', writer.to_gbq):
+                written = {table_id: len(frames) for table_id, frames in writer.tables.items()}
+                timed(timings, f'explore.{mode}.{name}',
+                      lambda: explore.write_tables(*results, snapshot=snapshot if mode == 'delta' else None))
+                rows = sum(len(frame.index) for table_id, frames in writer.tables.items()
+                           for frame in frames[written.get(table_id, 0):])
+                timings[f'explore.{mode}.{name}']['rows_written'] = rows
+
+    assert timings['explore.delta.rerun']['rows_written'] == 0, timings['explore.delta.rerun']
+    assert timings['explore.delta.more_blocks']['rows_written'] < timings['explore.full.more_blocks']['rows_written']
+    for table, keys in explore.TABLE_KEYS.items():
+        table_id = f'1_attributions.{table}'
+        pd.testing.assert_frame_equal(latest_rows(writers['full'].tables[table_id], keys),
+                                      latest_rows(writers['delta'].tables[table_id], keys), check_dtype=False)
+    return timings
+
+
+def bench_analyze(transactions_df, directory, changed):
+    smart_contracts_df = generate_smart_contracts(transactions_df)
+    client = transactions_client(transactions_df, smart_contracts_df, tagged_tables(transactions_df, smart_contracts_df))
+    with mock.patch.object(analyze, 'bqclient', client):
+        tagged = analyze.get_tagged_data(whitelist_path=os.path.join(directory, 'smart_contracts.parquet'),
+                                         fingerprint_path=os.path.join(directory, 'fingerprints.parquet'))
+        results = analyze.analyze(*tagged)
+
+    # a later run lowering the confidence in some of the callers
+    bot_callers = results[2].copy()
+    lowered = bot_callers.index[:int(len(bot_callers.index) * changed)]
+    bot_callers.loc[lowered, 'confidence_level'] = 0.5
+    later = (results[0], results[1], bot_callers)
+    # explore appending suspicious rows again for other callers, which the merge has to tag again
+    reappended = {'callers': results[2].iloc[len(lowered):2 * len(lowered)].assign(tag='suspicious')}
+
+    timings, backends = {}, {'full': LocalBackend(), 'delta': LocalBackend()}
+    snapshot = Snapshot('analyze', directory)
+    for mode, backend in backends.items():
+        for name, frames, stale in (('first', results, None), ('rerun', results, None), ('changed', later, None),
+                                    ('reappended', later, reappended)):
+            if stale:
+                table = backend.tables['callers']
+                keys = table[['caller', 'to_address_hash']].merge(stale['callers'], how='left', indicator=True)
+                table.loc[(keys['_merge'] == 'both').to_numpy(), 'tag'] = 'suspicious'
+            counts = timed(timings, f'analyze.{mode}.{name}',
+                           lambda: analyze.write_results(backend, *frames, stale=stale,
+                                                         snapshot=snapshot if mode == 'delta' else None))
+            timings[f'analyze.{mode}.{name}']['rows_written'] = sum(counts.values())
+
+    assert timings['analyze.delta.rerun']['rows_written'] == 0, timings['analyze.delta.rerun']
+    # a full rerun only updates the rows whose tag or confidence changed
+    assert timings['analyze.full.rerun']['rows_written'] == 0, timings['analyze.full.rerun']
+    assert timings['analyze.delta.changed']['rows_written'] == len(lowered), timings['analyze.delta.changed']
+    for mode in ('full', 'delta'):
+        assert timings[f'analyze.{mode}.reappended']['rows_written'] == len(lowered), timings[f'analyze.{mode}.reappended']
+    for table, spec in TABLES.items():
+        full_df, delta_df = (backends[mode].tables[table][spec['insert']].sort_values(spec['keys']).reset_index(drop=True)
+                             for mode in ('full', 'delta'))
+        pd.testing.assert_frame_equal(full_df, delta_df, check_dtype=False)
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=300000)
+    parser.add_argument('--changed', type=float, default=0.1)
+    args = parser.parse_args()
+
+    transactions_df = generate_transactions(args.transactions)
+    with tempfile.TemporaryDirectory() as directory:
+        timings = {**bench_explore(transactions_df, directory),
+                   **bench_analyze(transactions_df, directory, args.changed)}
+    print(pd.DataFrame(timings).T.to_string())
@@ -0,0 +1,108 @@
+'''
+Benchmark the per address feature store.
+
+Explore runs incrementally over growing prefixes of the synthetic transactions, one of them
+twice, updating a FeatureStore on the way. The store must hold the same features as one
+built from all transactions at once, and as counting them from the transactions with pandas.
+Analyze then reads the features of every caller in bulk, timed against that rescan.
+
+usage: python -m benchmarks.bench_features [--transactions 300000] [--increments 4]
+'''
+import argparse
+import functools
+import os
+import tempfile
+import time
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from benchmarks.fakes import FakeWriter, load_stage, transactions_client
+from benchmarks.synthetic import generate_smart_contracts, generate_transactions
+
+
+explore = load_stage('explore')
+analyze = load_stage('analyze')
+# importable once load_stage() put both stages on sys.path
+from features import FEATURE_COLUMNS, PERIOD_TOLERANCE, TRANSACTION_COLUMNS, FeatureStore
+
+
+'''
+The features of every sender counted from the transactions themselves.
+'''
+def rescan(transactions_df):
+    transactions_df = transactions_df[transactions_df['from_address_hash'].notna()]
+    transactions_df = transactions_df.sort_values(['block_timestamp', 'block_number'], kind='stable')
+    by_caller = transactions_df.groupby('from_address_hash')
+    gaps = by_caller['block_timestamp'].diff().dt.total_seconds()
+    previous = gaps.groupby(transactions_df['from_address_hash']).shift()
+    grouped = transactions_df.assign(gap=gaps, block_gap=by_caller['block_number'].diff(),
+                                     periodic=(gaps - previous).abs() <= PERIOD_TOLERANCE * previous) \
+                             .groupby('from_address_hash')
+    return grouped.agg(tx_count=('block_number', 'size'), distinct_selectors=('signature', 'nunique'),
+                       distinct_counterparties=('to_address_hash', 'nunique'), interarrival_mean=('gap', 'mean'),
+                       interarrival_var=('gap', lambda gaps: gaps.var(ddof=0)),
+                       block_gap_mean=('block_gap', 'mean'), block_gap_var=('block_gap', lambda gaps: gaps.var(ddof=0)),
+                       periodic_gaps=('periodic', 'sum'), last_gap=('gap', 'last'),
+                       first_seen_block=('block_number', 'min'), last_seen_block=('block_number', 'max'),
+                       first_seen=('block_timestamp', 'first'), last_seen=('block_timestamp', 'last'))
+
+
+def bench(transactions, increments):
+    transactions_df = generate_transactions(transactions)
+    client = transactions_client(transactions_df, generate_smart_contracts(transactions_df))
+    transactions_df['signature'] = transactions_df['input'].str.slice(0, 10)
+    transactions_df.loc[transactions_df['input'].str.len() < 10, 'signature'] = None
+    # increments end with a whole block, as runs read whole blocks past the watermark
+    blocks = transactions_df['block_number'].to_numpy()
+    cuts = blocks.searchsorted(blocks[np.linspace(0, len(blocks), increments + 1).astype(int)[1:] - 1], side='right')
+
+    timings = {}
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'transactions.parquet')
+        state = os.path.join(directory, 'state.parquet')
+        store = functools.partial(FeatureStore, os.path.join(directory, 'incremental'))
+        # the second increment runs twice, like a retried run
+        for run, cut in enumerate([cuts[0], cuts[1], cuts[1], *cuts[2:]]):
+            transactions_df.iloc[:cut].to_parquet(source)
+            with mock.patch.object(explore, 'bqclient', client), mock.patch.object(explore, 'FeatureStore', store), \
+                 mock.patch('pandas_gbq.to_gbq', FakeWriter().to_gbq):
+                start = time.perf_counter()
+                explore.run_incremental(state, source)
+                timings[f'explore.increment_{run}'] = round(time.perf_counter() - start, 3)
+
+        incremental = store()
+        once = FeatureStore(os.path.join(directory, 'once'))
+        table = pa.Table.from_pandas(transactions_df[TRANSACTION_COLUMNS], preserve_index=False)
+        for _ in once.observe(table.to_batches(max_chunksize=100000)):
+            pass
+        once.update()
+        callers = transactions_df['from_address_hash'].dropna().drop_duplicates()
+        pd.testing.assert_frame_equal(incremental.lookup(callers), once.lookup(callers))
+
+        start = time.perf_counter()
+        rescanned_df = rescan(transactions_df).loc[callers]
+        timings['rescan'] = round(time.perf_counter() - start, 3)
+        start = time.perf_counter()
+        features_df = analyze.analyze_pipeline.run('caller_features', {'callers': callers.to_frame('caller'),
+                                                                       'feature_store': store()})
+        timings['analyze.caller_features'] = round(time.perf_counter() - start, 3)
+
+        assert features_df['address'].tolist() == callers.tolist()
+        pd.testing.assert_frame_equal(features_df[FEATURE_COLUMNS].reset_index(drop=True),
+                                      rescanned_df[FEATURE_COLUMNS].reset_index(drop=True),
+                                      check_dtype=False, check_exact=False, rtol=1e-6)
+        timings['store_mb'] = round(sum(entry.stat().st_size for entry in os.scandir(incremental.path)) / 2 ** 20, 2)
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=300000)
+    parser.add_argument('--increments', type=int, default=4)
+    args = parser.parse_args()
+
+    timings = bench(args.transactions, args.increments)
+    print(pd.Series(timings).to_string())
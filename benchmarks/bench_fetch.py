@@ -0,0 +1,64 @@
+'''
+Benchmark how get_tagged_data() overlaps its BigQuery round trips.
+
+The explore results of synthetic transactions are served as the tagged tables, next to
+the smart_contracts whitelist, by a fake client that holds every query for `--latency`
+seconds. Fetching them one at a time is compared with the concurrent default; the
+second run also finds the whitelist cache warm and only fetches its (empty) delta.
+
+usage: python -m benchmarks.bench_fetch [--transactions 100000] [--latency 0.5]
+'''
+import argparse
+import os
+import tempfile
+import time
+from unittest import mock
+
+import pandas as pd
+
+from benchmarks.fakes import load_stage, transactions_client
+from benchmarks.synthetic import generate_smart_contracts, generate_transactions
+
+
+def tagged_tables(transactions_df, smart_contracts_df):
+    explore = load_stage('explore')
+    with mock.patch.object(explore, 'bqclient', transactions_client(transactions_df, smart_contracts_df)):
+        explored = explore.explore(transactions_df)
+    return dict(zip(('contracts', 'signatures', 'callers'), explored))
+
+
+def bench(transactions, latency, max_workers):
+    analyze = load_stage('analyze')
+    transactions_df = generate_transactions(transactions)
+    smart_contracts_df = generate_smart_contracts(transactions_df)
+    client = transactions_client(transactions_df, smart_contracts_df, tagged_tables(transactions_df, smart_contracts_df),
+                                 latency=latency)
+
+    timings, results = {}, {}
+    with mock.patch.object(analyze, 'bqclient', client), tempfile.TemporaryDirectory() as directory:
+        for workers in (1, max_workers):
+            start = time.perf_counter()
+            results[workers] = analyze.get_tagged_data(max_workers=workers,
+                                                       whitelist_path=os.path.join(directory, 'smart_contracts.parquet'),
+                                                       fingerprint_path=os.path.join(directory, 'fingerprints.parquet'))
+            timings[workers] = round(time.perf_counter() - start, 3)
+
+    *sequential, sequential_whitelist, sequential_fingerprints = results[1]
+    *concurrent, concurrent_whitelist, concurrent_fingerprints = results[max_workers]
+    for sequential_df, concurrent_df in zip(sequential, concurrent):
+        pd.testing.assert_frame_equal(sequential_df, concurrent_df)
+    assert sequential_whitelist.addresses.equals(concurrent_whitelist.addresses)
+    pd.testing.assert_frame_equal(sequential_fingerprints.fingerprints_df, concurrent_fingerprints.fingerprints_df)
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--max-workers', type=int, default=4)
+    args = parser.parse_args()
+
+    timings = bench(args.transactions, args.latency, args.max_workers)
+    print(pd.Series(timings, name='wall_s').rename_axis('max_workers').to_string())
+    print(f"speedup {timings[1] / timings[args.max_workers]:.1f}x")
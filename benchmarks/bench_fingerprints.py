@@ -0,0 +1,79 @@
+'''
+Benchmark the byte code fingerprint store of bot_attribution_analyze against hashing every
+contract's byte code on every run.
+
+Synthetic creations deploy families of exact clones. The store is filled once, labelled
+with one bot per family and reloaded cold from Parquet; every clone of a labelled family
+must match and no other contract may. Rehashing is timed over the same creations.
+
+usage: python -m benchmarks.bench_fingerprints [--contracts 200000] [--families 2000]
+'''
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.fakes import load_stage
+from benchmarks.synthetic import BLOCK_SECONDS, HEX, START, addresses
+
+
+load_stage('analyze')
+# importable once load_stage() put bot_attribution_analyze on sys.path
+import fingerprints
+
+
+def generate_creations(contracts, families, bytecode_length=600, seed=0):
+    rng = np.random.RandomState(seed)
+    templates = np.array(['0x' + ''.join(code) for code in HEX[rng.randint(0, 16, size=(families, bytecode_length))]],
+                         dtype=object)
+    family_ids = rng.randint(0, families, size=contracts)
+    return pd.DataFrame({
+        'address_hash': addresses(rng, contracts),
+        'input': templates[family_ids],
+        'block_number': np.arange(contracts, dtype=np.int64),
+        'block_timestamp': START + pd.to_timedelta(np.arange(contracts) * BLOCK_SECONDS, unit='s'),
+    }), family_ids
+
+
+def timed(timings, name, func):
+    start = time.perf_counter()
+    result = func()
+    timings[name] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def bench(contracts, families):
+    creations_df, family_ids = generate_creations(contracts, families)
+    bot_families = np.arange(0, families, 2)
+    bots = creations_df['address_hash'][np.isin(family_ids, bot_families)].groupby(
+        family_ids[np.isin(family_ids, bot_families)]).first()
+
+    timings = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'fingerprints.parquet')
+        store = timed(timings, 'fill', lambda: fingerprints.update_store(fingerprints.read_store(path),
+                                                                         creations_df, path))
+        store.label_bots(bots)
+        store.save()
+
+        store = timed(timings, 'cold_load', lambda: fingerprints.FingerprintStore(fingerprints.read_store(path), path))
+        matches = timed(timings, 'lookup', lambda: store.bot_clones(creations_df['address_hash']))
+        timed(timings, 'rehash', lambda: fingerprints.code_hashes(creations_df['input'].to_numpy()))
+        size_mb = round(os.path.getsize(path) / 2 ** 20, 2)
+
+    assert np.array_equal(matches, np.isin(family_ids, bot_families))
+    return timings, size_mb
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--contracts', type=int, default=200000)
+    parser.add_argument('--families', type=int, default=2000)
+    args = parser.parse_args()
+
+    timings, size_mb = bench(args.contracts, args.families)
+    print(f'{args.contracts} contracts in {args.families} families, store of {size_mb} MB')
+    print(pd.Series(timings, name='wall_s').to_string())
@@ -0,0 +1,66 @@
+'''
+Benchmark how explore() scales with EXPLORE_WORKERS, the processes counting partitions
+of the transactions by contract.
+
+Synthetic transactions are explored in memory and streamed from a Parquet file with each
+worker count; every run must produce the same contracts, signatures and callers as the
+single process run. Speedups are bounded by the cores of the machine.
+
+usage: python -m benchmarks.bench_parallel [--transactions 1000000] [--workers 1 2 4]
+'''
+import argparse
+import os
+import tempfile
+import time
+from unittest import mock
+
+import pandas as pd
+
+from benchmarks.fakes import load_stage, transactions_client
+from benchmarks.synthetic import generate_smart_contracts, generate_transactions
+
+
+KEYS = [['to_address_hash'], ['to_address_hash', 'signature'], ['caller', 'to_address_hash']]
+
+
+def assert_same(expected, actual):
+    for expected_df, actual_df, keys in zip(expected, actual, KEYS):
+        # updated_at is stamped at run time
+        columns = [column for column in expected_df.columns if column != 'updated_at']
+        pd.testing.assert_frame_equal(expected_df[columns].sort_values(keys).reset_index(drop=True),
+                                      actual_df[columns].sort_values(keys).reset_index(drop=True))
+
+
+def bench(transactions, workers):
+    explore = load_stage('explore')
+    transactions_df = generate_transactions(transactions)
+    client = transactions_client(transactions_df, generate_smart_contracts(transactions_df))
+
+    timings, results = {}, {}
+    with mock.patch.object(explore, 'bqclient', client), tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'transactions.parquet')
+        transactions_df.to_parquet(path, row_group_size=100000)
+
+        for count in workers:
+            for mode, run in (('explore', lambda: explore.explore(transactions_df, engine='pandas', workers=count)),
+                              ('stream', lambda: explore.explore_signature_counts(
+                                  *explore.get_signature_counts(source=path, workers=count)))):
+                start = time.perf_counter()
+                results[mode, count] = run()
+                timings[mode, count] = round(time.perf_counter() - start, 3)
+                assert_same(results[mode, workers[0]], results[mode, count])
+
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+
+    timings = pd.Series(bench(args.transactions, args.workers), name='wall_s').rename_axis(['mode', 'workers'])
+    print(f'{os.cpu_count()} cores')
+    print(timings.unstack('mode').assign(**{
+        f'{mode}_speedup': (timings[mode].iloc[0] / timings[mode]).round(2) for mode in ('explore', 'stream')
+    }).to_string())
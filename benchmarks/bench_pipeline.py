@@ -0,0 +1,77 @@
+'''
+Benchmark the stage DAGs of explore and analyze, run one stage at a time and with
+concurrent stages.
+
+The fake client holds every query for `--latency` seconds. With concurrent stages, the
+contract creations query of explore overlaps counting and tagging, and the whitelist and
+fingerprint fetches of analyze overlap its heuristics. Both runs must produce the same
+tables, and every stage must run once per run however many stages read its outputs.
+
+usage: python -m benchmarks.bench_pipeline [--transactions 300000] [--latency 0.5] [--workers 4]
+'''
+import argparse
+import collections
+import os
+import tempfile
+import time
+from unittest import mock
+
+import pandas as pd
+
+from benchmarks.bench_fetch import tagged_tables
+from benchmarks.fakes import load_stage, transactions_client
+from benchmarks.synthetic import generate_smart_contracts, generate_transactions
+
+
+explore = load_stage('explore')
+analyze = load_stage('analyze')
+# importable once load_stage() put both stages on sys.path
+import metrics
+
+
+def run_pipelines(transactions_df, tagged, directory):
+    explored = explore.explore(transactions_df, engine='pandas', workers=1)
+    # cold whitelist and fingerprint caches, so every run fetches them
+    get_whitelist, get_fingerprints = analyze.get_whitelist, analyze.get_fingerprints
+    with mock.patch.object(analyze, 'get_whitelist', lambda: get_whitelist(os.path.join(directory, 'whitelist.parquet'))), \
+         mock.patch.object(analyze, 'get_fingerprints',
+                           lambda: get_fingerprints(os.path.join(directory, 'fingerprints.parquet'))):
+        analyzed = analyze.analyze(*[tagged[table] for table in ('contracts', 'signatures', 'callers')])
+    return list(explored) + list(analyzed)
+
+
+def bench(transactions, latency, workers):
+    transactions_df = generate_transactions(transactions)
+    smart_contracts_df = generate_smart_contracts(transactions_df)
+    tagged = tagged_tables(transactions_df, smart_contracts_df)
+    client = transactions_client(transactions_df, smart_contracts_df, latency=latency)
+
+    timings, results = {}, {}
+    for count in (1, workers):
+        with mock.patch.object(explore, 'bqclient', client), mock.patch.object(analyze, 'bqclient', client), \
+             mock.patch.object(explore.explore_pipeline, 'max_workers', count), \
+             mock.patch.object(analyze.analyze_pipeline, 'max_workers', count), \
+             tempfile.TemporaryDirectory() as directory:
+            stages_before = len(metrics.run_stages)
+            start = time.perf_counter()
+            results[count] = run_pipelines(transactions_df, tagged, directory)
+            timings[f'workers={count}'] = round(time.perf_counter() - start, 3)
+
+        ran = collections.Counter(record['stage'] for record in metrics.run_stages[stages_before:])
+        repeated = {name: times for name, times in ran.items() if times > 1}
+        assert not repeated, repeated
+
+    for sequential_df, concurrent_df in zip(results[1], results[workers]):
+        columns = [column for column in sequential_df.columns if column not in ('updated_at', 'timestamp')]
+        pd.testing.assert_frame_equal(sequential_df[columns], concurrent_df[columns])
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=300000)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    print(pd.Series(bench(args.transactions, args.latency, args.workers), name='wall_s').to_string())
@@ -0,0 +1,96 @@
+'''
+Benchmark the BigQuery query-result cache on repeated runs.
+
+Explore's get_transactions() and analyze's get_tagged_data() are run twice against a fake
+client holding every query for `--latency` seconds, reading through a fresh QueryCache.
+The rerun must hit the cache for every cacheable query, return the same frames and only
+report the bytes of the 1_attributions reads, which always go to BigQuery. Queries reach the
+client as written. A TTL of zero queries again, and a size cap keeps only the most recently
+read results.
+
+usage: python -m benchmarks.bench_query_cache [--transactions 300000] [--latency 0.5]
+'''
+import argparse
+import os
+import tempfile
+import time
+from unittest import mock
+
+import pandas as pd
+
+from benchmarks.bench_fetch import tagged_tables
+from benchmarks.fakes import load_stage, transactions_client
+from benchmarks.synthetic import generate_smart_contracts, generate_transactions
+
+
+explore = load_stage('explore')
+analyze = load_stage('analyze')
+# importable once load_stage() put both stages on sys.path
+import metrics
+import query_cache
+
+
+def run_both(directory):
+    os.makedirs(directory)
+    stages_before = len(metrics.run_stages)
+    transactions_df = explore.get_transactions()
+    # fresh whitelist and fingerprint caches, so both runs send the same delta queries
+    tagged = analyze.get_tagged_data(whitelist_path=os.path.join(directory, 'smart_contracts.parquet'),
+                                     fingerprint_path=os.path.join(directory, 'fingerprints.parquet'))
+    bytes_processed = sum(record['bytes_processed'] for record in metrics.run_stages[stages_before:])
+    return [transactions_df, *tagged[:3]], bytes_processed
+
+
+def timed_run(cache, client, directory, timings, name):
+    with mock.patch.object(query_cache, 'QUERY_CACHE', cache), \
+         mock.patch.object(explore, 'bqclient', client), mock.patch.object(analyze, 'bqclient', client):
+        start = time.perf_counter()
+        frames, bytes_processed = run_both(directory)
+        timings[name] = {'wall_s': round(time.perf_counter() - start, 3), 'bytes_processed': bytes_processed,
+                         **cache.report()}
+    return frames
+
+
+def bench(transactions, latency):
+    transactions_df = generate_transactions(transactions)
+    smart_contracts_df = generate_smart_contracts(transactions_df)
+    client = transactions_client(transactions_df, smart_contracts_df, tagged_tables(transactions_df, smart_contracts_df),
+                                 latency=latency)
+
+    timings = {}
+    with tempfile.TemporaryDirectory() as directory:
+        cache = query_cache.QueryCache(os.path.join(directory, 'cache'))
+        cold = timed_run(cache, client, os.path.join(directory, 'cold'), timings, 'cold')
+        queried = len(client.queries)
+        warm = timed_run(cache, client, os.path.join(directory, 'warm'), timings, 'warm')
+        # the fake serves its frames as they are, cached ones come back through Arrow like BigQuery's
+        for cold_df, warm_df in zip(cold, warm):
+            pd.testing.assert_frame_equal(cold_df.astype(warm_df.dtypes.to_dict()).reset_index(drop=True),
+                                          warm_df.reset_index(drop=True))
+        assert timings['warm']['hit_rate'] == 1.0, timings['warm']
+        assert 0 < timings['warm']['bytes_processed'] < timings['cold']['bytes_processed'], timings
+        warm_queries = client.queries[queried:]
+        assert all('1_attributions.' in query_string for query_string in warm_queries), warm_queries
+
+        expired = query_cache.QueryCache(cache.directory, ttl=0)
+        timed_run(expired, client, os.path.join(directory, 'expired'), timings, 'expired')
+        assert timings['expired']['hit_rate'] == 0.0, timings['expired']
+
+        # a cap below both results keeps only the one read last
+        capped = query_cache.QueryCache(os.path.join(directory, 'capped'), max_mb=0)
+        capped.max_bytes = max(entry.stat().st_size for entry in os.scandir(cache.directory))
+        timed_run(capped, client, os.path.join(directory, 'capped_run'), timings, 'capped')
+        size = sum(entry.stat().st_size for entry in os.scandir(capped.directory))
+        assert 0 < size <= capped.max_bytes, size
+
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=300000)
+    parser.add_argument('--latency', type=float, default=0.5)
+    args = parser.parse_args()
+
+    timings = bench(args.transactions, args.latency)
+    print(pd.DataFrame(timings).T.to_string())
@@ -0,0 +1,112 @@
+'''
+Benchmark the timing regularity heuristic.
+
+The synthetic transactions get `--scripts` low volume callers firing at a fixed period with
+1% jitter, each calling one contract of the long tail, which neither the propagation from
+the most invoked contracts nor the burst windows catch. A FeatureStore is built from all
+transactions in one sort-and-diff pass, and analyze() runs with and without it. The
+regular callers must include the scripts and the heavy synthetic bots, tag few human
+callers, and reach the analyze results.
+
+usage: python -m benchmarks.bench_regularity [--transactions 1000000] [--scripts 30]
+'''
+import argparse
+import os
+import tempfile
+import time
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from benchmarks.bench_fetch import tagged_tables
+from benchmarks.fakes import load_stage, transactions_client
+from benchmarks.synthetic import (BLOCK_SECONDS, START, addresses, generate_smart_contracts,
+                                  generate_transactions)
+
+
+analyze = load_stage('analyze')
+# importable once load_stage() put both stages on sys.path
+from features import TRANSACTION_COLUMNS, FeatureStore
+from regularity import regularity_scores
+
+
+'''
+Transactions of `scripts` callers sending 12 to 40 transactions each at a period between a
+minute and two hours, to a contract with few callers.
+'''
+def script_transactions(transactions_df, scripts, seed=1):
+    rng = np.random.RandomState(seed)
+    callers = addresses(rng, scripts)
+    invocations = transactions_df['to_address_hash'].value_counts()
+    tail = invocations[invocations < invocations.quantile(0.5)].index.to_numpy()
+
+    frames = []
+    for caller, contract in zip(callers, rng.choice(tail, size=scripts)):
+        count, period = rng.randint(12, 40), rng.uniform(60, 7200)
+        offsets = rng.uniform(0, 86400) + np.arange(count) * period + rng.normal(0, period * 0.01, count)
+        frames.append(pd.DataFrame({'from_address_hash': caller, 'to_address_hash': contract,
+                                    'input': transactions_df['input'].iloc[0],
+                                    'block_timestamp': START + pd.to_timedelta(offsets, unit='s'),
+                                    'created_contract_address_hash': None}))
+    scripts_df = pd.concat(frames, ignore_index=True)
+    scripts_df['block_number'] = ((scripts_df['block_timestamp'] - START).dt.total_seconds()
+                                  // BLOCK_SECONDS).astype('int64')
+    return scripts_df, set(callers)
+
+
+def bench(transactions, scripts):
+    transactions_df = generate_transactions(transactions)
+    # the heavy bot callers come first out of the generator's random state
+    heavy_bots = set(addresses(np.random.RandomState(0), max(1000, transactions // 50))[:50])
+    scripts_df, script_callers = script_transactions(transactions_df, scripts)
+    transactions_df = (pd.concat([transactions_df, scripts_df], ignore_index=True)
+                           .sort_values('block_timestamp', kind='stable').reset_index(drop=True))
+
+    timings = {}
+    with tempfile.TemporaryDirectory() as directory:
+        store = FeatureStore(os.path.join(directory, 'features'))
+        table = pa.Table.from_pandas(transactions_df.assign(signature=transactions_df['input'].str.slice(0, 10))
+                                                    [TRANSACTION_COLUMNS], preserve_index=False)
+        start = time.perf_counter()
+        for _ in store.observe(table.to_batches(max_chunksize=100000)):
+            pass
+        store.update()
+        timings['features.update'] = round(time.perf_counter() - start, 3)
+
+        smart_contracts_df = generate_smart_contracts(transactions_df)
+        client = transactions_client(transactions_df, smart_contracts_df, tagged_tables(transactions_df, smart_contracts_df))
+        with mock.patch.object(analyze, 'bqclient', client):
+            tagged = analyze.get_tagged_data(whitelist_path=os.path.join(directory, 'smart_contracts.parquet'),
+                                             fingerprint_path=os.path.join(directory, 'fingerprints.parquet'))
+            callers_df = tagged[2]
+
+            start = time.perf_counter()
+            features_df = store.lookup(callers_df['caller'].drop_duplicates())
+            scores = regularity_scores(features_df)
+            timings['regularity_scores'] = round(time.perf_counter() - start, 3)
+            regular = set(scores.loc[scores['confidence_level'].notna(), 'address'])
+
+            without = analyze.analyze(*tagged)
+            with_features = analyze.analyze(*tagged, feature_store=store)
+
+    humans = set(features_df.loc[features_df['tx_count'] >= 10, 'address']) - heavy_bots - script_callers
+    stats = {'script_recall': round(len(regular & script_callers) / len(script_callers), 3),
+             'heavy_bot_recall': round(len(regular & heavy_bots) / len(heavy_bots), 3),
+             'human_false_positive_rate': round(len(regular & humans) / max(1, len(humans)), 4),
+             'bot_callers_without': len(without[2].index), 'bot_callers_with': len(with_features[2].index),
+             'scripts_in_results': len(set(with_features[2]['caller']) & script_callers)}
+    assert stats['script_recall'] >= 0.9 and stats['heavy_bot_recall'] >= 0.9, stats
+    assert stats['human_false_positive_rate'] <= 0.01, stats
+    assert stats['scripts_in_results'] > 0 and not set(without[2]['caller']) & script_callers, stats
+    return {**timings, **stats}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--scripts', type=int, default=30)
+    args = parser.parse_args()
+
+    print(pd.Series(bench(args.transactions, args.scripts)).to_string())
@@ -0,0 +1,88 @@
+'''
+Benchmark the bytecode similarity index used by bot_attribution_analyze.
+
+Indexes a fixed set of known bot contracts (analyze() seeds at most 1000), then scores
+N suspicious contracts against it, a fraction of which are near-duplicates of a bot
+contract. For small N the pairwise SequenceMatcher loop is also timed so the speedup
+and recall can be compared.
+
+usage: python -m benchmarks.bench_similarity [--sizes 1000 10000 100000 1000000]
+'''
+import argparse
+import os
+import sys
+import time
+from difflib import SequenceMatcher
+
+import numpy as np
+
+from benchmarks.fakes import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'bot_attribution_analyze'))
+from similarity import SimilarityIndex, SIMILARITY_THRESHOLD
+
+
+HEX = np.array(list('0123456789abcdef'))
+
+
+def random_addresses(rng, n):
+    return ['0x' + ''.join(row) for row in HEX[rng.randint(0, 16, size=(n, 40))]]
+
+
+def mutate(rng, addresses, edits=6):
+    mutated = []
+    for address in addresses:
+        chars = list(address)
+        for position in rng.choice(np.arange(2, 42), size=edits, replace=False):
+            chars[position] = HEX[rng.randint(0, 16)]
+        mutated.append(''.join(chars))
+    return mutated
+
+
+def pairwise_scores(values, bot_contracts):
+    return np.array([max((round(SequenceMatcher(None, value, bot).ratio(), 2) for bot in bot_contracts), default=0)
+                     for value in values])
+
+
+def run(size, bot_contracts=1000, duplicate_ratio=0.05, pairwise_limit=2000, seed=0):
+    rng = np.random.RandomState(seed)
+    bot_contracts = random_addresses(rng, bot_contracts)
+    duplicates = mutate(rng, [bot_contracts[i] for i in rng.randint(0, len(bot_contracts), int(size * duplicate_ratio))])
+    suspicious = random_addresses(rng, size - len(duplicates)) + duplicates
+
+    start = time.perf_counter()
+    index = SimilarityIndex()
+    index.add(bot_contracts)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scores = index.best_scores(suspicious)
+    query_seconds = time.perf_counter() - start
+
+    result = {
+        'contracts': size,
+        'bot_contracts': len(bot_contracts),
+        'build_s': round(build_seconds, 3),
+        'query_s': round(query_seconds, 3),
+        'contracts_per_s': int(size / max(query_seconds, 1e-9)),
+        'tagged': int((scores >= SIMILARITY_THRESHOLD).sum()),
+    }
+
+    if size <= pairwise_limit:
+        start = time.perf_counter()
+        expected = pairwise_scores(suspicious, bot_contracts) >= SIMILARITY_THRESHOLD
+        result['pairwise_s'] = round(time.perf_counter() - start, 3)
+        found = scores >= SIMILARITY_THRESHOLD
+        result['recall'] = round(float((found & expected).sum() / max(expected.sum(), 1)), 3)
+
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--pairwise-limit', type=int, default=2000)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        print(run(size, pairwise_limit=args.pairwise_limit))
@@ -0,0 +1,78 @@
+'''
+Benchmark the cold start of the explore and analyze Cloud Functions: importing main.py
+in a fresh interpreter, like a new instance does before serving its first request.
+
+Every import runs under `python -X importtime`. Reports the cumulative import time of
+main, its slowest direct imports and the peak RSS of the interpreter, and checks that
+the dependencies main.py defers (google.cloud.bigquery, pandasql, pandas_gbq) stay off
+the startup path. benchmarks/run.py tracks the import time as the <stage>.startup stage.
+
+usage: python -m benchmarks.bench_startup [--repeat 3] [--top 8]
+'''
+import argparse
+import os
+import subprocess
+import sys
+
+from benchmarks.fakes import ROOT
+
+
+DEFERRED = ['google.cloud.bigquery', 'pandasql', 'pandas_gbq']
+
+IMPORT_MAIN = '''
+import resource, sys
+import main
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+print(' '.join(name for name in %r if name in sys.modules))
+''' % (DEFERRED,)
+
+
+'''
+Parse `-X importtime` output into (depth, module, cumulative seconds) rows.
+'''
+def parse_importtime(stderr):
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        rows.append((depth, name.strip(), int(cumulative) / 1e6))
+    return rows
+
+
+def import_profile(stage, repeat=3):
+    directory = os.path.join(ROOT, f'bot_attribution_{stage}')
+    env = {key: value for key, value in os.environ.items() if key != 'PYTHONPATH'}
+    profiles = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', IMPORT_MAIN], cwd=directory, env=env,
+                                capture_output=True, text=True, check=True)
+        rows = parse_importtime(result.stderr)
+        # main's own imports are the depth 1 rows after the previous top level import
+        end = next(i for i, (depth, name, _) in enumerate(rows) if depth == 0 and name == 'main')
+        start = max([i + 1 for i, (depth, _, _) in enumerate(rows[:end]) if depth == 0] or [0])
+        rss_kb, loaded = (result.stdout.splitlines() + [''])[:2]
+        profiles.append({
+            'import_s': round(rows[end][2], 3),
+            'peak_rss_mb': round(int(rss_kb) / 1024, 1),
+            'imports': sorted(((name, round(seconds, 3)) for depth, name, seconds in rows[start:end] if depth == 1),
+                              key=lambda item: -item[1]),
+            'deferred_loaded': loaded.split(),
+        })
+    # the fastest run has the least noise from the rest of the machine
+    return min(profiles, key=lambda profile: profile['import_s'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--top', type=int, default=8)
+    args = parser.parse_args()
+
+    for stage in ('explore', 'analyze'):
+        profile = import_profile(stage, args.repeat)
+        print(f"{stage}: import main {profile['import_s']}s, peak RSS {profile['peak_rss_mb']} MB")
+        for name, seconds in profile['imports'][:args.top]:
+            print(f'  {seconds:7.3f}s  {name}')
+        assert not profile['deferred_loaded'], f"{stage} imports {profile['deferred_loaded']} on startup"
@@ -0,0 +1,106 @@
+'''
+Check that the pushdown engine of bot_attribution_analyze tags the same contracts,
+signatures and callers as analyze() on explored synthetic transactions, and time both.
+
+The heuristic statements of pushdown.py run on an in-memory SQLite database holding the
+suspicious rows and the whitelist; the MERGE statements that follow them on BigQuery are
+shared with the local writer and left out. Byte code similarity and fingerprint clones only
+match locally, so they are turned off for the comparison.
+
+usage: python -m benchmarks.compare_analyze_engines [--transactions 100000] [--print-sql]
+'''
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.fakes import load_stage, transactions_client
+from benchmarks.synthetic import generate_smart_contracts, generate_transactions
+
+
+explore_main = load_stage('explore')
+analyze_main = load_stage('analyze')
+# importable once load_stage() put bot_attribution_analyze on sys.path
+import pushdown
+from fingerprints import FingerprintStore
+from writer import STAGING_COLUMNS, TABLES, staging_frame
+
+
+TAGGED_COLUMNS = {
+    'contracts': ['to_address_hash', 'tag', 'confidence_level'],
+    'signatures': ['to_address_hash', 'signature', 'invocations', 'tag', 'confidence_level'],
+    'callers': ['caller', 'to_address_hash', 'tag', 'confidence_level', 'bursts'],
+}
+
+
+def run_sqlite(tagged, smart_contracts_df):
+    connection = sqlite3.connect(':memory:')
+    for table, df in tagged.items():
+        df[TAGGED_COLUMNS[table]].astype({'tag': 'object'}).to_sql(table, connection, index=False)
+    smart_contracts_df[['address_hash']].to_sql('smart_contracts', connection, index=False)
+
+    statements = pushdown.heuristic_statements({table: table for table in (*tagged, 'smart_contracts')})
+    for statement in statements:
+        connection.execute(statement)
+    staging_df = pd.read_sql(f'select * from {pushdown.STAGING_TABLE}', connection)
+    connection.close()
+    return staging_df, statements
+
+
+def sorted_rows(staging_df, table):
+    keys = TABLES[table]['keys']
+    rows = staging_df[staging_df['table_name'] == table]
+    return rows[keys + ['confidence_level']].astype({key: 'object' for key in keys}) \
+        .sort_values(keys).reset_index(drop=True)
+
+
+def compare(transactions):
+    transactions_df = generate_transactions(transactions)
+    smart_contracts_df = generate_smart_contracts(transactions_df)
+    client = transactions_client(transactions_df, smart_contracts_df)
+
+    with mock.patch.object(explore_main, 'bqclient', client), \
+         mock.patch.object(analyze_main, 'bqclient', client), \
+         mock.patch.object(analyze_main, 'SIMILARITY_THRESHOLD', 2):
+        explored = explore_main.explore(transactions_df, engine='pandas')
+        # what get_tagged_data() reads: suspicious rows of contracts that are not creations
+        tagged = {table: df[(df['tag'] == 'suspicious') & df['to_address_hash'].notna()].reset_index(drop=True)
+                  for table, df in zip(TAGGED_COLUMNS, explored)}
+        with tempfile.TemporaryDirectory() as directory:
+            whitelist = analyze_main.get_whitelist(os.path.join(directory, 'smart_contracts.parquet'))
+
+        timings = {}
+        start = time.perf_counter()
+        # clones only match by fingerprint in the local engine, the pushdown matches by address
+        expected_df = staging_frame(dict(zip(TABLES, analyze_main.analyze(*(df.copy() for df in tagged.values()),
+                                                                          whitelist, FingerprintStore()))))
+        timings['local'] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    actual_df, statements = run_sqlite(tagged, smart_contracts_df)
+    timings['pushdown'] = round(time.perf_counter() - start, 3)
+
+    assert list(actual_df.columns) == STAGING_COLUMNS
+    for table in TABLES:
+        expected, actual = sorted_rows(expected_df, table), sorted_rows(actual_df, table)
+        print(f'{table}: {len(expected.index)} local, {len(actual.index)} pushdown')
+        pd.testing.assert_frame_equal(expected, actual, check_dtype=False, atol=1e-6, obj=table)
+        assert np.all(actual['confidence_level'] > 0), table
+    return timings, statements
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--print-sql', action='store_true')
+    args = parser.parse_args()
+
+    timings, statements = compare(args.transactions)
+    if args.print_sql:
+        print('\n'.join(statements))
+    print('engines match', timings)
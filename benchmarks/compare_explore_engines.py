@@ -0,0 +1,76 @@
+'''
+Check that the pandas engine of bot_attribution_explore produces the same contracts,
+signatures and callers as the original sqldf queries on a fixed fixture, and time both.
+
+usage: python -m benchmarks.compare_explore_engines [--transactions 5000]
+'''
+import argparse
+import time
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.fakes import load_stage
+
+
+explore_main = load_stage('explore')
+
+KEYS = {
+    'contracts': ['to_address_hash'],
+    'signatures': ['to_address_hash', 'signature'],
+    'callers': ['caller', 'to_address_hash'],
+}
+
+
+def fixture(transactions, seed=0):
+    rng = np.random.RandomState(seed)
+    addresses = np.array(['0x%040x' % i for i in range(300)])
+    transactions_df = pd.DataFrame({
+        'from_address_hash': rng.choice(addresses[:100], transactions),
+        'to_address_hash': rng.choice(addresses[100:200], transactions),
+        'input': ['0x%08x' % selector + 'ab' * 32 for selector in rng.randint(0, 20, transactions)],
+        'block_timestamp': pd.Timestamp('2022-07-01', tz='UTC')
+                           + pd.to_timedelta(rng.randint(0, 3 * 86400, transactions), unit='s'),
+        'created_contract_address_hash': None,
+    })
+    # contract creations have no to_address_hash
+    transactions_df.loc[:transactions // 100, 'to_address_hash'] = None
+
+    creations_df = pd.DataFrame({
+        'from_address_hash': rng.choice(addresses[200:], 50),
+        'created_contract_address_hash': rng.choice(addresses[100:], 50),
+        'block_timestamp': pd.Timestamp('2022-06-28', tz='UTC')
+                           + pd.to_timedelta(rng.randint(0, 7 * 86400, 50), unit='s'),
+    })
+    return transactions_df, creations_df
+
+
+def compare(transactions):
+    transactions_df, creations_df = fixture(transactions)
+    results, timings = {}, {}
+    with mock.patch.object(explore_main, 'get_contract_creations', return_value=creations_df):
+        for engine in ('sqldf', 'pandas'):
+            start = time.perf_counter()
+            results[engine] = explore_main.explore(transactions_df.copy(), engine=engine)
+            timings[engine] = round(time.perf_counter() - start, 3)
+
+    for position, (name, keys) in enumerate(KEYS.items()):
+        expected, actual = results['sqldf'][position], results['pandas'][position]
+        assert list(expected.columns) == list(actual.columns), name
+        # updated_at is stamped at run time
+        columns = [column for column in expected.columns if column != 'updated_at']
+        pd.testing.assert_frame_equal(expected[columns].sort_values(keys).reset_index(drop=True),
+                                      actual[columns].sort_values(keys).reset_index(drop=True),
+                                      check_dtype=False, obj=name)
+    # contracts nobody called are only reached by propagating over the creations
+    assert not results['sqldf'][0]['to_address_hash'].isin(transactions_df['to_address_hash']).all()
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=5000)
+    args = parser.parse_args()
+
+    print('engines match', compare(args.transactions))
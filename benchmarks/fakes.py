@@ -0,0 +1,144 @@
+'''
+Local stand-ins for the BigQuery client and pandas_gbq writes used by both stages.
+
+FakeBigQueryClient answers each query with the first route whose pattern appears in
+the SQL text. A route is either a DataFrame or a callable taking the SQL and returning
+one. Queries without a route (e.g. MERGE statements) return an empty result.
+'''
+import importlib.util
+import os
+import re
+import sys
+import time
+
+import pandas as pd
+import pyarrow as pa
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+class FakeRowIterator:
+    def __init__(self, df):
+        self._df = df
+        self.total_rows = len(df.index)
+
+    def to_dataframe(self, **kwargs):
+        return self._df.copy()
+
+    def to_arrow(self, **kwargs):
+        return pa.Table.from_pandas(self._df, preserve_index=False)
+
+    def to_arrow_iterable(self, max_chunksize=100000, **kwargs):
+        yield from self.to_arrow().to_batches(max_chunksize=max_chunksize)
+
+
+class FakeQueryJob:
+    def __init__(self, df, latency):
+        self._df = df
+        self._latency = latency
+        self.num_dml_affected_rows = len(df.index)
+        self.total_bytes_processed = int(df.memory_usage(deep=True).sum())
+
+    def result(self, timeout=None):
+        time.sleep(self._latency)
+        return FakeRowIterator(self._df)
+
+
+class FakeBigQueryClient:
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.routes = []
+        self.queries = []
+
+    def route(self, pattern, response):
+        self.routes.append((pattern, response))
+        return self
+
+    def query(self, query_string, job_config=None, **kwargs):
+        self.queries.append(query_string)
+        for pattern, response in self.routes:
+            if pattern in query_string:
+                df = response(query_string) if callable(response) else response
+                return FakeQueryJob(df, self.latency)
+        return FakeQueryJob(pd.DataFrame(), self.latency)
+
+
+class FakeWriter:
+    def __init__(self):
+        self.tables = {}
+
+    def to_gbq(self, df, table_id, project_id=None, **kwargs):
+        self.tables.setdefault(table_id, []).append(df.copy())
+
+
+'''
+Rows of df within the block_timestamp bounds of a query, e.g. a backfill window.
+'''
+def timestamp_window(df, query_string):
+    for operator, value in re.findall(r"block_timestamp ([<>]=?) TIMESTAMP\('([^']+)'\)", query_string):
+        bound = pd.Timestamp(value)
+        df = df[{'>=': df['block_timestamp'] >= bound, '>': df['block_timestamp'] > bound,
+                 '<': df['block_timestamp'] < bound, '<=': df['block_timestamp'] <= bound}[operator]]
+    return df
+
+
+'''
+Routes serving explore() and analyze() queries from synthetic transactions.
+'''
+def transactions_client(transactions_df, smart_contracts_df=None, tagged=None, latency=0):
+    creations_df = transactions_df.loc[transactions_df['created_contract_address_hash'].notna(),
+                                       ['from_address_hash', 'created_contract_address_hash', 'input',
+                                        'block_timestamp', 'block_number']]
+
+    def creations(query_string):
+        # explore reads the creators, analyze fingerprints the byte code created after a block
+        watermark = re.search(r'block_number > (-?\d+)', query_string)
+        if watermark:
+            df = timestamp_window(creations_df[creations_df['block_number'] > int(watermark.group(1))], query_string)
+            return df.rename(columns={'created_contract_address_hash': 'address_hash'})[
+                ['address_hash', 'input', 'block_number', 'block_timestamp']]
+        return timestamp_window(creations_df, query_string)[
+            ['from_address_hash', 'created_contract_address_hash', 'block_timestamp']]
+
+    def projected_transactions(query_string):
+        df = transactions_df[['from_address_hash', 'to_address_hash', 'input', 'block_timestamp', 'block_number']]
+        watermark = re.search(r'block_number > (-?\d+)', query_string)
+        if watermark:
+            df = df[df['block_number'] > int(watermark.group(1))]
+        df = timestamp_window(df, query_string)
+        return df.assign(input=df['input'].str.slice(0, 10)).rename(
+            columns={'input': 'signature'} if 'as signature' in query_string else {})
+
+    def smart_contracts(query_string):
+        last_id = re.search(r'id > (-?\d+)', query_string)
+        return smart_contracts_df[smart_contracts_df['id'] > int(last_id.group(1))] if last_id else smart_contracts_df
+
+    client = FakeBigQueryClient(latency)
+    client.route('created_contract_address_hash is not null', creations)
+    if smart_contracts_df is not None:
+        client.route('smart_contracts', smart_contracts)
+    for table, df in (tagged or {}).items():
+        client.route(f'1_attributions.{table}`', df)
+    client.route('1_raw.transactions', projected_transactions)
+    return client
+
+
+'''
+Import a stage's main.py (explore or analyze) under its own module name. main.py only
+creates its BigQuery client on first use, so patching `bqclient` keeps runs offline.
+'''
+def load_stage(stage):
+    name = f'bot_attribution_{stage}'
+    if name in sys.modules:
+        return sys.modules[name]
+
+    directory = os.path.join(ROOT, name)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+
+    spec = importlib.util.spec_from_file_location(name, os.path.join(directory, 'main.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    sys.modules[name] = module
+    return module
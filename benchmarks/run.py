@@ -0,0 +1,215 @@
+'''
+Benchmark suite for the explore and analyze stages on synthetic transactions, using the
+local BigQuery stand-ins from benchmarks.fakes.
+
+Reports wall time, rows/sec and peak RSS growth for every stage and size, and compares
+wall times with benchmarks/baseline.json so regressions in either main.py show up.
+The explore.startup and analyze.startup stages time importing main.py in a fresh
+interpreter, the cold start of a Cloud Function instance (see benchmarks/bench_startup.py).
+
+usage:
+    python -m benchmarks.run [--sizes 100000 1000000 10000000] [--stages explore.count ...]
+    python -m benchmarks.run --check        # exit 1 when a stage is slower than the baseline
+    python -m benchmarks.run --save-baseline
+'''
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from benchmarks.bench_startup import import_profile
+from benchmarks.fakes import FakeWriter, load_stage, transactions_client
+from benchmarks.synthetic import generate_smart_contracts, generate_transactions
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+SIZES = [100000, 1000000, 10000000]
+# the sqldf engine copies every frame through SQLite, only run it on small sizes
+SQLDF_LIMIT = 100000
+
+
+def current_rss():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class PeakMemory:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+
+    def _sample(self):
+        while not self._done.is_set():
+            self.peak = max(self.peak, current_rss())
+            self._done.wait(self.interval)
+
+    def __enter__(self):
+        self.start = current_rss()
+        self.peak = self.start
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+    @property
+    def delta_mb(self):
+        return round((self.peak - self.start) / 2 ** 20, 1)
+
+
+def measure(name, size, rows, func):
+    gc.collect()
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        result = func()
+        wall = time.perf_counter() - start
+
+    report = {
+        'stage': name,
+        'size': size,
+        'wall_s': round(wall, 3),
+        'rows_per_s': int(rows / max(wall, 1e-9)),
+        'peak_rss_mb': memory.delta_mb,
+    }
+    print(json.dumps(report))
+    return report, result
+
+
+def run_size(size, stages, seed=0):
+    explore = load_stage('explore')
+    analyze = load_stage('analyze')
+    # importable once load_stage() put bot_attribution_analyze on sys.path
+    from writer import LocalBackend
+
+    transactions_df = generate_transactions(size, seed=seed)
+    smart_contracts_df = generate_smart_contracts(transactions_df, seed=seed)
+    client = transactions_client(transactions_df, smart_contracts_df)
+    writer = FakeWriter()
+    rows = len(transactions_df.index)
+    reports = []
+
+    with mock.patch.object(explore, 'bqclient', client), \
+         mock.patch.object(analyze, 'bqclient', client), \
+         mock.patch('pandas_gbq.to_gbq', writer.to_gbq):
+
+        if 'explore.sqldf' in stages and size <= SQLDF_LIMIT:
+            reports.append(measure('explore.sqldf', size, rows,
+                                   lambda: explore.explore(transactions_df, engine='sqldf'))[0])
+
+        addresses = explore.AddressDictionary()
+        report, encoded_df = measure('explore.encode', size, rows,
+                                     lambda: explore.encode_transactions(transactions_df, addresses))
+        reports.append(report)
+
+        report, signature_counts_df = measure('explore.count', size, rows,
+                                              lambda: explore.count_signatures(encoded_df))
+        reports.append(report)
+
+        if 'explore.stream' in stages or 'explore.sketch' in stages:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'transactions.parquet')
+                transactions_df.to_parquet(path, row_group_size=100000)
+                reports.append(measure('explore.stream', size, rows,
+                                       lambda: explore.get_signature_counts(source=path))[0])
+                reports.append(measure('explore.sketch', size, rows,
+                                       lambda: explore.get_signature_counts(source=path,
+                                                                            sketch=explore.SignatureSketch()))[0])
+
+        report, burst_stats_df = measure('explore.rate', size, rows,
+                                         lambda: explore.transaction_burst_stats(encoded_df))
+        reports.append(report)
+
+        report, explored = measure('explore.tag', size, len(signature_counts_df.index),
+                                   lambda: explore.explore_signature_counts(signature_counts_df, burst_stats_df,
+                                                                            addresses))
+        reports.append(report)
+
+        if 'explore.write' in stages:
+            reports.append(measure('explore.write', size, sum(len(df.index) for df in explored),
+                                   lambda: [explore.write_df(df, table, schema) for df, table, schema in
+                                            zip(explored, ('contracts', 'signatures', 'callers'),
+                                                (explore.contracts_schema, explore.signatures_schema,
+                                                 explore.callers_schema))])[0])
+
+        if 'analyze' in stages or 'analyze.write' in stages:
+            # contract creations have no to_address_hash, which the byte code similarity cannot score
+            contracts_df, signatures_df, callers_df = [df[df['to_address_hash'].notna()] for df in explored]
+            with tempfile.TemporaryDirectory() as directory:
+                whitelist = analyze.get_whitelist(os.path.join(directory, 'smart_contracts.parquet'))
+                fingerprint_store = analyze.get_fingerprints(os.path.join(directory, 'fingerprints.parquet'))
+                report, analyzed = measure('analyze', size, sum(len(df.index) for df in explored),
+                                           lambda: analyze.analyze(contracts_df.copy(), signatures_df.copy(),
+                                                                   callers_df.copy(), whitelist, fingerprint_store))
+            reports.append(report)
+
+            if 'analyze.write' in stages:
+                reports.append(measure('analyze.write', size, sum(len(df.index) for df in analyzed),
+                                       lambda: analyze.write_df(*analyzed, backend=LocalBackend()))[0])
+
+    return [report for report in reports if report['stage'] in stages]
+
+
+'''
+Cold start of every stage's main.py in a fresh interpreter, which does not depend on the size.
+'''
+def startup_reports(stages):
+    reports = []
+    for name in ('explore', 'analyze'):
+        if f'{name}.startup' in stages:
+            profile = import_profile(name)
+            report = {'stage': f'{name}.startup', 'size': 0, 'wall_s': profile['import_s'], 'rows_per_s': 0,
+                      'peak_rss_mb': profile['peak_rss_mb']}
+            print(json.dumps(report))
+            reports.append(report)
+    return reports
+
+
+def check(reports, baseline, tolerance):
+    regressions = []
+    for report in reports:
+        key = f"{report['stage']}@{report['size']}"
+        if key in baseline and report['wall_s'] > baseline[key]['wall_s'] * (1 + tolerance) \
+                and report['wall_s'] - baseline[key]['wall_s'] > 0.05:
+            regressions.append(f"{key}: {report['wall_s']}s vs baseline {baseline[key]['wall_s']}s")
+    return regressions
+
+
+if __name__ == '__main__':
+    all_stages = ['explore.startup', 'analyze.startup', 'explore.sqldf', 'explore.encode', 'explore.count', 'explore.stream', 'explore.sketch', 'explore.rate', 'explore.tag', 'explore.write', 'analyze', 'analyze.write']
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--stages', nargs='+', default=all_stages, choices=all_stages)
+    parser.add_argument('--check', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.5)
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    reports = startup_reports(args.stages)
+    for size in args.sizes:
+        reports.extend(run_size(size, args.stages))
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    if args.save_baseline:
+        baseline.update({f"{report['stage']}@{report['size']}": report for report in reports})
+        with open(BASELINE, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.check:
+        regressions = check(reports, baseline, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        sys.exit(1 if regressions else 0)
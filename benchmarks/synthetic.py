@@ -0,0 +1,104 @@
+'''
+Synthetic Celo transactions shaped like 1_raw.transactions.
+
+The generator reproduces the skew the heuristics are built around:
+- a few heavy-hitter bot callers that fire at near-regular intervals and produce a
+  configurable share of all transactions,
+- human callers and contracts drawn from Zipf distributions,
+- contract families: one creator deploys several contracts whose creation bytecode
+  are near-duplicates of a family template.
+'''
+import numpy as np
+import pandas as pd
+
+
+START = pd.Timestamp('2022-07-01', tz='UTC')
+BLOCK_SECONDS = 5
+HEX = np.array(list('0123456789abcdef'))
+
+
+def addresses(rng, n):
+    return np.array(['0x' + ''.join(row) for row in HEX[rng.randint(0, 16, size=(n, 40))]], dtype=object)
+
+
+def zipf_choice(rng, n, size, exponent=1.2):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return rng.choice(n, size=size, p=weights / weights.sum())
+
+
+def bytecode(rng, template, mutations):
+    code = template.copy()
+    code[rng.randint(0, len(code), size=mutations)] = HEX[rng.randint(0, 16, size=mutations)]
+    return '0x' + ''.join(code)
+
+
+def generate_transactions(n, seed=0, days=3, bot_callers=50, bot_share=0.3, selectors_per_contract=8,
+                          families=20, contracts_per_family=10, bytecode_length=600, mutations=12):
+    rng = np.random.RandomState(seed)
+    seconds = days * 86400
+
+    callers = addresses(rng, max(1000, n // 50))
+    contracts = addresses(rng, max(200, n // 500))
+
+    # bots call a handful of contracts at a fixed period with some jitter
+    bot_rows = int(n * bot_share)
+    bot_ids = np.arange(bot_rows) % bot_callers
+    bot_period = seconds / max(1, bot_rows // bot_callers)
+    bot_offsets = (np.arange(bot_rows) // bot_callers) * bot_period + bot_ids \
+                  + rng.normal(0, bot_period * 0.02, bot_rows)
+    bot_contracts = rng.randint(0, min(20, len(contracts)), size=bot_callers)
+
+    human_rows = n - bot_rows
+    from_ids = np.concatenate([bot_ids, bot_callers + zipf_choice(rng, len(callers) - bot_callers, human_rows)])
+    to_ids = np.concatenate([bot_contracts[bot_ids], zipf_choice(rng, len(contracts), human_rows)])
+    offsets = np.concatenate([bot_offsets, rng.uniform(0, seconds, human_rows)]).clip(0, seconds - 1)
+
+    selector_ids = to_ids * selectors_per_contract + zipf_choice(rng, selectors_per_contract, n)
+    payload = '0' * 24 + 'ab' * 20
+    inputs = np.array(['0x%08x' % (selector * 2654435761 % 2 ** 32) + payload
+                       for selector in range(len(contracts) * selectors_per_contract)], dtype=object)
+
+    transactions_df = pd.DataFrame({
+        'from_address_hash': callers[from_ids],
+        'to_address_hash': contracts[to_ids],
+        'input': inputs[selector_ids],
+        'block_timestamp': START + pd.to_timedelta(offsets, unit='s'),
+        'created_contract_address_hash': None,
+    })
+
+    creations_df = generate_creations(rng, contracts, families, contracts_per_family,
+                                      bytecode_length, mutations, seconds)
+    transactions_df = pd.concat([transactions_df, creations_df], ignore_index=True)
+    transactions_df = transactions_df.sort_values('block_timestamp', kind='stable').reset_index(drop=True)
+    transactions_df['block_number'] = ((transactions_df['block_timestamp'] - START).dt.total_seconds()
+                                       // BLOCK_SECONDS).astype('int64')
+    return transactions_df
+
+
+def generate_creations(rng, contracts, families, contracts_per_family, bytecode_length, mutations, seconds):
+    creators = addresses(rng, families)
+    created = rng.choice(len(contracts), size=min(len(contracts), families * contracts_per_family), replace=False)
+    family_ids = np.arange(len(created)) % families
+    templates = HEX[rng.randint(0, 16, size=(families, bytecode_length))]
+
+    return pd.DataFrame({
+        'from_address_hash': creators[family_ids],
+        'to_address_hash': None,
+        'input': [bytecode(rng, templates[family], mutations) for family in family_ids],
+        'block_timestamp': START + pd.to_timedelta(rng.uniform(0, seconds, len(created)), unit='s'),
+        'created_contract_address_hash': contracts[created],
+    })
+
+
+'''
+Verified contracts standing in for 1_raw.smart_contracts.
+'''
+def generate_smart_contracts(transactions_df, share=0.05, seed=0):
+    rng = np.random.RandomState(seed)
+    contracts = transactions_df['to_address_hash'].dropna().unique()
+    verified = rng.choice(contracts, size=int(len(contracts) * share), replace=False)
+    return pd.DataFrame({
+        'id': np.arange(len(verified)),
+        'name': [f'contract_{i}' for i in range(len(verified))],
+        'address_hash': verified,
+    })
@@ -0,0 +1,29 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from metrics import stage
+
+
+# queries run server side, a few threads are enough to overlap their round trips
+MAX_CONCURRENT_QUERIES = int(os.environ.get('MAX_CONCURRENT_QUERIES', 4))
+
+'''
+Run one query and download its result as an analyze.fetch.<name> stage.
+'''
+def fetch_query(client, name, query_string):
+    with stage(f'analyze.fetch.{name}') as current:
+        return current.output(current.query_job(client.query(query_string))
+                                  .result().to_dataframe(create_bqstorage_client=True))
+
+'''
+Run independent queries concurrently, at most `max_workers` at a time, and return their
+results by name. The first failing query raises once the others finished.
+'''
+def fetch_all(client, queries, max_workers=MAX_CONCURRENT_QUERIES):
+    with stage('analyze.fetch_all') as current:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(queries)))) as pool:
+            futures = {name: pool.submit(fetch_query, client, name, query_string)
+                       for name, query_string in queries.items()}
+            frames = {name: future.result() for name, future in futures.items()}
+        current.output(list(frames.values()))
+
+    return frames
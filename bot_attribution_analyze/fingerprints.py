@@ -0,0 +1,151 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.fs as fs
+import pyarrow.parquet as pq
+
+
+# Parquet store of contract byte code fingerprints (local path or gs://), filled from contract creations.
+# like the whitelist cache it defaults to /tmp; a gs:// path keeps it across cold starts
+FINGERPRINT_STORE_PATH = os.environ.get('FINGERPRINT_STORE_PATH', '/tmp/fingerprints.parquet')
+# days of contract creations an empty store is filled with
+FINGERPRINT_WINDOW_DAYS = int(os.environ.get('FINGERPRINT_WINDOW_DAYS', 7))
+FINGERPRINT_COLUMNS = ['address_hash', 'code_hash', 'block_number', 'block_timestamp', 'bot']
+
+# creations are only ever added, so the store is refreshed with the blocks after its last one.
+# the block_timestamp bound, from the last stored creation, keeps partition pruning
+contract_creation_delta_query = """
+    select
+        created_contract_address_hash as address_hash,
+        input,
+        block_number,
+        block_timestamp
+    from `celo-testnet-production.1_raw.transactions`
+    where created_contract_address_hash is not null
+    and block_timestamp >= {since}
+    and block_number > {last_block}
+"""
+
+'''
+64 bit fingerprint of every byte code: the first 8 bytes of its MD5, as a signed integer so
+it stores as a plain Parquet int64. Byte code is the creation input, so clones deployed with
+other constructor arguments get other fingerprints.
+'''
+def code_hashes(bytecodes):
+    return np.fromiter((int.from_bytes(hashlib.md5(str(code).lower().encode()).digest()[:8], 'little', signed=True)
+                        for code in bytecodes), dtype=np.int64, count=len(bytecodes))
+
+'''
+Content addressed store of contract fingerprints: the code hash of every created contract,
+and whether the code hash belongs to a bot. Lookups are batch joins against a hashed pandas
+Index of the addresses, so hashes are only computed once per contract, when it is added.
+'''
+class FingerprintStore:
+    def __init__(self, fingerprints_df=None, path=None):
+        if fingerprints_df is None:
+            fingerprints_df = pd.DataFrame(columns=FINGERPRINT_COLUMNS)
+        self.fingerprints_df = (fingerprints_df[FINGERPRINT_COLUMNS]
+                                    .drop_duplicates('address_hash', keep='last')
+                                    .astype({'code_hash': 'int64', 'block_number': 'int64',
+                                             'block_timestamp': 'datetime64[us, UTC]', 'bot': 'bool'})
+                                    .reset_index(drop=True))
+        self.addresses = pd.Index(self.fingerprints_df['address_hash'])
+        self.path = path
+        self.changed = False
+
+    def __len__(self):
+        return len(self.fingerprints_df.index)
+
+    '''
+    Code hash of every address, <NA> for addresses whose creation is not in the store.
+    '''
+    def lookup(self, addresses):
+        positions = self.addresses.get_indexer(pd.Series(addresses, dtype=object))
+        hashes = pd.array(self.fingerprints_df['code_hash'].to_numpy()[np.maximum(positions, 0)]
+                          if len(self) else np.zeros(len(positions), dtype=np.int64), dtype='Int64')
+        hashes[positions < 0] = pd.NA
+        return hashes
+
+    '''
+    Label the code hashes of the given bot addresses, so their clones match on later runs too.
+    '''
+    def label_bots(self, addresses):
+        hashes = self.lookup(addresses).dropna()
+        labelled = self.fingerprints_df['code_hash'].isin(hashes) & ~self.fingerprints_df['bot']
+        if labelled.any():
+            self.fingerprints_df.loc[labelled, 'bot'] = True
+            self.changed = True
+            print(f'labelled {int(labelled.sum())} contracts with {len(pd.unique(hashes))} bot fingerprints')
+
+    '''
+    Whether the byte code of every address is an exact clone of a bot's.
+    '''
+    def bot_clones(self, addresses):
+        bot_hashes = pd.Index(self.fingerprints_df.loc[self.fingerprints_df['bot'], 'code_hash'].unique())
+        hashes = self.lookup(addresses)
+        return np.asarray(pd.Series(hashes).isin(bot_hashes) & pd.Series(hashes).notna())
+
+    '''
+    Persist the store when labels changed since it was read.
+    '''
+    def save(self, path=None):
+        path = path or self.path
+        if self.changed and path:
+            write_store(self.fingerprints_df, path)
+            self.changed = False
+
+def _filesystem(path):
+    if '://' in path:
+        return fs.FileSystem.from_uri(path)
+    return fs.LocalFileSystem(), os.path.abspath(path)
+
+def read_store(path=FINGERPRINT_STORE_PATH):
+    filesystem, path = _filesystem(path)
+    if filesystem.get_file_info(path).type != fs.FileType.File:
+        return pd.DataFrame(columns=FINGERPRINT_COLUMNS)
+    return pq.read_table(path, columns=FINGERPRINT_COLUMNS, filesystem=filesystem,
+                         memory_map=isinstance(filesystem, fs.LocalFileSystem)).to_pandas()
+
+def write_store(fingerprints_df, path):
+    filesystem, path = _filesystem(path)
+    pq.write_table(pa.Table.from_pandas(fingerprints_df, preserve_index=False), path, filesystem=filesystem)
+
+'''
+Query for the contract creations after the stored ones, or of the last FINGERPRINT_WINDOW_DAYS
+for an empty store. Creations of the last stored block_timestamp are read again and only
+kept past the last stored block.
+'''
+def delta_query(store_df):
+    if store_df.empty:
+        since = f"TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL -{FINGERPRINT_WINDOW_DAYS} DAY)"
+        return contract_creation_delta_query.format(since=since, last_block=-1)
+
+    last_seen = pd.Timestamp(store_df['block_timestamp'].max()).tz_convert('UTC')
+    return contract_creation_delta_query.format(since=f"TIMESTAMP('{last_seen:%Y-%m-%d %H:%M:%S.%f+00}')",
+                                                last_block=int(store_df['block_number'].max()))
+
+'''
+Fingerprint the fetched creations, append them to the store, persist it when it grew, and
+return the FingerprintStore. New clones of labelled code hashes are labelled as well.
+'''
+def update_store(store_df, delta_df, path=FINGERPRINT_STORE_PATH):
+    if not delta_df.empty:
+        bot_hashes = store_df.loc[store_df['bot'].astype(bool), 'code_hash']
+        hashes = code_hashes(delta_df['input'].to_numpy())
+        delta_df = pd.DataFrame({
+            'address_hash': delta_df['address_hash'].to_numpy(),
+            'code_hash': hashes,
+            'block_number': delta_df['block_number'].to_numpy(),
+            'block_timestamp': pd.to_datetime(delta_df['block_timestamp'], utc=True).array,
+            'bot': np.isin(hashes, bot_hashes.to_numpy(dtype=np.int64)),
+        })
+        store = FingerprintStore(pd.concat([store_df, delta_df], ignore_index=True) if not store_df.empty else delta_df)
+        write_store(store.fingerprints_df, path)
+        print(f'fingerprinted {len(delta_df.index)} new contracts, {len(store)} in {path}')
+        store.path = path
+        return store
+
+    return FingerprintStore(store_df, path)
@@ -0,0 +1,104 @@
+'''
+Sparse graph propagation of tags, kept identical in bot_attribution_explore and bot_attribution_analyze.
+
+Nodes are addresses and signatures, numbered with dense integer ids per kind; edges are
+creations, calls or signatures with a weight. Tags start at seed nodes with a confidence
+and travel along the edges, losing confidence by the edge weight on every hop, up to a
+maximum depth. Every hop is one vectorized pass over a CSR adjacency of incoming edges.
+'''
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# hops a tag travels from its seeds, e.g. 2 reaches the other contracts of a contract's creator
+GRAPH_DEPTH = int(os.environ.get('GRAPH_DEPTH', 2))
+# confidence kept per hop along edges that do not carry their own weight
+GRAPH_DECAY = float(os.environ.get('GRAPH_DECAY', 0.8))
+
+class PropagationGraph:
+    def __init__(self, decay=GRAPH_DECAY):
+        self.decay = decay
+        self.edges = []
+        self.nodes = {}
+        self.offsets = {}
+        self.confidence = np.zeros(0)
+
+    '''
+    Add edges from `sources` (nodes of `source_kind`) to `targets` (nodes of `target_kind`),
+    all with one weight or one weight per edge. Edges with a null end are left out.
+    '''
+    def add_edges(self, source_kind, sources, target_kind, targets, weight=None, both_ways=False):
+        sources, targets = pd.Series(sources).reset_index(drop=True), pd.Series(targets).reset_index(drop=True)
+        weights = pd.Series(np.broadcast_to(np.asarray(self.decay if weight is None else weight, dtype=np.float64),
+                                            (len(sources.index),)))
+        valid = (sources.notna() & targets.notna()).to_numpy()
+        self.edges.append((source_kind, sources[valid], target_kind, targets[valid], weights[valid].to_numpy()))
+        if both_ways:
+            self.edges.append((target_kind, targets[valid], source_kind, sources[valid], weights[valid].to_numpy()))
+
+    def _number(self, seeds):
+        values = {}
+        for source_kind, sources, target_kind, targets, _ in self.edges:
+            values.setdefault(source_kind, []).append(sources)
+            values.setdefault(target_kind, []).append(targets)
+        for kind, seed_values, _ in seeds:
+            values.setdefault(kind, []).append(seed_values.dropna())
+
+        self.nodes, self.offsets, count = {}, {}, 0
+        for kind, kind_values in values.items():
+            self.nodes[kind] = pd.Index(pd.concat(kind_values, ignore_index=True).unique())
+            self.offsets[kind] = count
+            count += len(self.nodes[kind])
+        return count
+
+    def ids(self, kind, values):
+        if kind not in self.nodes:
+            return np.full(len(values), -1)
+        positions = self.nodes[kind].get_indexer(values)
+        return np.where(positions >= 0, positions + self.offsets[kind], -1)
+
+    '''
+    Propagate the confidence of the seeds, given as (kind, values, confidence) tuples, for
+    `depth` hops. A node keeps the highest confidence of any path reaching it.
+    '''
+    def propagate(self, seeds, depth=GRAPH_DEPTH):
+        seeds = [(kind, pd.Series(values).reset_index(drop=True), confidence) for kind, values, confidence in seeds]
+        count = self._number(seeds)
+
+        sources = np.concatenate([self.ids(kind, values) for kind, values, _, _, _ in self.edges] or [np.zeros(0, int)])
+        targets = np.concatenate([self.ids(kind, values) for _, _, kind, values, _ in self.edges] or [np.zeros(0, int)])
+        weights = np.concatenate([weights for _, _, _, _, weights in self.edges] or [np.zeros(0)])
+        # CSR over incoming edges: the edges into node i are order[indptr[i]:indptr[i + 1]]
+        order = np.argsort(targets, kind='stable')
+        indptr = np.searchsorted(targets[order], np.arange(count + 1))
+        sources, weights = sources[order], weights[order]
+        starts, incoming = indptr[:-1], indptr[1:] > indptr[:-1]
+
+        self.confidence = np.zeros(count)
+        for kind, values, confidence in seeds:
+            ids = self.ids(kind, values)
+            np.maximum.at(self.confidence, ids[ids >= 0],
+                          np.broadcast_to(np.asarray(confidence, dtype=np.float64), (len(ids),))[ids >= 0])
+
+        hops = 0
+        while hops < depth and len(sources):
+            reached = np.zeros(count)
+            reached[incoming] = np.maximum.reduceat(self.confidence[sources] * weights, starts[incoming])
+            confidence = np.maximum(self.confidence, reached)
+            hops += 1
+            if np.array_equal(confidence, self.confidence):
+                break
+            self.confidence = confidence
+
+        print(f'propagated {len(seeds)} seed sets over {len(sources)} edges to '
+              f'{int((self.confidence > 0).sum())} of {count} nodes in {hops} hops')
+        return self
+
+    '''
+    Propagated confidence of the given nodes, 0 for nodes the tags never reached.
+    '''
+    def node_confidence(self, kind, values):
+        ids = self.ids(kind, pd.Series(values).reset_index(drop=True))
+        return np.where(ids >= 0, self.confidence[np.maximum(ids, 0)] if len(self.confidence) else 0, 0)
@@ -1,187 +1,210 @@
-from google.cloud import bigquery
+import os
 import pandas as pd
-import pandas_gbq
-from pandasql import sqldf
-import hashlib
-import random
-import datetime
-import pytz
-from difflib import SequenceMatcher
-
-bqclient = bigquery.Client()
-def analyze(contracts_df, signatures_df, callers_df):
-    '''
-    Tag known bot. Acts as a 'seed' for the heuristic
-    '''
-    known_bots_query = """
-        select
-            *
-        from signatures_df
-        order by invocations desc
-        limit 1000
-    """
-    known_bots_df = sqldf(known_bots_query)
-
-    '''
-    All signatures that belong to a smart contract that was classified as bot 
-    confidence = 1
-    '''
-    bot_signature_query = """
-        select distinct
-            to_address_hash,
-            signature,
-            invocations,
-            'bot' as tag,
-            '1' as confidence_level
-        from signatures_df 
-        where to_address_hash in {}
-    """.format(tuple(known_bots_df['to_address_hash'].to_list()))
-
-    bot_signature_df = sqldf(bot_signature_query)
-    
-    signatures_df = signatures_df[~signatures_df.signature.isin(bot_signature_df.signature)]
-
-    bot_signature_df['confidence_level'] = bot_signature_df['confidence_level'].astype(float)
-    bot_signature_df['tags'] = bot_signature_df[['tag', 'confidence_level']].apply(tuple, axis=1)
-    bot_signature_df['tags'] = bot_signature_df['tags'].astype(str)
-    '''
-    If a signature matches one of the known bot signatures confidence = 0.6
-    '''
-    signature_match_query = """
-        select distinct
-            b.signature,
-            b.invocations,
-            'bot' as tag,
-            '0.6' as confidence_level
-        from signatures_df s
-        join bot_signature_df b
-        on s.signature = b.signature
-        where b.confidence_level >= 0.9
-    """
-
-    signature_match_df = sqldf(signature_match_query)
-    signature_match_df['confidence_level'] = signature_match_df['confidence_level'].astype(float)
-    signature_match_df['tags'] = signature_match_df[['tag', 'confidence_level']].apply(tuple, axis=1)
-    signature_match_df['tags'] = signature_match_df['tags'].astype(str)
-    
-    bot_signature_df = pd.concat([bot_signature_df, signature_match_df])
-
-    '''
-    If an MD5 hash of the byte code of a suspicious smart contract equals 
-    the hash of a smart contract that was classified as a bot before, 
-    confidence = 0.95
-    '''
-    contracts_df['to_address_md5'] = contracts_df['to_address_hash']\
-                            .apply(lambda x: hashlib.md5(x.encode()).hexdigest())
-    
-    known_bots_df['to_address_md5'] = known_bots_df['to_address_hash']\
-                            .apply(lambda x: hashlib.md5(x.encode()).hexdigest())
-
-    bot_contract_query = """
-        select 
-            to_address_hash,
-            'bot' as tag,
-            '0.95' as confidence_level,
-            block_timestamp,
-            updated_at
-        from contracts_df where to_address_md5 in {}
-    """.format(tuple(known_bots_df['to_address_md5']))
-    bot_contract_df = sqldf(bot_contract_query)
-
-    bot_contract_df['confidence_level'] = bot_contract_df['confidence_level'].astype(float)
-    bot_contract_df['tags'] = bot_contract_df[['tag', 'confidence_level']].apply(tuple, axis=1)
-    bot_contract_df['tags'] = bot_contract_df['tags'].astype(str) 
-
-    '''
-    If the byte code of a suspicious smart contract is similar to the byte 
-    code of a smart contract that was classified as a bot before
-    (with 60% similarity and higher) confidence = 0.7
-    '''
-    suspicious_contracts_query = """
-        select 
-            *
-        from contracts_df
-        where tags = "('suspicious', '1')"
-    """
-    suspicious_contracts_df = sqldf(suspicious_contracts_query)
-
-    bot_contract_list = list(bot_contract_df['to_address_hash'].drop_duplicates())
-    
-    for index, row in contracts_df.iterrows():
-        score = 0 
-        for bot_contract in bot_contract_list:            
-            best_match = round(SequenceMatcher(None, row['to_address_hash'], bot_contract).ratio(), 2)
-            score = max(score, best_match)            
-        if score > 0.6:
-            suspicious_contracts_df.loc[index, 'tags'] = f"('bot', '0.7')"
-    
-    suspicious_contracts_df = suspicious_contracts_df.drop_duplicates()
-    bot_contract_df = pd.concat([bot_contract_df, suspicious_contracts_df[suspicious_contracts_df['tags']
-                                                                                   .str.contains("bot")]])
-
-    '''
-    Mark all callers of the bot smart contract as bots with confidence 1 
-    if the number of calls exceeds a certain threshold, 
-    if not confidence = 0.6.
-    '''
-    callers_df = callers_df.drop_duplicates(subset=['caller', 'to_address_hash', 'tags'])
-    signatures_df = signatures_df.drop_duplicates()
-
-    bot_caller_query = """
-        select 
-            caller,
-            c.to_address_hash,
-            'bot' as tag,
-            case when s.invocations > 200 then '1' else '0.6' end as confidence_level 
-        from callers_df c
-        left join signatures_df s
-        on s.to_address_hash = c.to_address_hash
-        where c.to_address_hash in {}
-    """.format(tuple(known_bots_df['to_address_hash']))
-    bot_caller_df = sqldf(bot_caller_query)
-    bot_caller_df['confidence_level'] = bot_caller_df['confidence_level'].astype(float)    
-    bot_caller_df['tags'] = bot_caller_df[['tag', 'confidence_level']].apply(tuple, axis=1)
-    bot_caller_df['tags'] = bot_caller_df['tags'].astype(str)
-
-    '''
-    Inhumane frequency - 5 txs in 1 minute
-    confidence_level = 0.7
-    '''
-    transaction_query_string = """
-        with invocation_table as 
-            (select 
-                to_address_hash, 
-                from_address_hash,
-                SUBSTR(`input`, 0, 10) as signature,
-                COUNT(1) as invocations,
-                datetime_trunc(block_timestamp, MINUTE) as block_timestamp_minute
-            from `celo-testnet-production.1_raw.transactions`
-            where block_timestamp > TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL -7 DAY)
-            group by 1, 2, 3, 5)
-        select *
-        from invocation_table
-        where invocations > 5
-    """
-
-    transaction_df = (bqclient.query(transaction_query_string)
-                    .result().to_dataframe(create_bqstorage_client=True))
-
-    match_caller_query = """
-        select
-            b.caller,
-            b.to_address_hash,
-            'bot' as tag,
-            '0.7' as confidence_level
-        from bot_caller_df b
-        left join transaction_df t
-        on b.to_address_hash = t.from_address_hash
-        where tags = "('suspicious', '1')"
-    """
-    match_caller_df = sqldf(match_caller_query)
-
-    if not match_caller_df.empty:
-        bot_caller_df = pd.concat([bot_caller_df, match_caller_df])
-    
+import numpy as np
+from similarity import SimilarityIndex, SIMILARITY_THRESHOLD
+from tagging import tag_columns, read_tags, most_confident
+from writer import BigQueryBackend, write_results
+from fetch import fetch_all, fetch_query, MAX_CONCURRENT_QUERIES
+from whitelist import WHITELIST_CACHE_PATH, read_cache, delta_query, update_cache
+import fingerprints
+from features import FeatureStore
+from regularity import regularity_scores
+from metrics import stage, instrument, begin_run, write_report
+from graph import PropagationGraph
+from pushdown import run_pushdown
+from query_cache import QUERY_CACHE, cached_client
+from checkpoint import Checkpoints
+from pipeline import Pipeline
+
+# 'local' fetches the tagged rows and runs analyze() here, 'pushdown' runs its heuristics as
+# one BigQuery script (see pushdown.py), leaving out byte code similarity and timing regularity
+ANALYZE_ENGINE = os.environ.get('ANALYZE_ENGINE', 'local')
+
+# created by get_client() on first use and kept across warm invocations
+bqclient = None
+
+'''
+the BigQuery client, created on first use so that importing main stays cheap on cold starts.
+with QUERY_CACHE_DIR set, SELECTs are read through query_cache.QUERY_CACHE
+'''
+def get_client():
+    global bqclient
+    if bqclient is None:
+        from google.cloud import bigquery
+        bqclient = bigquery.Client()
+    return cached_client(bqclient)
+
+'''
+the smart contract whitelist, only fetching the contracts verified since the cached ones
+'''
+def get_whitelist(path=WHITELIST_CACHE_PATH):
+    cache_df = read_cache(path)
+    delta_df = fetch_query(get_client(), 'smart_contracts', delta_query(cache_df))
+    with stage('analyze.update_whitelist', delta_df):
+        return update_cache(cache_df, delta_df, path)
+
+'''
+the byte code fingerprint store, only fingerprinting the contracts created since the stored ones
+'''
+def get_fingerprints(path=fingerprints.FINGERPRINT_STORE_PATH):
+    store_df = fingerprints.read_store(path)
+    delta_df = fetch_query(get_client(), 'creations', fingerprints.delta_query(store_df))
+    with stage('analyze.update_fingerprints', delta_df):
+        return fingerprints.update_store(store_df, delta_df, path)
+
+'''
+analyze as a stage DAG: the known bots seed the propagation, the byte code matches, the burst
+callers and the regular callers, which run next to each other and next to the whitelist,
+fingerprint and feature store fetches when analyze() is not given them
+'''
+analyze_pipeline = Pipeline('analyze')
+ANALYZED = ['bot_contracts', 'bot_signatures', 'bot_callers']
+
+'''
+Tag known bot. Acts as a 'seed' for the heuristic
+the 1000 most invoked signatures, ordered like the pushdown script orders them
+'''
+@analyze_pipeline.stage(outputs=['known_bots'])
+def known_bots(signatures):
+    return (signatures.sort_values(['invocations', 'to_address_hash', 'signature'],
+                                   ascending=[False, True, True], kind='stable')
+                      .head(1000)
+                      .reset_index(drop=True))
+
+'''
+Propagate from the known bots over the signatures and callers of every contract:
+all signatures that belong to a smart contract that was classified as bot, confidence = 1
+the signatures of a contract sharing a known bot signature, confidence = 0.6. common
+selectors (transfer, approve) are shared by most contracts, so suspicion stops there and
+never reaches the callers of those contracts
+all callers of a bot smart contract are bots with confidence 1
+if the number of calls exceeds a certain threshold, if not confidence = 0.6
+each times the confidence of the contract, up to GRAPH_DEPTH hops from the known bots
+'''
+@analyze_pipeline.stage(outputs=['propagated_signatures', 'propagated_callers'])
+def propagate(signatures, callers, known_bots):
+    callers_df = callers.drop_duplicates(subset=['caller', 'to_address_hash', 'tag', 'confidence_level'])
+    signatures_df = signatures.drop_duplicates()
+
+    invocations = signatures_df.groupby('to_address_hash')['invocations'].max()
+    call_weight = np.where(callers_df['to_address_hash'].map(invocations).fillna(0).to_numpy() > 200, 1, 0.6)
+
+    graph = PropagationGraph()
+    graph.add_edges('address', signatures_df['to_address_hash'], 'signature', signatures_df['signature'], weight=1)
+    # contracts reached by a shared signature are nodes of their own kind, without edges out
+    graph.add_edges('signature', signatures_df['signature'], 'signature_match', signatures_df['to_address_hash'],
+                    weight=0.6)
+    graph.add_edges('address', callers_df['to_address_hash'], 'address', callers_df['caller'], weight=call_weight)
+    graph.propagate([('address', known_bots['to_address_hash'], 1)])
+
+    signature_confidence = np.maximum(graph.node_confidence('address', signatures_df['to_address_hash']),
+                                      graph.node_confidence('signature_match', signatures_df['to_address_hash']))
+    bot_signature_df = signatures_df.loc[signature_confidence > 0, ['to_address_hash', 'signature', 'invocations']]
+    bot_signature_df = tag_columns(bot_signature_df, 'bot', signature_confidence[signature_confidence > 0])
+    bot_signature_df = bot_signature_df.drop_duplicates(subset=['to_address_hash', 'signature', 'invocations'])
+
+    caller_confidence = graph.node_confidence('address', callers_df['to_address_hash']) * call_weight
+    bot_caller_df = callers_df.loc[caller_confidence > 0, ['caller', 'to_address_hash']]
+    bot_caller_df = tag_columns(bot_caller_df, 'bot', caller_confidence[caller_confidence > 0])
+    return bot_signature_df, bot_caller_df
+
+@analyze_pipeline.stage('get_fingerprints', outputs=['fingerprint_store'], measure=False)
+def fetch_fingerprints():
+    return get_fingerprints()
+
+'''
+If an MD5 hash of the byte code of a suspicious smart contract equals 
+the hash of a smart contract that was classified as a bot before, 
+confidence = 0.95
+the known bots themselves match, contracts created before the fingerprint store was filled
+only match by address
+'''
+@analyze_pipeline.stage(outputs=['matched_contracts'])
+def bot_contracts(contracts, known_bots, fingerprint_store):
+    fingerprint_store.label_bots(known_bots['to_address_hash'])
+    fingerprint_store.save()
+    matches = (contracts['to_address_hash'].isin(known_bots['to_address_hash'])
+               | fingerprint_store.bot_clones(contracts['to_address_hash']))
+    return tag_columns(contracts.loc[matches, ['to_address_hash', 'block_timestamp', 'updated_at']], 'bot', 0.95)
+
+'''
+If the byte code of a suspicious smart contract is similar to the byte 
+code of a smart contract that was classified as a bot before
+(with 60% similarity and higher) confidence = 0.7
+'''
+@analyze_pipeline.stage(outputs=['similar_contracts'])
+def similar_contracts(contracts, matched_contracts):
+    suspicious_contracts_df = contracts[(contracts['tag'] == 'suspicious')
+                                        & (contracts['confidence_level'] == 1)].reset_index(drop=True)
+
+    bot_contract_index = SimilarityIndex()
+    bot_contract_index.add(matched_contracts['to_address_hash'].drop_duplicates())
+
+    similarity = bot_contract_index.best_scores(suspicious_contracts_df['to_address_hash'])
+    return tag_columns(suspicious_contracts_df[similarity >= SIMILARITY_THRESHOLD], 'bot', 0.7).drop_duplicates()
+
+'''
+Inhumane frequency - more than 5 txs to one contract within any minute
+explore counts these bursts with a sliding window over the transactions it already reads,
+rows written before the burst columns existed have no bursts
+confidence_level = 0.7
+'''
+@analyze_pipeline.stage(outputs=['burst_callers'])
+def burst_callers(callers):
+    if 'bursts' not in callers:
+        return None
+    bursts_df = callers.groupby(['caller', 'to_address_hash'])['bursts'].max().reset_index()
+    return tag_columns(bursts_df[bursts_df['bursts'] > 0][['caller', 'to_address_hash']], 'bot', 0.7)
+
+@analyze_pipeline.stage('get_feature_store', outputs=['feature_store'], measure=False)
+def fetch_feature_store():
+    return FeatureStore()
+
+'''
+the stored behaviour of every suspicious caller, read in bulk from the feature store explore
+keeps up to date, instead of counting their transactions again. None without FEATURE_STORE_DIR
+'''
+@analyze_pipeline.stage(outputs=['caller_features'])
+def caller_features(callers, feature_store):
+    if not feature_store.enabled:
+        return None
+    return feature_store.lookup(callers['caller'].drop_duplicates())
+
+'''
+Machine regular timing - the gaps between the transactions of a caller barely vary, repeat the
+gap before them, or span the same number of blocks (see regularity.py). the block position
+signal is the coefficient of variation of the block gaps, not the index within a block.
+catches low volume scripts the propagation from the most invoked contracts misses
+confidence_level = 0.6 with two of these signals, 0.8 with all three
+opt in with FEATURE_STORE_DIR: the fetched callers only keep the last timestamp of each run,
+not the transactions the gaps are taken from, so without the store this tags nothing
+'''
+@analyze_pipeline.stage(outputs=['regular_callers'])
+def regular_callers(callers, caller_features):
+    if caller_features is None:
+        return None
+    scores = regularity_scores(caller_features)
+    scores = scores[scores['confidence_level'].notna()]
+    regular_df = callers[['caller', 'to_address_hash']].drop_duplicates().merge(
+        scores[['address', 'confidence_level']].rename(columns={'address': 'caller'}), on='caller')
+    return tag_columns(regular_df[['caller', 'to_address_hash']], 'bot', regular_df['confidence_level'].to_numpy())
+
+@analyze_pipeline.stage('get_whitelist', outputs=['whitelist'], measure=False)
+def fetch_whitelist():
+    return get_whitelist()
+
+'''
+whitelist join all the dataframes we have against this df/table, if match then remove
+'''
+@analyze_pipeline.stage('whitelist', outputs=['listed_contracts', 'listed_signatures', 'listed_callers'])
+def remove_whitelisted(matched_contracts, similar_contracts, propagated_signatures, propagated_callers,
+                       burst_callers, regular_callers, whitelist):
+    bot_contract_df = pd.concat([matched_contracts, similar_contracts])
+    bot_signature_df = propagated_signatures
+    bot_caller_df = propagated_callers
+    for heuristic_df in (burst_callers, regular_callers):
+        if heuristic_df is not None and not heuristic_df.empty:
+            bot_caller_df = pd.concat([bot_caller_df, heuristic_df])
 
     print(f'bot_contract_df: {len(bot_contract_df.index)} records')
     
@@ -189,154 +212,125 @@ def analyze(contracts_df, signatures_df, callers_df):
 
     print(f'bot_caller_df: {len(bot_caller_df.index)} records')
 
-    '''
-    whitelist join all the dataframes we have against this df/table, if match then remove
-    '''
-    smart_contract_query = """
-        select distinct
-            id,
-            name,
-            address_hash
-        from celo-testnet-production.1_raw.smart_contracts
-    """
-    smart_contract_df = (bqclient.query(smart_contract_query)
-                    .result().to_dataframe(create_bqstorage_client=True))
-
-    bot_contract_df = bot_contract_df[~bot_contract_df.to_address_hash.isin(smart_contract_df.address_hash)]
-    bot_signature_df = bot_signature_df[~bot_signature_df.to_address_hash.isin(smart_contract_df.address_hash)]    
-    bot_caller_df = bot_caller_df[~bot_caller_df.to_address_hash.isin(smart_contract_df.address_hash)]
-    
+    return (bot_contract_df[~whitelist.contains(bot_contract_df.to_address_hash)],
+            bot_signature_df[~whitelist.contains(bot_signature_df.to_address_hash)],
+            bot_caller_df[~whitelist.contains(bot_caller_df.to_address_hash)])
+
+@analyze_pipeline.stage('most_confident', outputs=ANALYZED)
+def keep_most_confident(listed_contracts, listed_signatures, listed_callers):
+    bot_contract_df = listed_contracts.copy()
     bot_contract_df.insert(0, 'timestamp', pd.to_datetime('now').replace(microsecond=0))
-    bot_contract_df = bot_contract_df.drop_duplicates(subset=['to_address_hash'])
+    bot_contract_df = most_confident(bot_contract_df)
     
-    bot_signature_df = bot_signature_df.fillna(0)
+    bot_signature_df = listed_signatures.fillna(0)
     bot_signature_df['invocations'] = bot_signature_df['invocations'].astype(int)
     bot_signature_df.insert(0, 'timestamp', pd.to_datetime('now').replace(microsecond=0))
-    bot_signature_df = bot_signature_df.drop_duplicates(subset=['to_address_hash'])
+    bot_signature_df = most_confident(bot_signature_df, ['signature', 'invocations'])
     
+    bot_caller_df = listed_callers.copy()
     bot_caller_df.insert(0, 'timestamp', pd.to_datetime('now').replace(microsecond=0))
-    bot_caller_df = bot_caller_df.drop_duplicates(subset=['to_address_hash'])
+    bot_caller_df = most_confident(bot_caller_df, ['caller'])
 
     return bot_contract_df, bot_signature_df, bot_caller_df
 
 '''
-get data generated from explore stage
-'''
-def get_tagged_data():
-    contracts_query = """
-    select *
-    from `celo-testnet-production.1_attributions.contracts`
-    where tags like '%suspicious%' 
-    """
-    contracts_df = (bqclient.query(contracts_query)
-                    .result().to_dataframe(create_bqstorage_client=True))
-
-    signatures_query = """
-    select *
-    from `celo-testnet-production.1_attributions.signatures`
-    where tags like '%suspicious%'
-    """
-    signatures_df = (bqclient.query(signatures_query)
-                    .result().to_dataframe(create_bqstorage_client=True))
-    
-    callers_query = """
-    select *
-    from `celo-testnet-production.1_attributions.callers`
-    where tags like '%suspicious%'
-    """
-    callers_df = (bqclient.query(callers_query)
-                    .result().to_dataframe(create_bqstorage_client=True))
-
-    return contracts_df, signatures_df, callers_df
-
-def write_df(input_df, table):
-    project = 'celo-testnet-production'
-    dataset = '1_attributions'
-    temp_table = write_temp_table(input_df, project, dataset, table)
-
-    query = ""
-    if table == 'callers':
-        query = f"""
-            merge into `{project}.{dataset}.{table}` as t
-            using `{project}.{temp_table}` as s
-            on t.caller = s.caller
-            and t.to_address_hash = s.to_address_hash
-            and t.caller = s.caller
-            when matched then
-                update set tags = s.tags, updated_at = CURRENT_TIMESTAMP()
-            when not matched then
-                insert (caller, to_address_hash, tags)
-                values (caller, to_address_hash, tags)
-        """
-    elif table == 'signatures':
-        query = f"""
-            merge into `{project}.{dataset}.{table}` as t
-            using `{project}.{temp_table}` as s
-            on t.signature = s.signature
-            and t.to_address_hash = s.to_address_hash
-            when matched then
-                update set tags = s.tags, updated_at = CURRENT_TIMESTAMP()
-            when not matched then
-                insert (to_address_hash, signature, invocations, tags)
-                values (to_address_hash, signature, invocations, tags)
-        """
-    elif table == 'contracts':
-        query = f"""
-            merge into `{project}.{dataset}.{table}` as t
-            using `{project}.{temp_table}` as s
-            on t.to_address_hash = s.to_address_hash
-            when matched then
-                update set tags = s.tags, updated_at = CURRENT_TIMESTAMP()
-            when not matched then
-                insert (to_address_hash, tags)
-                values (to_address_hash, tags)
-        """
-    print(query)
-    query_job = bqclient.query(query)
-
-    # Wait for query job to finish.
-    query_job.result()
-    print(f"DML query modified {query_job.num_dml_affected_rows} rows.")
-
-def write_temp_table(input_df, project, dataset, table):
-    prefix = "temp"
-    suffix = random.randint(10000, 99999)
-
-    temp_table_name = f"{dataset}.{prefix}_{table}_{suffix}"
-    tmp_table_def = bigquery.Table(project + '.' + temp_table_name)
-    tmp_table_def.expires = datetime.datetime.now(pytz.utc) + datetime.timedelta(
-        hours=1
-    )
-
-    pandas_gbq.to_gbq(input_df, temp_table_name, project_id=project)
-    print("successfully wrote data to {}".format(project + '.' + temp_table_name))
-
-    return f"{dataset}.{prefix}_{table}_{suffix}"
+the bot contracts, signatures and callers among the tagged rows of explore. the whitelist, the
+fingerprint store and the feature store are fetched unless given
+'''
+@instrument('analyze')
+def analyze(contracts_df, signatures_df, callers_df, whitelist=None, fingerprint_store=None, feature_store=None):
+    values = {'contracts': contracts_df, 'signatures': signatures_df, 'callers': callers_df}
+    if whitelist is not None:
+        values['whitelist'] = whitelist
+    if fingerprint_store is not None:
+        values['fingerprint_store'] = fingerprint_store
+    if feature_store is not None:
+        values['feature_store'] = feature_store
+    return analyze_pipeline.run(ANALYZED, values)
 
-def run(request='request', context='context'):
-    contracts, signatures, callers = get_tagged_data()
-    bot_contracts, bot_signatures, bot_callers = analyze(contracts, signatures, callers)
-    
-    if not bot_contracts.empty:
-        write_df(bot_contracts, 'contracts')
-    
-    if not bot_signatures.empty:
-        write_df(bot_signatures, 'signatures')
+'''
+get data generated from explore stage, and the smart contract whitelist, fetching them concurrently
+'''
+def get_tagged_data(max_workers=MAX_CONCURRENT_QUERIES, whitelist_path=WHITELIST_CACHE_PATH,
+                    fingerprint_path=fingerprints.FINGERPRINT_STORE_PATH):
+    whitelist_cache_df = read_cache(whitelist_path)
+    fingerprint_store_df = fingerprints.read_store(fingerprint_path)
+    queries = {
+        'contracts': """
+            select *
+            from `celo-testnet-production.1_attributions.contracts`
+            where tag = 'suspicious'
+        """,
+        'signatures': """
+            select *
+            from `celo-testnet-production.1_attributions.signatures`
+            where tag = 'suspicious'
+        """,
+        'callers': """
+            select *
+            from `celo-testnet-production.1_attributions.callers`
+            where tag = 'suspicious'
+        """,
+        'smart_contracts': delta_query(whitelist_cache_df),
+        'creations': fingerprints.delta_query(fingerprint_store_df),
+    }
+    frames = fetch_all(get_client(), queries, max_workers)
+
+    with stage('analyze.read_tags', [frames['contracts'], frames['signatures'], frames['callers']]):
+        tagged = read_tags(frames['contracts']), read_tags(frames['signatures']), read_tags(frames['callers'])
+    with stage('analyze.update_whitelist', frames['smart_contracts']):
+        whitelist = update_cache(whitelist_cache_df, frames['smart_contracts'], whitelist_path)
+    with stage('analyze.update_fingerprints', frames['creations']):
+        fingerprint_store = fingerprints.update_store(fingerprint_store_df, frames['creations'], fingerprint_path)
+
+    return (*tagged, whitelist, fingerprint_store)
+
+'''
+upsert the analyze results into 1_attributions, offline runs can pass writer.LocalBackend().
+the suspicious rows read are merged again even when the snapshot holds their tags
+'''
+def write_df(bot_contracts, bot_signatures, bot_callers, backend=None, tagged=None):
+    backend = backend or BigQueryBackend(get_client(), 'celo-testnet-production', '1_attributions')
+    stale = dict(zip(['contracts', 'signatures', 'callers'], tagged)) if tagged is not None else None
+    return write_results(backend, bot_contracts, bot_signatures, bot_callers, stale=stale)
+
+'''
+analyze the tagged data with ANALYZE_ENGINE and upsert the results. with CHECKPOINT_DIR set, a rerun
+over the same window resumes from the fetched or the analyzed rows, and skips a merge that completed
+'''
+def analyze_latest(engine=ANALYZE_ENGINE, checkpoints=None):
+    if engine == 'pushdown':
+        return run_pushdown(get_client(), 'celo-testnet-production', '1_attributions')
+    if checkpoints is None:
+        checkpoints = Checkpoints('analyze')
+
+    fetched = {}
+    def tag():
+        # resumed fetches read the whitelist and fingerprints from their own caches
+        whitelist = fingerprint_store = None
+        tagged = checkpoints.load('fetch')
+        if tagged is None:
+            contracts, signatures, callers, whitelist, fingerprint_store = get_tagged_data()
+            tagged = checkpoints.save('fetch', (contracts, signatures, callers))
+        fetched['tagged'] = tagged
+        return analyze(*tagged, whitelist, fingerprint_store)
+
+    bot_contracts, bot_signatures, bot_callers = checkpoints.stage('tag', tag)
+    tagged = fetched.get('tagged') or checkpoints.load('fetch')
+    counts = checkpoints.once('write', lambda: write_df(bot_contracts, bot_signatures, bot_callers, tagged=tagged))
+    checkpoints.clear()
+    return counts
 
-    if not bot_callers.empty:
-        write_df(bot_callers, 'callers')
+def run(request='request', context='context'):
+    begin_run()
+    analyze_latest()
+    write_report('analyze')
+    QUERY_CACHE.report()
 
 
 # for testing purposes
 if __name__ == '__main__':
-    contracts, signatures, callers = get_tagged_data()
-    bot_contracts, bot_signatures, bot_callers = analyze(contracts, signatures, callers)
-    
-    if not bot_contracts.empty:
-        write_df(bot_contracts, 'contracts')
-    
-    if not bot_signatures.empty:
-        write_df(bot_signatures, 'signatures')
-    
-    if not bot_callers.empty:
-        write_df(bot_callers, 'callers')
\ No newline at end of file
+    begin_run()
+    analyze_latest()
+    write_report('analyze')
+    QUERY_CACHE.report()
\ No newline at end of file
@@ -0,0 +1,128 @@
+'''
+Stage instrumentation, kept identical in bot_attribution_explore, bot_attribution_analyze and template.
+
+Every stage logs one JSON line with its wall time, CPU time, input/output rows, peak RSS
+growth and BigQuery bytes processed, which Cloud Logging parses as a structured entry.
+The stages of a run are also collected for an optional JSON profile report.
+'''
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+# write every stage of a run to this JSON file (local path), unset to only log
+PROFILE_REPORT_PATH = os.environ.get('PROFILE_REPORT_PATH')
+
+run_stages = []
+run_started = [time.perf_counter()]
+
+def current_rss():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return 0
+
+def count_rows(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value.index)
+    if isinstance(value, (tuple, list)):
+        frames = [item for item in value if isinstance(item, (pd.DataFrame, pd.Series))]
+        return sum(len(frame.index) for frame in frames) if frames else None
+    return None
+
+class Stage:
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.bytes_processed = 0
+        self.peak_rss = self.start_rss = current_rss()
+        self._done = threading.Event()
+
+    def output(self, value):
+        self.rows_out = count_rows(value)
+        return value
+
+    def query_job(self, job):
+        self.bytes_processed += job.total_bytes_processed or 0
+        return job
+
+    def _sample(self, interval=0.05):
+        while not self._done.wait(interval):
+            self.peak_rss = max(self.peak_rss, current_rss())
+
+    def record(self, wall, cpu):
+        return {
+            'stage': self.name,
+            'wall_s': round(wall, 3),
+            'cpu_s': round(cpu, 3),
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'peak_rss_delta_mb': round((self.peak_rss - self.start_rss) / 2 ** 20, 1),
+            'bytes_processed': self.bytes_processed,
+        }
+
+'''
+Measure the block as one stage. Use the yielded Stage to report output rows (output())
+and BigQuery jobs (query_job()). CPU time is the process' CPU time, so it includes
+threads running concurrently with the stage.
+'''
+@contextmanager
+def stage(name, rows_in=None):
+    current = Stage(name, count_rows(rows_in) if rows_in is not None else None)
+    sampler = threading.Thread(target=current._sample, daemon=True)
+    sampler.start()
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    try:
+        yield current
+    finally:
+        wall, cpu = time.perf_counter() - start_wall, time.process_time() - start_cpu
+        current._done.set()
+        sampler.join()
+        current.peak_rss = max(current.peak_rss, current_rss())
+        record = current.record(wall, cpu)
+        run_stages.append(record)
+        print(json.dumps({'severity': 'INFO', 'message': f"stage {name}", **record}))
+
+'''
+Decorator measuring a function as a stage, counting the rows of its DataFrame arguments
+and results.
+'''
+def instrument(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            frames = [value for value in list(args) + list(kwargs.values()) if count_rows(value) is not None]
+            with stage(name, frames) as current:
+                return current.output(func(*args, **kwargs))
+        return wrapper
+    return decorator
+
+def begin_run():
+    run_stages.clear()
+    run_started[0] = time.perf_counter()
+
+'''
+Write the stages measured since begin_run() as a JSON profile report. Stages can nest or
+run concurrently, so the run's wall time is measured from begin_run().
+'''
+def write_report(run_name, path=PROFILE_REPORT_PATH):
+    if not path:
+        return
+
+    report = {
+        'run': run_name,
+        'finished_at': pd.Timestamp.now(tz='UTC').isoformat(),
+        'wall_s': round(time.perf_counter() - run_started[0], 3),
+        'bytes_processed': sum(record['bytes_processed'] for record in run_stages),
+        'stages': list(run_stages),
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote profile report of {len(run_stages)} stages to {path}")
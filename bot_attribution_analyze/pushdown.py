@@ -0,0 +1,191 @@
+'''
+SQL pushdown of analyze(): its heuristics compiled into one BigQuery script, so the tagged
+rows never leave BigQuery and only the number of merged rows per table comes back.
+
+The statements building the results are plain SQL that SQLite runs as well, which is how
+benchmarks/compare_analyze_engines.py checks them against the local engine. Only the MERGE
+statements and their counters are BigQuery specific. Byte code similarity needs Python and
+timing regularity the feature store, they only run in the local engine. So do fingerprint
+matches: the script tags bot contracts by address only, while the local engine also tags
+their clones deployed with the same byte code.
+'''
+from graph import GRAPH_DEPTH
+from metrics import stage
+from writer import merge_statements
+
+
+STAGING_TABLE = 'analyze_staging'
+
+'''
+The tables the script reads, as SQL table expressions.
+'''
+def bigquery_sources(project, dataset):
+    return {
+        'contracts': f"`{project}.{dataset}.contracts`",
+        'signatures': f"`{project}.{dataset}.signatures`",
+        'callers': f"`{project}.{dataset}.callers`",
+        'smart_contracts': f"`{project}.1_raw.smart_contracts`",
+    }
+
+def _hop(depth):
+    return f"""
+        create temp table hop_{depth} as
+        select kind, node, max(confidence) as confidence
+        from (
+            select kind, node, confidence from hop_{depth - 1}
+            union all
+            select e.target_kind, e.target, h.confidence * e.weight
+            from hop_{depth - 1} h
+            join edges e on e.source_kind = h.kind and e.source = h.node
+        )
+        group by kind, node;"""
+
+def _most_confident(name, columns, keys):
+    order = ', '.join(['confidence_level desc'] + keys)
+    return f"""
+        create temp table {name} as
+        select {', '.join(columns)}
+        from (
+            select *, row_number() over (partition by to_address_hash order by {order}) as row_position
+            from {name}_candidates c
+            where not exists (select 1 from smart_contracts w where w.address_hash = c.to_address_hash)
+        )
+        where row_position = 1;"""
+
+'''
+Statements tagging bots from the suspicious rows of `sources`, like analyze() does, into the
+temp table analyze_staging (writer.STAGING_COLUMNS). Suspicion propagates `depth` hops over
+the same signature and call edges as the local graph.
+'''
+def heuristic_statements(sources, depth=GRAPH_DEPTH):
+    statements = [f"""
+        create temp table suspicious_{table} as
+        select * from {sources[table]} where tag = 'suspicious';""" for table in ('contracts', 'signatures', 'callers')]
+
+    statements.append(f"""
+        create temp table smart_contracts as
+        select distinct address_hash from {sources['smart_contracts']};""")
+
+    # known bots, the seeds: contracts of the most invoked signatures
+    statements.append("""
+        create temp table known_bots as
+        select distinct to_address_hash
+        from (
+            select to_address_hash
+            from suspicious_signatures
+            order by invocations desc, to_address_hash, signature
+            limit 1000
+        );""")
+
+    # a bot contract's signatures, contracts sharing them and the contract's callers, whose
+    # confidence depends on whether the contract has a signature called more than 200 times.
+    # contracts sharing a signature are signature_match nodes, which suspicion does not leave
+    statements.append("""
+        create temp table edges as
+        select 'address' as source_kind, to_address_hash as source, 'signature' as target_kind, signature as target,
+               1.0 as weight
+        from suspicious_signatures
+        where to_address_hash is not null and signature is not null
+        union all
+        select 'signature', signature, 'signature_match', to_address_hash, 0.6
+        from suspicious_signatures
+        where to_address_hash is not null and signature is not null
+        union all
+        select 'address', c.to_address_hash, 'address', c.caller,
+               case when s.invocations > 200 then 1.0 else 0.6 end
+        from suspicious_callers c
+        left join (
+            select to_address_hash, max(invocations) as invocations
+            from suspicious_signatures
+            group by to_address_hash
+        ) s on s.to_address_hash = c.to_address_hash
+        where c.to_address_hash is not null and c.caller is not null;""")
+
+    statements.append("""
+        create temp table hop_0 as
+        select 'address' as kind, to_address_hash as node, 1.0 as confidence
+        from known_bots
+        where to_address_hash is not null;""")
+    statements.extend(_hop(hop) for hop in range(1, depth + 1))
+    statements.append(f"""
+        create temp table bot_nodes as
+        select node as to_address_hash, confidence
+        from hop_{depth}
+        where kind = 'address';""")
+    statements.append(f"""
+        create temp table signature_nodes as
+        select node as to_address_hash, max(confidence) as confidence
+        from hop_{depth}
+        where kind in ('address', 'signature_match')
+        group by node;""")
+
+    statements.append("""
+        create temp table bot_contracts_candidates as
+        select to_address_hash, 0.95 as confidence_level
+        from suspicious_contracts
+        where to_address_hash in (select to_address_hash from known_bots);""")
+
+    statements.append("""
+        create temp table bot_signatures_candidates as
+        select distinct s.to_address_hash, s.signature, coalesce(s.invocations, 0) as invocations,
+               b.confidence as confidence_level
+        from suspicious_signatures s
+        join signature_nodes b on b.to_address_hash = s.to_address_hash;""")
+
+    statements.append("""
+        create temp table bot_callers_candidates as
+        select c.caller, c.to_address_hash,
+               b.confidence * case when s.invocations > 200 then 1.0 else 0.6 end as confidence_level
+        from suspicious_callers c
+        join bot_nodes b on b.to_address_hash = c.to_address_hash
+        left join (
+            select to_address_hash, max(invocations) as invocations
+            from suspicious_signatures
+            group by to_address_hash
+        ) s on s.to_address_hash = c.to_address_hash
+        union all
+        select caller, to_address_hash, 0.7
+        from suspicious_callers
+        where caller is not null and to_address_hash is not null
+        group by caller, to_address_hash
+        having max(bursts) > 0;""")
+
+    statements.append(_most_confident('bot_contracts', ['to_address_hash', 'confidence_level'], []))
+    statements.append(_most_confident('bot_signatures', ['to_address_hash', 'signature', 'invocations', 'confidence_level'],
+                                      ['signature', 'invocations']))
+    statements.append(_most_confident('bot_callers', ['caller', 'to_address_hash', 'confidence_level'], ['caller']))
+
+    statements.append(f"""
+        create temp table {STAGING_TABLE} as
+        select 'contracts' as table_name, to_address_hash, cast(null as string) as caller,
+               cast(null as string) as signature, cast(null as int64) as invocations, 'bot' as tag, confidence_level
+        from bot_contracts
+        union all
+        select 'signatures', to_address_hash, null, signature, invocations, 'bot', confidence_level
+        from bot_signatures
+        union all
+        select 'callers', to_address_hash, caller, null, null, 'bot', confidence_level
+        from bot_callers;""")
+    return statements
+
+'''
+The whole pushdown script: the heuristics followed by writer.merge_statements(), whose
+DECLAREs open the script, returning the rows merged into every table.
+'''
+def analyze_script(project, dataset, depth=GRAPH_DEPTH):
+    declarations, merges = merge_statements(project, dataset, STAGING_TABLE)
+    return '\n'.join(declarations + heuristic_statements(bigquery_sources(project, dataset), depth) + merges)
+
+'''
+Run analyze() inside BigQuery as one script job.
+'''
+def run_pushdown(client, project, dataset, depth=GRAPH_DEPTH):
+    script = analyze_script(project, dataset, depth)
+    print(script)
+    with stage('analyze.pushdown') as current:
+        rows = current.query_job(client.query(script)).result()
+        counts = dict(next(iter(rows)).items())
+
+    for table, rows in counts.items():
+        print(f"DML query modified {rows} rows in {table}.")
+    return counts
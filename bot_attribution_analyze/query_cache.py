@@ -0,0 +1,268 @@
+'''
+Read-through cache of BigQuery query results, kept identical in bot_attribution_explore and
+bot_attribution_analyze.
+
+get_client() wraps the BigQuery client in a CachedClient when QUERY_CACHE_DIR is set. Every
+SELECT it runs goes to BigQuery as written, and its result is keyed by the normalized SQL text
+and the current QUERY_CACHE_RESOLUTION period, so reruns and retries in the same period read
+the result of the first run. Results are saved as Parquet, expire after QUERY_CACHE_TTL
+seconds, and the least recently read ones are evicted above QUERY_CACHE_MAX_MB. Scripts and
+DML (MERGE, CREATE, ...) always run in BigQuery, and so do reads of the 1_attributions tables
+both stages write to, which a cached result would miss the latest writes of.
+'''
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# local directory for cached query results, unset to always query BigQuery
+QUERY_CACHE_DIR = os.environ.get('QUERY_CACHE_DIR')
+# seconds a cached result is served before it is queried again
+QUERY_CACHE_TTL = int(os.environ.get('QUERY_CACHE_TTL', 3600))
+# size of the cache directory, least recently read results are evicted above it
+QUERY_CACHE_MAX_MB = int(os.environ.get('QUERY_CACHE_MAX_MB', 1024))
+# cached results are only served in the period of this pandas frequency they were queried in
+QUERY_CACHE_RESOLUTION = os.environ.get('QUERY_CACHE_RESOLUTION', '1h')
+
+# tables written between runs, their reads are never cached
+MUTABLE_TABLES = re.compile(r'\b1_attributions\.', re.IGNORECASE)
+CREATED_AT = b'query_cache.created_at'
+BYTES_PROCESSED = b'query_cache.bytes_processed'
+
+'''
+SQL text without comments, surplus whitespace or a trailing semicolon, so formatting
+changes in the code do not miss the cache.
+'''
+def normalize_sql(query_string):
+    query_string = re.sub(r'--[^\n]*', ' ', query_string)
+    return re.sub(r'\s+', ' ', query_string).strip().rstrip(';').strip()
+
+def cacheable(query_string):
+    return (re.match(r'(select|with)\b', query_string, re.IGNORECASE) is not None
+            and MUTABLE_TABLES.search(query_string) is None)
+
+class QueryCache:
+    def __init__(self, directory=QUERY_CACHE_DIR, ttl=QUERY_CACHE_TTL, max_mb=QUERY_CACHE_MAX_MB,
+                 resolution=QUERY_CACHE_RESOLUTION):
+        self.enabled = bool(directory)
+        self.directory = os.path.abspath(directory) if directory else None
+        self.ttl = ttl
+        self.max_bytes = max_mb * 2 ** 20
+        self.resolution = resolution
+        self.hits = self.misses = self.bytes_saved = 0
+        self._lock = threading.Lock()
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+
+    '''
+    The key of a query: its normalized SQL text in the current period. CURRENT_TIMESTAMP()
+    is left to BigQuery, so a miss reads every row up to the time it ran.
+    '''
+    def key(self, query_string, now=None):
+        now = pd.Timestamp.now(tz='UTC') if now is None else now
+        period = now.floor(self.resolution).strftime('%Y-%m-%d %H:%M:%S+00')
+        return hashlib.sha1(f'{period} {normalize_sql(query_string)}'.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.parquet')
+
+    '''
+    The cached result of a key as a Parquet file, or None when missing or expired. A hit
+    marks the file as recently read and counts the bytes BigQuery processed for the result.
+    '''
+    def lookup(self, key):
+        path = self._path(key)
+        try:
+            metadata = pq.read_schema(path).metadata or {}
+        except (OSError, pa.ArrowInvalid):
+            return None
+        if time.time() - float(metadata.get(CREATED_AT, 0)) > self.ttl:
+            self._remove(path)
+            return None
+        self._touch(path)
+        self.record(True, int(metadata.get(BYTES_PROCESSED, 0)))
+        return pq.ParquetFile(path)
+
+    '''
+    Write the batches of a result to the cache as they are read. The file only appears
+    once every batch was written, so a result that was not read to the end is not cached.
+    '''
+    def store(self, key, schema, batches, bytes_processed=0):
+        path = self._path(key)
+        partial = f'{path}.{uuid.uuid4().hex}.partial'
+        schema = schema.with_metadata({**(schema.metadata or {}), CREATED_AT: str(time.time()).encode(),
+                                       BYTES_PROCESSED: str(bytes_processed or 0).encode()})
+        try:
+            with pq.ParquetWriter(partial, schema) as writer:
+                for batch in batches:
+                    writer.write_table(pa.Table.from_batches([batch], schema=schema))
+                    yield batch
+            os.replace(partial, path)
+            self._touch(path)
+        finally:
+            self._remove(partial)
+        self.evict()
+
+    # the clock of file times ticks every few milliseconds, too coarse to order reads by
+    def _touch(self, path):
+        now = time.time_ns()
+        os.utime(path, ns=(now, now))
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    '''
+    Remove the least recently read results until the cache fits in max_mb.
+    '''
+    def evict(self):
+        with self._lock:
+            files = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.parquet'):
+                    info = entry.stat()
+                    files.append((info.st_mtime, info.st_size, entry.path))
+            size = sum(file_size for _, file_size, _ in files)
+            for _, file_size, path in sorted(files):
+                if size <= self.max_bytes:
+                    break
+                self._remove(path)
+                size -= file_size
+
+    def record(self, hit, bytes_saved=0):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.bytes_saved += bytes_saved
+            else:
+                self.misses += 1
+
+    '''
+    Log the hits, misses and hit rate since the last report as one JSON line, and reset them.
+    '''
+    def report(self):
+        if not self.enabled:
+            return None
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {'hits': self.hits, 'misses': self.misses,
+                     'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                     'bytes_saved': self.bytes_saved}
+            self.hits = self.misses = self.bytes_saved = 0
+        print(json.dumps({'severity': 'INFO', 'message': 'query cache', **stats}))
+        return stats
+
+'''
+Row iterator over a cached Parquet result, answering like google.cloud.bigquery's RowIterator.
+'''
+class CachedRows:
+    def __init__(self, parquet_file):
+        self._file = parquet_file
+        self.total_rows = parquet_file.metadata.num_rows
+
+    def to_arrow(self, **kwargs):
+        return self._file.read()
+
+    def to_dataframe(self, **kwargs):
+        return self.to_arrow().to_pandas()
+
+    def to_arrow_iterable(self, max_chunksize=None, **kwargs):
+        yield from self._file.iter_batches(batch_size=max_chunksize or 100000)
+
+'''
+Row iterator over a BigQuery result that saves it to the cache as it is read.
+'''
+class CachingRows:
+    def __init__(self, rows, cache, key, bytes_processed):
+        self._rows = rows
+        self._store = lambda schema, batches: cache.store(key, schema, batches, bytes_processed)
+        self.total_rows = rows.total_rows
+
+    def _save(self, table):
+        for _ in self._store(table.schema, table.to_batches()):
+            pass
+
+    def to_arrow(self, **kwargs):
+        table = self._rows.to_arrow(**kwargs)
+        self._save(table)
+        return table
+
+    def to_dataframe(self, **kwargs):
+        df = self._rows.to_dataframe(**kwargs)
+        self._save(pa.Table.from_pandas(df, preserve_index=False))
+        return df
+
+    def to_arrow_iterable(self, **kwargs):
+        batches = iter(self._rows.to_arrow_iterable(**kwargs))
+        first = next(batches, None)
+        if first is None:
+            return
+        yield from self._store(first.schema, _chain(first, batches))
+
+def _chain(first, batches):
+    yield first
+    yield from batches
+
+class CachedQueryJob:
+    def __init__(self, rows):
+        self._rows = rows
+        # nothing was scanned, stages report the bytes a hit saved as 0
+        self.total_bytes_processed = 0
+
+    def result(self, timeout=None):
+        return self._rows
+
+class CachingQueryJob:
+    def __init__(self, job, cache, key):
+        self._job = job
+        self._cache = cache
+        self._key = key
+
+    def __getattr__(self, name):
+        return getattr(self._job, name)
+
+    def result(self, timeout=None):
+        return CachingRows(self._job.result(timeout=timeout), self._cache, self._key,
+                           self._job.total_bytes_processed)
+
+'''
+A BigQuery client serving SELECT results from a QueryCache. Everything else, including
+query() of scripts, DML and reads of the 1_attributions tables, goes to the wrapped client.
+'''
+class CachedClient:
+    def __init__(self, client, cache):
+        self._client = client
+        self._cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def query(self, query_string, *args, **kwargs):
+        if not cacheable(normalize_sql(query_string)):
+            return self._client.query(query_string, *args, **kwargs)
+
+        key = self._cache.key(query_string)
+        cached = self._cache.lookup(key)
+        if cached is not None:
+            return CachedQueryJob(CachedRows(cached))
+        self._cache.record(False)
+        return CachingQueryJob(self._client.query(query_string, *args, **kwargs), self._cache, key)
+
+QUERY_CACHE = QueryCache()
+
+'''
+The client queries should go through: the client itself, or a CachedClient with QUERY_CACHE_DIR set.
+'''
+def cached_client(client, cache=None):
+    cache = QUERY_CACHE if cache is None else cache
+    return CachedClient(client, cache) if cache.enabled else client
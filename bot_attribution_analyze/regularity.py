@@ -0,0 +1,45 @@
+'''
+Timing regularity of callers, scored from the features explore keeps per address (see features.py).
+
+Humans call at irregular times, the gaps between their transactions spread about as wide as
+they are long (a coefficient of variation near 1). Scripts fire on a timer or every few
+blocks, however few transactions they send. A caller with at least MIN_TRANSACTIONS
+transactions shows a signal for each of
+    the gaps between its transactions varying by at most MAX_CV of their mean
+    at least PERIODIC_SHARE of its gaps repeating the gap before them
+    the blocks between its transactions varying by at most MAX_CV of their mean
+'''
+import numpy as np
+import pandas as pd
+
+
+MIN_TRANSACTIONS = 10
+MAX_CV = 0.1
+PERIODIC_SHARE = 0.8
+# confidence of a caller by the number of signals it shows, callers showing fewer are not tagged
+CONFIDENCE = {2: 0.6, 3: 0.8}
+
+def _cv(mean, var):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.sqrt(var) / mean
+
+'''
+The regularity signals of every address of a FeatureStore.lookup() frame, and the
+confidence they add up to, NaN for addresses that are not tagged.
+'''
+def regularity_scores(features_df):
+    tx_count = features_df['tx_count'].to_numpy(dtype='float64', na_value=np.nan)
+    interarrival_cv = _cv(features_df['interarrival_mean'].to_numpy(dtype='float64', na_value=np.nan),
+                          features_df['interarrival_var'].to_numpy(dtype='float64', na_value=np.nan))
+    block_cv = _cv(features_df['block_gap_mean'].to_numpy(dtype='float64', na_value=np.nan),
+                   features_df['block_gap_var'].to_numpy(dtype='float64', na_value=np.nan))
+    # the first gap has none before it
+    with np.errstate(divide='ignore', invalid='ignore'):
+        periodicity = features_df['periodic_gaps'].to_numpy(dtype='float64', na_value=np.nan) / (tx_count - 2)
+
+    signals = ((interarrival_cv <= MAX_CV).astype(int) + (periodicity >= PERIODIC_SHARE).astype(int)
+               + (block_cv <= MAX_CV).astype(int))
+    signals = np.where(tx_count >= MIN_TRANSACTIONS, signals, 0)
+    confidence = pd.Series(signals, index=features_df.index).map(CONFIDENCE)
+    return features_df[['address']].assign(interarrival_cv=interarrival_cv, periodicity=periodicity,
+                                           block_cv=block_cv, signals=signals, confidence_level=confidence)
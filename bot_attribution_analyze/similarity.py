@@ -0,0 +1,223 @@
+from difflib import SequenceMatcher
+import numpy as np
+
+
+SIMILARITY_THRESHOLD = 0.6
+
+# smallest prime above 2**32, keeps (a * shingle + b) inside uint64
+_PRIME = np.uint64((1 << 32) + 15)
+_CHUNK_SIZE = 100000
+# longest values the bit-parallel LCS bound handles, one bit per character of a uint64
+_BOUND_LENGTH = 64
+# (query, item) pairs bounded at once, sized to stay in cache
+_BOUND_PAIRS = 1 << 14
+_ONES = np.uint64((1 << 64) - 1)
+_POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.int64)
+
+'''
+Encode every value as overlapping character shingles packed into uint32 codes.
+A leading '0x' is dropped since every address and bytecode shares it, and values shorter
+than the shingle size are padded so each value has at least one shingle.
+Returns the flat shingle codes and the number of shingles per value.
+'''
+def shingle(values, shingle_size=3):
+    if not 1 <= shingle_size <= 4:
+        raise ValueError("shingle_size must be between 1 and 4")
+
+    encoded = [str(value).lower().removeprefix('0x').encode().ljust(shingle_size) for value in values]
+    lengths = np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded))
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.uint32)
+
+    counts = lengths - shingle_size + 1
+    value_starts = np.cumsum(lengths) - lengths
+    shingle_starts = np.cumsum(counts) - counts
+    positions = np.repeat(value_starts, counts) \
+                + np.arange(counts.sum()) - np.repeat(shingle_starts, counts)
+
+    codes = np.zeros(len(positions), dtype=np.uint32)
+    for offset in range(shingle_size):
+        codes |= data[positions + offset] << np.uint32(8 * offset)
+
+    return codes, counts
+
+def _boundable(value):
+    return isinstance(value, str) and len(value) <= _BOUND_LENGTH and value.isascii()
+
+'''
+Expand [left, right) ranges into flat (owner, position) arrays without a Python loop.
+'''
+def _expand_ranges(left, right):
+    counts = right - left
+    owners = np.repeat(np.arange(len(left)), counts)
+    positions = np.repeat(left, counts) + np.arange(counts.sum()) \
+                - np.repeat(np.cumsum(counts) - counts, counts)
+    return owners, positions
+
+def _bytes(values, width):
+    out = np.zeros((len(values), width), dtype=np.uint8)
+    for row, value in enumerate(values):
+        encoded = value.encode()
+        out[row, :len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+    return out
+
+def _popcount(values):
+    # np.bitwise_count is only in numpy >= 2
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return _POPCOUNT[values.view(np.uint8)].reshape(*values.shape, 8).sum(axis=-1)
+
+'''
+Bit masks of every character in every item, bit j of masks[c, item] set where the item's
+j-th character is c, for lcs_lengths().
+'''
+def match_masks(items):
+    codes = _bytes(items, _BOUND_LENGTH)
+    masks = np.zeros((256, len(items)), dtype=np.uint64)
+    for position in range(codes.shape[1]):
+        np.bitwise_or.at(masks, (codes[:, position], np.arange(len(items))),
+                         np.uint64(1) << np.uint64(position))
+    masks[0] = 0
+    return masks
+
+'''
+Length of the longest common subsequence of every query against every item, with the
+bit-parallel algorithm of Hyyrö (2004) over all pairs at once. Queries and items are ASCII
+strings of at most 64 characters. Yields the position of the first query of every chunk of
+queries and their (queries x items) lengths.
+'''
+def lcs_lengths(values, masks, item_lengths):
+    codes = _bytes(values, max([len(value) for value in values] + [1]))
+    low = np.where(item_lengths >= 64, _ONES,
+                   (np.uint64(1) << np.minimum(item_lengths, 63).astype(np.uint64)) - np.uint64(1))
+    chunk = max(1, _BOUND_PAIRS // max(masks.shape[1], 1))
+    for start in range(0, len(values), chunk):
+        rows = codes[start:start + chunk]
+        remaining = np.full((len(rows), masks.shape[1]), _ONES)
+        matched, borrowed = np.empty_like(remaining), np.empty_like(remaining)
+        for position in range(rows.shape[1]):
+            np.take(masks, rows[:, position], axis=0, out=matched)
+            matched &= remaining
+            np.subtract(remaining, matched, out=borrowed)
+            remaining += matched
+            remaining |= borrowed
+        # the zero bits within an item's length count its matched characters
+        yield start, item_lengths - _popcount(remaining & low)
+
+'''
+Similarity index over strings (contract addresses or bytecode).
+
+Only candidate pairs are compared exactly with SequenceMatcher, which keeps the scores the
+pairwise loop produced without comparing every pair. A SequenceMatcher ratio never exceeds
+2 * LCS / (len(a) + len(b)), so for values of at most 64 ASCII characters, e.g. addresses,
+the candidates are the pairs whose LCS bound reaches the threshold, computed bit-parallel
+over every pair: every pair scoring at least the threshold is found. Longer values fall
+back to banded MinHash signatures, where values sharing at least one band bucket become
+candidates, which can miss pairs whose matches share few shingles.
+'''
+class SimilarityIndex:
+    def __init__(self, num_perm=120, bands=40, shingle_size=3, seed=1, threshold=SIMILARITY_THRESHOLD):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self._a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+        self._items = []
+        self._keys = np.empty((0, bands), dtype=np.uint64)
+        self._sorted = None
+        self._masks = None
+        self._lengths = None
+
+    def __len__(self):
+        return len(self._items)
+
+    def signatures(self, values):
+        values = list(values)
+        out = np.empty((len(values), self.num_perm), dtype=np.uint64)
+        for start in range(0, len(values), _CHUNK_SIZE):
+            chunk = values[start:start + _CHUNK_SIZE]
+            codes, counts = shingle(chunk, self.shingle_size)
+            codes = codes.astype(np.uint64)
+            bounds = np.cumsum(counts) - counts
+            for i in range(self.num_perm):
+                hashed = (self._a[i] * codes + self._b[i]) % _PRIME
+                out[start:start + len(chunk), i] = np.minimum.reduceat(hashed, bounds)
+        return out
+
+    def _band_keys(self, signatures):
+        rows = self.num_perm // self.bands
+        banded = signatures.reshape(len(signatures), self.bands, rows)
+        keys = banded[:, :, 0].copy()
+        for row in range(1, rows):
+            keys = keys * np.uint64(1000003) ^ banded[:, :, row]
+        return keys
+
+    def add(self, values):
+        values = list(values)
+        if not values:
+            return
+        self._items.extend(values)
+        self._keys = np.vstack([self._keys, self._band_keys(self.signatures(values))])
+        self._sorted = None
+        self._masks = None
+
+    '''
+    Return (query_positions, item_positions) for every pair whose LCS bound reaches the
+    threshold, or that shares an LSH bucket when a value is too long for the bound.
+    '''
+    def candidates(self, values):
+        values = list(values)
+        if not values or not self._items:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+        if all(_boundable(value) for value in values + self._items):
+            return self._bounded_candidates(values)
+
+        if self._sorted is None:
+            orders = np.argsort(self._keys, axis=0, kind='stable')
+            self._sorted = (orders, np.take_along_axis(self._keys, orders, axis=0))
+        orders, sorted_keys = self._sorted
+
+        query_keys = self._band_keys(self.signatures(values))
+        pair_keys = []
+        for band in range(self.bands):
+            left = np.searchsorted(sorted_keys[:, band], query_keys[:, band], side='left')
+            right = np.searchsorted(sorted_keys[:, band], query_keys[:, band], side='right')
+            queries, positions = _expand_ranges(left, right)
+            pair_keys.append(queries * len(self._items) + orders[positions, band])
+
+        pair_keys = np.unique(np.concatenate(pair_keys))
+        return pair_keys // len(self._items), pair_keys % len(self._items)
+
+    def _bounded_candidates(self, values):
+        if self._masks is None:
+            self._masks = match_masks(self._items)
+            self._lengths = np.array([len(item) for item in self._items], dtype=np.int64)
+        value_lengths = np.array([len(value) for value in values], dtype=np.int64)
+        queries, items = [], []
+        for start, lengths in lcs_lengths(values, self._masks, self._lengths):
+            totals = value_lengths[start:start + len(lengths), None] + self._lengths
+            # ratios round to 2 places, the smallest one rounding up to the threshold counts
+            chunk_queries, chunk_items = np.nonzero(2 * lengths >= (self.threshold - 0.005) * totals)
+            queries.append(chunk_queries + start)
+            items.append(chunk_items)
+        return np.concatenate(queries), np.concatenate(items)
+
+    '''
+    Best SequenceMatcher ratio (rounded to 2 places) of each value against the indexed
+    items, 0 when no candidate was found.
+    '''
+    def best_scores(self, values):
+        values = list(values)
+        scores = np.zeros(len(values))
+        queries, items = self.candidates(values)
+        for query, item in zip(queries.tolist(), items.tolist()):
+            if scores[query] == 1:
+                continue
+            score = round(SequenceMatcher(None, values[query], self._items[item]).ratio(), 2)
+            scores[query] = max(scores[query], score)
+        return scores
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+
+TAG_DTYPE = pd.CategoricalDtype(['suspicious', 'bot'])
+# legacy str(tuple) tags, e.g. "('suspicious', '1')" or "('bot', 0.95)"
+LEGACY_TAGS = r"\('(?P<tag>\w+)',\s*'?(?P<confidence_level>[0-9.]+)'?\)"
+
+'''
+Tag every row with a categorical label and a float32 confidence level (a scalar or
+one value per row).
+'''
+def tag_columns(df, tag, confidence_level):
+    return df.assign(tag=pd.Categorical([tag] * len(df.index), dtype=TAG_DTYPE),
+                     confidence_level=pd.Series(confidence_level, index=df.index, dtype='float32'))
+
+'''
+Return tagged rows with typed tag/confidence_level columns. Rows written before the
+columns existed only carry the stringified `tags` tuple, which is parsed in one
+vectorized pass.
+'''
+def read_tags(df):
+    if 'tags' in df:
+        legacy = df['tags'].astype('string').str.extract(LEGACY_TAGS)
+        if 'tag' not in df:
+            df = df.assign(tag=None, confidence_level=np.nan)
+        missing = df['tag'].isna()
+        df.loc[missing, 'tag'] = legacy.loc[missing, 'tag']
+        df.loc[missing, 'confidence_level'] = legacy.loc[missing, 'confidence_level'].astype(float)
+        df = df.drop(columns=['tags'])
+
+    return df.astype({'tag': TAG_DTYPE, 'confidence_level': 'float32'})
+
+'''
+Confidence levels as the FLOAT64 the 1_attributions tables hold, rounded to the 6 decimals a
+float32 keeps, so 0.7 is written as 0.7 rather than 0.699999988079071.
+'''
+def written_confidence(confidence_level):
+    return confidence_level.astype('float64').round(6)
+
+'''
+Keep the most confident row per contract, ties going to the smallest `keys`, which is the
+row the pushdown script keeps too.
+'''
+def most_confident(df, keys=()):
+    return (df.sort_values(['confidence_level', *keys], ascending=[False] + [True] * len(keys), kind='stable')
+              .drop_duplicates(subset=['to_address_hash']))
@@ -0,0 +1,100 @@
+import math
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# Parquet copy of 1_raw.smart_contracts (local path or gs://). /tmp survives warm Cloud Function invocations.
+WHITELIST_CACHE_PATH = os.environ.get('WHITELIST_CACHE_PATH', '/tmp/smart_contracts.parquet')
+WHITELIST_COLUMNS = ['id', 'name', 'address_hash']
+
+# verified contracts are only ever added, so the cache is refreshed with the ids after its last one
+smart_contract_delta_query = """
+    select distinct
+        id,
+        name,
+        address_hash
+    from celo-testnet-production.1_raw.smart_contracts
+    where id > {last_id}
+"""
+
+'''
+Bloom filter over string values. Bit positions come from the two 32 bit halves of one
+64 bit hash of every value (double hashing), so adding and probing are vectorized over
+whole columns.
+'''
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = np.zeros(self.size, dtype=bool)
+
+    def _positions(self, values):
+        hashes = pd.util.hash_array(np.asarray(values, dtype=object), categorize=False)
+        first = hashes & np.uint64(0xffffffff)
+        second = (hashes >> np.uint64(32)) | np.uint64(1)
+        rounds = np.arange(self.hashes, dtype=np.uint64)
+        return (first[:, None] + rounds * second[:, None]) % np.uint64(self.size)
+
+    def add(self, values):
+        self.bits[self._positions(values).ravel()] = True
+
+    def might_contain(self, values):
+        if not len(values):
+            return np.zeros(0, dtype=bool)
+        return self.bits[self._positions(values)].all(axis=1)
+
+'''
+Verified smart contract addresses. The Bloom filter rules out most addresses without
+touching the exact set, a hashed pandas Index, which confirms the rest.
+'''
+class Whitelist:
+    def __init__(self, addresses, error_rate=0.01):
+        self.addresses = pd.Index(pd.unique(pd.Series(addresses, dtype=object).dropna()))
+        self.bloom = BloomFilter(len(self.addresses), error_rate)
+        self.bloom.add(self.addresses)
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def __contains__(self, address):
+        return bool(self.bloom.might_contain([address])[0]) and address in self.addresses
+
+    def might_contain(self, addresses):
+        return self.bloom.might_contain(addresses)
+
+    def contains(self, addresses):
+        addresses = np.asarray(addresses, dtype=object)
+        found = self.might_contain(addresses)
+        found[found] = self.addresses.get_indexer(addresses[found]) >= 0
+        return found
+
+def read_cache(path=WHITELIST_CACHE_PATH):
+    try:
+        return pq.read_table(path, columns=WHITELIST_COLUMNS).to_pandas()
+    except FileNotFoundError:
+        return pd.DataFrame(columns=WHITELIST_COLUMNS)
+
+'''
+Query for the smart contracts added after the cached ones.
+'''
+def delta_query(cache_df):
+    last_id = int(cache_df['id'].max()) if not cache_df.empty else -1
+    return smart_contract_delta_query.format(last_id=last_id)
+
+'''
+Append the fetched delta to the cache, persist it when it grew, and return the whitelist.
+'''
+def update_cache(cache_df, delta_df, path=WHITELIST_CACHE_PATH):
+    if not delta_df.empty:
+        cache_df = (pd.concat([cache_df, delta_df[WHITELIST_COLUMNS]], ignore_index=True)
+                        .drop_duplicates('id', keep='last')
+                        .astype({'id': 'int64'}))
+        pq.write_table(pa.Table.from_pandas(cache_df, preserve_index=False), path)
+        print(f'cached {len(delta_df.index)} new smart contracts, {len(cache_df.index)} in {path}')
+
+    return Whitelist(cache_df['address_hash'])
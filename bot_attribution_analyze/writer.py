@@ -0,0 +1,174 @@
+import datetime
+import io
+import uuid
+
+import pandas as pd
+from delta import Snapshot
+from metrics import stage
+from tagging import written_confidence
+
+
+# merge keys and inserted columns of every 1_attributions table analyze() upserts
+TABLES = {
+    'contracts': {'keys': ['to_address_hash'],
+                  'insert': ['to_address_hash', 'tag', 'confidence_level']},
+    'signatures': {'keys': ['signature', 'to_address_hash'],
+                   'insert': ['to_address_hash', 'signature', 'invocations', 'tag', 'confidence_level']},
+    'callers': {'keys': ['caller', 'to_address_hash'],
+                'insert': ['caller', 'to_address_hash', 'tag', 'confidence_level']},
+}
+UPDATE_COLUMNS = ['tag', 'confidence_level']
+STAGING_COLUMNS = ['table_name', 'to_address_hash', 'caller', 'signature', 'invocations', 'tag', 'confidence_level']
+
+'''
+Stack the frames to upsert into one staging frame, tagged with their target table,
+so they can be loaded with a single load job. MERGE rejects several source rows per
+target row, so only the last row per key is kept. Confidence levels are staged as FLOAT64.
+'''
+def staging_frame(frames):
+    staged = [df[TABLES[table]['insert']].drop_duplicates(TABLES[table]['keys'], keep='last').assign(table_name=table)
+              for table, df in frames.items() if not df.empty]
+    if not staged:
+        return pd.DataFrame(columns=STAGING_COLUMNS)
+
+    staging_df = (pd.concat(staged, ignore_index=True)
+                      .reindex(columns=STAGING_COLUMNS)
+                      .astype({'table_name': 'string', 'to_address_hash': 'string', 'caller': 'string',
+                               'signature': 'string', 'invocations': 'Int64', 'tag': 'string'}))
+    return staging_df.assign(confidence_level=written_confidence(staging_df['confidence_level']))
+
+'''
+The statements merging every table from the staging table. Matched rows are only updated,
+and get a new updated_at, when their tag or confidence level changed. They drop the staging
+table and return the rows each MERGE affected. Returned as the DECLARE statements of their
+counters and the rest, as BigQuery only accepts DECLARE at the start of a script.
+'''
+def merge_statements(project, dataset, staging_table, tables=TABLES):
+    declarations = [f"DECLARE {table}_rows INT64 DEFAULT 0;" for table in tables]
+
+    statements = []
+    for table, spec in tables.items():
+        on = '\n                and '.join(f"t.{key} = s.{key}" for key in spec['keys'])
+        updates = ', '.join(f"{column} = s.{column}" for column in UPDATE_COLUMNS)
+        changed = ' or '.join(f"t.{column} is distinct from s.{column}" for column in UPDATE_COLUMNS)
+        columns = ', '.join(spec['insert'])
+        statements.append(f"""
+            merge into `{project}.{dataset}.{table}` as t
+            using (select * from `{staging_table}` where table_name = '{table}') as s
+            on {on}
+            when matched and ({changed}) then
+                update set {updates}, updated_at = CURRENT_TIMESTAMP()
+            when not matched then
+                insert ({columns})
+                values ({columns});
+            SET {table}_rows = @@row_count;""")
+
+    statements.append(f"DROP TABLE IF EXISTS `{staging_table}`;")
+    statements.append("SELECT " + ', '.join(f"{table}_rows as {table}" for table in tables) + ";")
+    return declarations, statements
+
+'''
+One multi-statement script of merge_statements().
+'''
+def merge_script(project, dataset, staging_table, tables=TABLES):
+    declarations, statements = merge_statements(project, dataset, staging_table, tables)
+    return '\n'.join(declarations + statements)
+
+'''
+Loads the staging frame as Parquet into an expiring table and applies merge_script().
+'''
+class BigQueryBackend:
+    def __init__(self, client, project, dataset, expires_after=datetime.timedelta(hours=1)):
+        self.client = client
+        self.project = project
+        self.dataset = dataset
+        self.expires_after = expires_after
+
+    def upsert(self, staging_df):
+        from google.cloud import bigquery
+        table = bigquery.Table(f"{self.project}.{self.dataset}.temp_attributions_{uuid.uuid4().hex[:12]}")
+        table.expires = datetime.datetime.now(datetime.timezone.utc) + self.expires_after
+        table = self.client.create_table(table)
+
+        with stage('analyze.write.load', staging_df):
+            buffer = io.BytesIO()
+            staging_df.to_parquet(buffer, index=False)
+            buffer.seek(0)
+            job_config = bigquery.LoadJobConfig(source_format=bigquery.SourceFormat.PARQUET,
+                                                write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
+            self.client.load_table_from_file(buffer, table, job_config=job_config).result()
+        print(f"successfully loaded {len(staging_df.index)} rows to {table.full_table_id}")
+
+        query = merge_script(self.project, self.dataset, f"{table.project}.{table.dataset_id}.{table.table_id}")
+        print(query)
+        with stage('analyze.write.merge', staging_df) as current:
+            rows = current.query_job(self.client.query(query)).result()
+            return dict(next(iter(rows)).items())
+
+'''
+Applies the same upserts to in-memory tables, for running the writer offline.
+'''
+class LocalBackend:
+    def __init__(self, tables=None):
+        self.tables = {table: pd.DataFrame(columns=spec['insert'] + ['updated_at'])
+                       for table, spec in TABLES.items()}
+        self.tables.update(tables or {})
+
+    def upsert(self, staging_df):
+        with stage('analyze.write.local', staging_df):
+            return self._upsert(staging_df)
+
+    def _upsert(self, staging_df):
+        counts = {}
+        for table, spec in TABLES.items():
+            source = staging_df[staging_df['table_name'] == table][spec['insert']]
+            target = self.tables[table]
+
+            matched = target.reset_index().merge(source, on=spec['keys'], suffixes=('', '_new'))
+            matched = matched[changed_rows(matched)]
+            target.loc[matched['index'], UPDATE_COLUMNS] = matched[[f"{column}_new" for column in UPDATE_COLUMNS]].values
+            target.loc[matched['index'], 'updated_at'] = pd.Timestamp.now(tz='UTC')
+
+            inserted = source.merge(target[spec['keys']], on=spec['keys'], how='left', indicator=True)
+            inserted = inserted[inserted['_merge'] == 'left_only'].drop(columns='_merge')
+            self.tables[table] = pd.concat([target, inserted], ignore_index=True)
+            counts[table] = len(matched.index) + len(inserted.index)
+        return counts
+
+'''
+Matched rows whose UPDATE_COLUMNS differ from the target, missing values being equal to each other.
+'''
+def changed_rows(matched):
+    changed = pd.Series(False, index=matched.index)
+    for column in UPDATE_COLUMNS:
+        old, new = matched[column], matched[f"{column}_new"]
+        changed |= ~((old == new).fillna(False) | (old.isna() & new.isna()))
+    return changed.to_numpy(dtype=bool)
+
+'''
+Upsert the analyze() results into 1_attributions with one load job and one MERGE script.
+With SNAPSHOT_DIR set, only rows new or changed since analyze's snapshot of what it merged
+are staged, and the snapshot records them once the MERGE completed. `stale` holds the rows
+read per table, keys with a suspicious row explore appended are merged again regardless.
+'''
+def write_results(backend, contracts_df, signatures_df, callers_df, snapshot=None, stale=None):
+    snapshot = snapshot or Snapshot('analyze')
+    stale = stale or {}
+    deltas = {table: snapshot.diff(table, df[TABLES[table]['insert']], TABLES[table]['keys'],
+                                   [column for column in TABLES[table]['insert'] if column not in TABLES[table]['keys']],
+                                   stale.get(table))
+              for table, df in (('contracts', contracts_df), ('signatures', signatures_df), ('callers', callers_df))}
+    for delta in deltas.values():
+        delta.report()
+
+    staging_df = staging_frame({table: delta.rows for table, delta in deltas.items()})
+    if staging_df.empty:
+        print("no results to write")
+        return {}
+
+    counts = backend.upsert(staging_df)
+    for table, rows in counts.items():
+        print(f"DML query modified {rows} rows in {table}.")
+    for table, delta in deltas.items():
+        snapshot.commit(delta, TABLES[table]['keys'])
+    return counts
@@ -0,0 +1,187 @@
+'''
+Backfill: explore a past date range instead of the trailing days.
+
+The range is split into time windows that are counted concurrently, each by its own
+BigQuery query. Windows are merged before tagging, so invocations add up over the whole
+range and every contract, signature and caller is tagged once, whichever windows it spans.
+Every window also reads the hour before it, which only fills the sliding rate windows, so
+bursts crossing a window boundary are measured as in a single pass and counted once.
+
+With checkpoints, every counted window is saved, and a rerun of the same range only counts
+the windows that are missing.
+
+With FEATURE_STORE_DIR set, the transactions of every window past the store's watermark are
+folded into the per address features, in the order of the windows as they complete. A
+window resumed from its checkpoint is not read again, so the transactions of windows a
+failed attempt counted but did not fold are left out.
+
+usage: python backfill.py --start 2022-01-01 --end 2022-04-01 [--window 1D] [--workers 4]
+'''
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import main
+import pandas as pd
+from checkpoint import CHECKPOINT_DIR, NO_CHECKPOINTS, Checkpoints
+from encoding import AddressDictionary, decode_frame, encode_transactions
+from engine import merge_signature_counts
+from features import NO_FEATURES, FeatureStore
+from ingest import query_batches, stream_signature_counts, window_signature_query
+from metrics import begin_run, stage, write_report
+from rate import BURST_COLUMNS, RATE_KEYS, RATE_WINDOWS, RateDetector, pair_keys
+
+
+# windows counted at the same time, each holding one BigQuery query and its counts
+BACKFILL_WORKERS = int(os.environ.get('BACKFILL_WORKERS', 4))
+# length of every window, as a pandas frequency
+BACKFILL_WINDOW = os.environ.get('BACKFILL_WINDOW', '1D')
+# transactions before a window its sliding rate windows need
+LEAD_IN = pd.Timedelta(seconds=max(RATE_WINDOWS.values()))
+# creations before the range that suspicion travels along, like the week a regular run reads
+CREATIONS_LEAD_IN = pd.Timedelta(days=7)
+
+def utc_timestamp(value):
+    timestamp = pd.Timestamp(value)
+    return timestamp.tz_localize('UTC') if timestamp.tz is None else timestamp.tz_convert('UTC')
+
+'''
+Half open [start, end) windows of `window` covering [start, end), the last one cut at end.
+'''
+def split_windows(start, end, window=BACKFILL_WINDOW):
+    start, end = utc_timestamp(start), utc_timestamp(end)
+    if start >= end:
+        raise ValueError(f'backfill range {start} - {end} is empty')
+    bounds = list(pd.date_range(start, end, freq=window))
+    if bounds[-1] < end:
+        bounds.append(end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+'''
+Record batches of the transactions in [start, end) from BigQuery.
+'''
+def query_window(client, bqstorage_client=None):
+    return lambda start, end: query_batches(client, window_signature_query.format(start=start, end=end),
+                                            bqstorage_client=bqstorage_client)
+
+'''
+Signature counts and burst stats of one window, decoded so that windows counted with
+separate dictionaries merge, and checkpoint as Parquet. Burst stats get their caller and
+contract back from the window's counts, which hold every pair the window counted. The
+window's transactions past the watermark of `features` are kept in `pending`.
+'''
+def count_window(read_window, start, end, features=NO_FEATURES, pending=None):
+    addresses = AddressDictionary()
+    detector = RateDetector()
+    for batch in read_window(start - LEAD_IN, start):
+        detector.add(encode_transactions(batch, addresses), counted=False)
+
+    batches = features.observe(read_window(start, end), pending)
+    signature_counts_df = stream_signature_counts(batches, detector, addresses)
+    pairs_df = signature_counts_df[RATE_KEYS].drop_duplicates()
+    burst_stats_df = (detector.stats()
+                          .merge(pairs_df.assign(key=pair_keys(pairs_df)), on='key')
+                          .drop(columns='key'))
+    return decode_frame(signature_counts_df, addresses), decode_frame(burst_stats_df, addresses)
+
+'''
+Merge the decoded counts and burst stats of every window, encoded with one dictionary like
+get_signature_counts() returns them. Invocations and bursts add up; the sliding window maxima
+are the largest of any window, as the lead-in gives every window the transactions its rate
+windows reach back to, and a burst running across a boundary rises in the lead-in of the
+later window, so only the earlier one counts it.
+'''
+def merge_windows(window_results):
+    signature_counts_df = merge_signature_counts([counts_df for counts_df, _ in window_results])
+    burst_stats_df = (pd.concat([stats_df for _, stats_df in window_results], ignore_index=True)
+                          .groupby(RATE_KEYS, sort=False, dropna=False)
+                          .agg(invocations=('invocations', 'sum'),
+                               **{column: (column, 'sum' if column == 'bursts' else 'max')
+                                  for column in BURST_COLUMNS})
+                          .reset_index())
+
+    addresses = AddressDictionary()
+    signature_counts_df = encode_transactions(signature_counts_df, addresses)
+    burst_stats_df = encode_transactions(burst_stats_df, addresses)
+    burst_stats_df = burst_stats_df.assign(key=pair_keys(burst_stats_df))
+    return signature_counts_df, burst_stats_df.astype({column: 'int64' for column in BURST_COLUMNS}), addresses
+
+'''
+Count the windows of [start, end) with `workers` threads, reporting progress as windows
+complete, and return the merged counts. `read_window(start, end)` yields the record batches
+of a window. The transactions of a window are folded into `features` once every window
+before it is, so the store only ever folds later blocks.
+'''
+def count_windows(read_window, start, end, window=BACKFILL_WINDOW, workers=BACKFILL_WORKERS, checkpoints=None,
+                  features=NO_FEATURES):
+    windows = split_windows(start, end, window)
+    checkpoints = checkpoints or NO_CHECKPOINTS
+    started = time.perf_counter()
+
+    def count(bounds):
+        name = f"window.{bounds[0].strftime('%Y%m%dT%H%M%S')}"
+        pending = []
+        with stage('explore.backfill.window') as current:
+            counts = current.output(checkpoints.stage(name, lambda: count_window(read_window, *bounds, features,
+                                                                                 pending)))
+        return counts, pending
+
+    results, observed, folded = [], {}, 0
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(windows)))) as pool:
+        futures = {pool.submit(count, bounds): bounds for bounds in windows}
+        for done, future in enumerate(as_completed(futures), 1):
+            window_start, window_end = futures[future]
+            counts, observed[futures[future]] = future.result()
+            results.append(counts)
+            while folded < len(windows) and windows[folded] in observed:
+                with stage('explore.update_features'):
+                    features.update(observed.pop(windows[folded]))
+                folded += 1
+            elapsed = time.perf_counter() - started
+            print(f'backfilled window {done}/{len(windows)} {window_start} - {window_end}: '
+                  f'{len(results[-1][0].index)} signature counts, {elapsed:.0f}s elapsed, '
+                  f'{elapsed / done * (len(windows) - done):.0f}s left')
+
+    with stage('explore.backfill.merge', [counts_df for counts_df, _ in results]) as current:
+        return current.output(merge_windows(results))
+
+'''
+Explore [start, end) and append the results to 1_attributions. A rerun of the same range and
+window length resumes from the counted windows, the tagged tables and the completed writes.
+'''
+def backfill(start, end, window=BACKFILL_WINDOW, workers=BACKFILL_WORKERS, checkpoint_dir=CHECKPOINT_DIR,
+             read_window=None, features=None):
+    start, end = utc_timestamp(start), utc_timestamp(end)
+    features = FeatureStore() if features is None else features
+    checkpoints = Checkpoints('explore_backfill', window=f'{start.isoformat()}/{end.isoformat()}',
+                              settings={'window': window}, directory=checkpoint_dir)
+    if read_window is None:
+        from google.cloud import bigquery_storage
+        read_window = query_window(main.get_client(), bigquery_storage.BigQueryReadClient())
+
+    def tag():
+        signature_counts_df, burst_stats_df, addresses = count_windows(read_window, start, end, window, workers,
+                                                                       checkpoints, features)
+        creations_df = main.get_contract_creations(start - CREATIONS_LEAD_IN, end)
+        return main.explore_signature_counts(signature_counts_df, burst_stats_df, addresses, creations_df=creations_df)
+
+    results = checkpoints.stage('tag', tag)
+    main.write_tables(*results, checkpoints)
+    checkpoints.clear()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='explore the transactions of a past date range')
+    parser.add_argument('--start', required=True)
+    parser.add_argument('--end', required=True)
+    parser.add_argument('--window', default=BACKFILL_WINDOW)
+    parser.add_argument('--workers', type=int, default=BACKFILL_WORKERS)
+    parser.add_argument('--checkpoint-dir', default=CHECKPOINT_DIR)
+    args = parser.parse_args()
+
+    begin_run()
+    backfill(args.start, args.end, args.window, args.workers, args.checkpoint_dir)
+    write_report('explore_backfill')
+    main.QUERY_CACHE.report()
@@ -0,0 +1,124 @@
+'''
+Stage checkpoints, kept identical in bot_attribution_explore and bot_attribution_analyze.
+
+A run saves the frames every stage produced as Parquet under a directory fingerprinted by
+the run, its input window, its settings and the version of the code. An attempt that fails
+or times out is retried from the last completed stage instead of from the BigQuery fetch,
+and side effects such as writes are marked done so a retry never applies them twice.
+The directory is removed once the run completes.
+'''
+import datetime
+import hashlib
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.fs as fs
+import pyarrow.parquet as pq
+from metrics import stage
+
+
+# directory (local path or gs://) for stage checkpoints, unset to run without them
+CHECKPOINT_DIR = os.environ.get('CHECKPOINT_DIR')
+# runs over the same window resume each other; runs that read everything up to now default to the UTC day
+CHECKPOINT_WINDOW = os.environ.get('CHECKPOINT_WINDOW')
+
+'''
+Hash of the Python sources next to this module, so that a deploy never resumes the
+checkpoints of different code.
+'''
+def code_version(directory=os.path.dirname(os.path.abspath(__file__))):
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.py'):
+            with open(os.path.join(directory, name), 'rb') as source:
+                digest.update(name.encode() + source.read())
+    return digest.hexdigest()[:12]
+
+def default_window():
+    return CHECKPOINT_WINDOW or datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d')
+
+class Checkpoints:
+    def __init__(self, run_name, window=None, settings=None, directory=CHECKPOINT_DIR):
+        self.run_name = run_name
+        self.enabled = bool(directory)
+        if not self.enabled:
+            return
+
+        key = json.dumps({'run': run_name, 'window': str(window or default_window()), 'settings': settings or {},
+                          'code': code_version()}, sort_keys=True, default=str)
+        if '://' in directory:
+            self.filesystem, root = fs.FileSystem.from_uri(directory)
+        else:
+            self.filesystem, root = fs.LocalFileSystem(), os.path.abspath(directory)
+        self.path = f"{root}/{run_name}-{hashlib.sha1(key.encode()).hexdigest()[:16]}"
+        self.filesystem.create_dir(self.path)
+
+    def _marker(self, name):
+        return f'{self.path}/{name}.json'
+
+    def done(self, name):
+        return self.enabled and self.filesystem.get_file_info(self._marker(name)).type == fs.FileType.File
+
+    '''
+    The frames a completed stage saved, in the shape they were saved in, or None.
+    '''
+    def load(self, name):
+        if not self.done(name):
+            return None
+        with self.filesystem.open_input_stream(self._marker(name)) as source:
+            marker = json.loads(source.read())
+
+        with stage(f'{self.run_name}.checkpoint.load.{name}') as current:
+            frames = current.output([pq.read_table(f'{self.path}/{name}-{i}.parquet', filesystem=self.filesystem)
+                                       .to_pandas() for i in range(marker['frames'])])
+        print(f'resumed {name} from checkpoint {self.path}')
+        return tuple(frames) if marker['tuple'] else frames[0]
+
+    '''
+    Save a stage's frame or tuple of frames. The marker is written last, so a stage whose
+    save was interrupted counts as not completed.
+    '''
+    def save(self, name, result):
+        if not self.enabled or result is None:
+            return result
+        frames = list(result) if isinstance(result, tuple) else [result]
+
+        with stage(f'{self.run_name}.checkpoint.save.{name}', frames):
+            for i, df in enumerate(frames):
+                pq.write_table(pa.Table.from_pandas(df, preserve_index=False),
+                               f'{self.path}/{name}-{i}.parquet', filesystem=self.filesystem)
+            self._mark(name, {'frames': len(frames), 'tuple': isinstance(result, tuple)})
+        return result
+
+    def _mark(self, name, marker):
+        with self.filesystem.open_output_stream(self._marker(name)) as sink:
+            sink.write(json.dumps(marker).encode())
+
+    '''
+    The frames of a completed stage, or compute and save them.
+    '''
+    def stage(self, name, compute):
+        result = self.load(name)
+        return result if result is not None else self.save(name, compute())
+
+    '''
+    Run a side effect, such as a write, unless a previous attempt completed it.
+    '''
+    def once(self, name, action):
+        if self.done(name):
+            print(f'skipped {name}, completed by a previous attempt')
+            return None
+        result = action()
+        if self.enabled:
+            self._mark(name, {'frames': 0, 'tuple': False})
+        return result
+
+    '''
+    Remove the checkpoints of a completed run.
+    '''
+    def clear(self):
+        if self.enabled:
+            self.filesystem.delete_dir(self.path)
+
+NO_CHECKPOINTS = Checkpoints('none', directory=None)
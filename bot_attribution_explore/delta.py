@@ -0,0 +1,121 @@
+'''
+Delta writes, kept identical in bot_attribution_explore and bot_attribution_analyze.
+
+A snapshot keeps, for every row key of every 1_attributions table a stage writes, a hash of the
+content that stage last wrote for it. New outputs are diffed against it by key and content
+hash, and only new and changed rows are written; the snapshot is updated once their write
+succeeded. Explore appends and analyze merges other columns of the same tables, so each stage
+keeps its own snapshot in SNAPSHOT_DIR. Keys the other stage wrote since are passed as stale
+and written whatever the snapshot holds, e.g. the suspicious rows explore appended again,
+which analyze has to merge its tags into again. A missing snapshot writes every row, like the
+writes did before.
+'''
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.fs as fs
+import pyarrow.parquet as pq
+from metrics import stage
+
+
+# directory (local path or gs://) of the attribution state snapshots, one per stage, unset to write every row
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR')
+HASH_COLUMN = 'row_hash'
+
+def _normalized(column):
+    if pd.api.types.is_datetime64_any_dtype(column):
+        timestamps = pd.to_datetime(column, utc=True).dt.tz_localize(None)
+        return timestamps.to_numpy(dtype='datetime64[ns]').view('int64')
+    if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+        return column.astype('float64').round(6).to_numpy()
+    return column.astype(object).to_numpy()
+
+'''
+64 bit hash of the `columns` of every row. Values are normalized first (timestamps to UTC
+nanoseconds, numbers to float64 rounded to 6 decimals, the rest to objects), so a frame read
+back from a checkpoint or computed with other dtypes hashes the same.
+'''
+def content_hashes(df, columns):
+    normalized = pd.DataFrame({column: _normalized(df[column]) for column in columns}, index=df.index)
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+class Delta:
+    def __init__(self, table, rows, state_df, new, changed, skipped):
+        self.table = table
+        self.rows = rows
+        self.state_df = state_df
+        self.new = new
+        self.changed = changed
+        self.skipped = skipped
+
+    def report(self):
+        counts = {'table': self.table, 'new': self.new, 'changed': self.changed, 'skipped': self.skipped}
+        print(json.dumps({'severity': 'INFO', 'message': 'delta write', **counts}))
+        return counts
+
+class Snapshot:
+    def __init__(self, stage_name, directory=SNAPSHOT_DIR):
+        self.stage_name = stage_name
+        self.enabled = bool(directory)
+        if not self.enabled:
+            return
+        if '://' in directory:
+            self.filesystem, root = fs.FileSystem.from_uri(directory)
+        else:
+            self.filesystem, root = fs.LocalFileSystem(), os.path.abspath(directory)
+        self.path = f'{root}/{stage_name}'
+        self.filesystem.create_dir(self.path)
+
+    def _file(self, table):
+        return f'{self.path}/{table}.parquet'
+
+    '''
+    The keys and content hashes last written to `table`.
+    '''
+    def load(self, table, keys):
+        if self.filesystem.get_file_info(self._file(table)).type != fs.FileType.File:
+            return pd.DataFrame({**{key: pd.Series(dtype=object) for key in keys},
+                                 HASH_COLUMN: pd.Series(dtype='uint64')})
+        return pq.read_table(self._file(table), filesystem=self.filesystem).to_pandas()
+
+    '''
+    The rows of df that are new or whose `columns` changed since the snapshot, by `keys`, and
+    the rows of the `stale` keys. Without a snapshot every row is new.
+    '''
+    def diff(self, table, df, keys, columns, stale=None):
+        if not self.enabled or df.empty:
+            return Delta(table, df, None, len(df.index), 0, 0)
+
+        with stage(f'delta.diff.{self.stage_name}.{table}', df) as current:
+            hashed = df[keys].astype(object).assign(**{HASH_COLUMN: content_hashes(df, columns)})
+            # the last row of a key is what the table holds for it once the write completed
+            state_df = hashed.drop_duplicates(keys, keep='last')
+            # nullable, a float column would round the hashes of keys missing from the snapshot
+            snapshot_df = self.load(table, keys).astype({**{key: object for key in keys}, HASH_COLUMN: 'UInt64'})
+            previous = state_df[keys].merge(snapshot_df, on=keys, how='left')[HASH_COLUMN]
+            known = previous.notna().to_numpy()
+            unchanged = previous.eq(state_df[HASH_COLUMN].to_numpy()).fillna(False).to_numpy(dtype=bool)
+            if stale is not None and not stale.empty:
+                stale_keys = stale[keys].astype(object).drop_duplicates().assign(stale=True)
+                unchanged &= state_df[keys].merge(stale_keys, on=keys, how='left')['stale'].isna().to_numpy()
+
+            written = state_df.loc[~unchanged, keys].assign(written=True)
+            write = hashed[keys].merge(written, on=keys, how='left')['written'].notna().to_numpy()
+            rows = current.output(df[write])
+            return Delta(table, rows, state_df[~unchanged], int((~known).sum()), int((known & ~unchanged).sum()),
+                         int(unchanged.sum()))
+
+    '''
+    Record the rows of a delta as written. Call it once their write succeeded.
+    '''
+    def commit(self, delta, keys):
+        if not self.enabled or delta.state_df is None or delta.state_df.empty:
+            return
+        state_df = pd.concat([self.load(table=delta.table, keys=keys).astype({key: object for key in keys}),
+                              delta.state_df], ignore_index=True).drop_duplicates(keys, keep='last')
+        pq.write_table(pa.Table.from_pandas(state_df.astype({HASH_COLUMN: 'uint64'}), preserve_index=False),
+                       self._file(delta.table), filesystem=self.filesystem)
+
+NO_SNAPSHOT = Snapshot('none', directory=None)
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+ADDRESS_COLUMNS = ['from_address_hash', 'to_address_hash', 'caller', 'created_contract_address_hash']
+SELECTOR_COLUMN = 'signature'
+# inputs without a 4 byte selector (plain transfers) are <NA> and written back as '0x'
+NO_SELECTOR = '0x'
+
+def _arrow(values):
+    if isinstance(values, pa.ChunkedArray):
+        return values.combine_chunks()
+    if isinstance(values, pa.Array):
+        return values
+    # string columns of pandas read from several Arrow chunks convert to a chunked array
+    return _arrow(pa.array(values, type=pa.string(), from_pandas=True))
+
+'''
+Dictionary encode a string column with Arrow. Returns the distinct values and, per row,
+the position of its value in them, with nulls pointing one past the end.
+'''
+def _dictionary(values):
+    encoded = pc.dictionary_encode(_arrow(values))
+    uniques = encoded.dictionary.to_pylist()
+    return uniques, np.asarray(encoded.indices.fill_null(len(uniques)))
+
+'''
+Dictionary encoding of hex addresses into dense Int32 ids, kept for one run so every
+frame of the run shares the same ids. Only the distinct addresses of each column go
+through the Python dictionary; rows are mapped with one take.
+'''
+class AddressDictionary:
+    def __init__(self):
+        self.ids = {}
+        self.addresses = []
+        self._decoder = None
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def encode(self, values):
+        uniques, indices = _dictionary(values)
+        ids = np.zeros(len(uniques) + 1, dtype=np.int32)
+        for position, address in enumerate(uniques):
+            address_id = self.ids.get(address)
+            if address_id is None:
+                address_id = self.ids[address] = len(self.addresses)
+                self.addresses.append(address)
+                self._decoder = None
+            ids[position] = address_id
+
+        return pd.arrays.IntegerArray(ids[indices], indices == len(uniques))
+
+    def decode(self, ids):
+        if self._decoder is None:
+            self._decoder = np.array(self.addresses + [None], dtype=object)
+        return self._decoder[pd.array(ids, dtype='Int32').to_numpy(dtype=np.int64, na_value=-1)]
+
+def _selector(value):
+    try:
+        return int(value[2:], 16) if len(value) == 10 and value.startswith('0x') else None
+    except ValueError:
+        return None
+
+'''
+4 byte selectors (`0x` + 8 hex digits, e.g. a signature or the start of `input`) as UInt32.
+'''
+def encode_selectors(values):
+    uniques, indices = _dictionary(pc.utf8_slice_codeunits(_arrow(values), 0, 10))
+
+    selectors = [_selector(value) for value in uniques] + [None]
+    missing = np.array([selector is None for selector in selectors])
+    selectors = np.array([selector or 0 for selector in selectors], dtype=np.uint32)
+    return pd.arrays.IntegerArray(selectors[indices], missing[indices])
+
+def decode_selectors(selectors):
+    selectors = pd.array(selectors, dtype='UInt32').to_numpy(dtype=np.int64, na_value=-1)
+    uniques, positions = np.unique(selectors, return_inverse=True)
+    text = np.array([NO_SELECTOR if value < 0 else '0x%08x' % value for value in uniques], dtype=object)
+    return text[positions.ravel()]
+
+'''
+Encode the address and selector (`signature` or `input`) columns of raw transactions,
+given as a pandas frame or an Arrow record batch. Other columns are kept as they are.
+'''
+def encode_transactions(transactions, addresses):
+    if isinstance(transactions, pd.DataFrame):
+        names = list(transactions.columns)
+        column = lambda name: transactions[name]
+        rest = transactions.reset_index(drop=True)
+    else:
+        names = transactions.schema.names
+        column = transactions.column
+        kept = [name for name in names if name not in ADDRESS_COLUMNS + [SELECTOR_COLUMN, 'input']]
+        rest = pa.RecordBatch.from_arrays([transactions.column(name) for name in kept], names=kept).to_pandas() \
+            if kept else pd.DataFrame(index=pd.RangeIndex(transactions.num_rows))
+
+    encoded = {}
+    for name in names:
+        if name in ADDRESS_COLUMNS:
+            encoded[name] = addresses.encode(column(name))
+        elif name in (SELECTOR_COLUMN, 'input'):
+            encoded[SELECTOR_COLUMN] = encode_selectors(column(name))
+
+    return rest.drop(columns=[name for name in ('input',) if name in rest]).assign(**encoded)
+
+'''
+Decode the address and selector columns back to hex, for writing or for queries.
+'''
+def decode_frame(df, addresses):
+    decoded = {name: addresses.decode(df[name]) for name in ADDRESS_COLUMNS if name in df}
+    if SELECTOR_COLUMN in df:
+        decoded[SELECTOR_COLUMN] = decode_selectors(df[SELECTOR_COLUMN])
+    return df.assign(**decoded)
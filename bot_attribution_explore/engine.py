@@ -0,0 +1,107 @@
+import pandas as pd
+from graph import PropagationGraph, GRAPH_DEPTH
+
+
+SIGNATURE_KEYS = ['from_address_hash', 'to_address_hash', 'signature']
+TAG_DTYPE = pd.CategoricalDtype(['suspicious', 'bot'])
+
+'''
+Tag every row with a categorical label and a float32 confidence level (a scalar or
+one value per row).
+'''
+def tag_columns(df, tag, confidence_level):
+    return df.assign(tag=pd.Categorical([tag] * len(df.index), dtype=TAG_DTYPE),
+                     confidence_level=pd.Series(confidence_level, index=df.index, dtype='float32'))
+
+'''
+Cast the tag and confidence_level columns produced by sqldf to their typed form.
+'''
+def typed_tags(df):
+    return df.astype({'tag': TAG_DTYPE, 'confidence_level': 'float32'})
+
+'''
+Confidence levels as the FLOAT64 the 1_attributions tables hold, rounded to the 6 decimals a
+float32 keeps, so 0.7 is written as 0.7 rather than 0.699999988079071.
+'''
+def written_confidence(confidence_level):
+    return confidence_level.astype('float64').round(6)
+
+'''
+Count invocations per (caller, contract, signature). This is the only pass over the raw
+transactions; everything explore() tags afterwards is derived from these counts.
+The selector is cut from `input` unless a `signature` column is already present.
+'''
+def count_signatures(transactions_df):
+    if 'signature' not in transactions_df:
+        transactions_df = transactions_df.assign(signature=transactions_df['input'].str.slice(0, 10))
+
+    return (transactions_df
+                .groupby(SIGNATURE_KEYS, sort=False, dropna=False)
+                .agg(invocations=('block_timestamp', 'size'),
+                     block_timestamp=('block_timestamp', 'max'))
+                .reset_index())
+
+'''
+Combine partial signature counts (e.g. from several batches of transactions) into one.
+'''
+def merge_signature_counts(signature_counts):
+    return (pd.concat(signature_counts, ignore_index=True)
+                .groupby(SIGNATURE_KEYS, sort=False, dropna=False)
+                .agg(invocations=('invocations', 'sum'),
+                     block_timestamp=('block_timestamp', 'max'))
+                .reset_index())
+
+'''
+Tag every counted signature, its contract and its callers as suspicious.
+Produces the same frames as the sqldf queries in explore().
+'''
+def tag_signature_counts(signature_counts_df, updated_at):
+    signatures_df = (signature_counts_df
+                        .groupby(['to_address_hash', 'signature'], sort=False, dropna=False)
+                        .agg(invocations=('invocations', 'sum'),
+                             block_timestamp=('block_timestamp', 'max'))
+                        .reset_index()
+                        .assign(updated_at=updated_at)
+                        .sort_values('invocations', ascending=False))
+    signatures_df = tag_columns(signatures_df, 'suspicious', 1)[['to_address_hash', 'signature', 'invocations', 'tag',
+                                                               'confidence_level', 'block_timestamp', 'updated_at']]
+
+    contracts_df = (signature_counts_df
+                        .groupby('to_address_hash', sort=False, dropna=False)['block_timestamp'].max()
+                        .reset_index()
+                        .assign(updated_at=updated_at))
+    contracts_df = tag_columns(contracts_df, 'suspicious', 1)[['to_address_hash', 'tag', 'confidence_level',
+                                                              'block_timestamp', 'updated_at']]
+
+    callers_df = (signature_counts_df
+                        .groupby(['from_address_hash', 'to_address_hash'], sort=False, dropna=False)['block_timestamp'].max()
+                        .reset_index()
+                        .rename(columns={'from_address_hash': 'caller'})
+                        .assign(updated_at=updated_at)
+                        .sort_values('block_timestamp'))
+    callers_df = tag_columns(callers_df, 'suspicious', 1)[['caller', 'to_address_hash', 'tag', 'confidence_level',
+                                                          'block_timestamp', 'updated_at']]
+
+    return contracts_df, signatures_df, callers_df
+
+'''
+Add the contracts related to suspicious contracts through their creators: suspicion travels
+from a contract to its creator and from a creator to every contract it created, losing
+confidence on every hop (see graph.py). Keeps the latest row per contract.
+'''
+def add_creator_contracts(contracts_df, creations_df, depth=GRAPH_DEPTH):
+    graph = PropagationGraph()
+    graph.add_edges('address', creations_df['created_contract_address_hash'],
+                    'address', creations_df['from_address_hash'], both_ways=True)
+    graph.propagate([('address', contracts_df['to_address_hash'], contracts_df['confidence_level'])], depth)
+
+    confidence = graph.node_confidence('address', creations_df['created_contract_address_hash'])
+    creator_contracts_df = (creations_df[confidence > 0]
+                                .rename(columns={'created_contract_address_hash': 'to_address_hash'})
+                                .assign(updated_at=pd.NaT))
+    creator_contracts_df = tag_columns(creator_contracts_df, 'suspicious', confidence[confidence > 0])
+
+    contracts_df = pd.concat([contracts_df, creator_contracts_df[contracts_df.columns]])
+    contracts_df['block_timestamp'] = pd.to_datetime(contracts_df['block_timestamp'])
+    contracts_df['updated_at'] = pd.to_datetime(contracts_df['updated_at'])
+    return contracts_df.sort_values('block_timestamp').drop_duplicates(['to_address_hash'], keep='last')
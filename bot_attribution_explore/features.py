@@ -0,0 +1,352 @@
+'''
+Per address behaviour features, kept identical in bot_attribution_explore and bot_attribution_analyze.
+
+Explore folds the transactions every run streams, full, incremental or backfill, into the
+store, analyze reads the features of many addresses at once instead of counting transactions
+again. Every address
+seen sending a transaction gets a stable id, its row in the store, with
+    tx_count, distinct_selectors, distinct_counterparties: transactions sent, and the distinct
+        signatures and contracts they called
+    interarrival_mean, interarrival_var: seconds between its consecutive transactions
+    block_gap_mean, block_gap_var: blocks between its consecutive transactions
+    periodic_gaps: gaps within PERIOD_TOLERANCE of the gap before them, last_gap the latest gap
+    first_seen_block, last_seen_block, first_seen, last_seen
+The store is a directory (local path or gs://) of Arrow IPC files, memory mapped when local,
+so bulk reads only page in the rows they take. Distinct counts stay exact with the
+(address, selector) and (address, counterparty) pairs seen so far. Every update appends one
+segment, the features of the addresses it touched and the pairs it added, so its writes grow
+with its transactions instead of with the store. The latest segment of an address holds its
+features, and past FEATURE_SEGMENTS segments the store is compacted into one. Transactions up
+to the block watermark of the latest segment were folded already and are skipped, so a
+retried run does not count them twice.
+'''
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.fs as fs
+
+
+# directory (local path or gs://) of the per address feature store, unset to keep none
+FEATURE_STORE_DIR = os.environ.get('FEATURE_STORE_DIR')
+WATERMARK_KEY = b'feature_store.block_number_watermark'
+TRANSACTION_COLUMNS = ['from_address_hash', 'to_address_hash', 'signature', 'block_timestamp', 'block_number']
+FEATURE_COLUMNS = ['tx_count', 'distinct_selectors', 'distinct_counterparties', 'interarrival_mean',
+                   'interarrival_var', 'block_gap_mean', 'block_gap_var', 'periodic_gaps', 'last_gap',
+                   'first_seen_block', 'last_seen_block', 'first_seen', 'last_seen']
+FEATURES_SCHEMA = pa.schema([('address_id', pa.int64()), ('address', pa.string()), ('tx_count', pa.int64()),
+                             ('distinct_selectors', pa.int64()), ('distinct_counterparties', pa.int64()),
+                             ('interarrival_mean', pa.float64()), ('interarrival_var', pa.float64()),
+                             ('block_gap_mean', pa.float64()), ('block_gap_var', pa.float64()),
+                             ('periodic_gaps', pa.int64()), ('last_gap', pa.float64()),
+                             ('first_seen_block', pa.int64()), ('last_seen_block', pa.int64()),
+                             ('first_seen', pa.timestamp('ns', tz='UTC')), ('last_seen', pa.timestamp('ns', tz='UTC'))])
+TIMESTAMP_DTYPE = 'datetime64[ns, UTC]'
+# a gap repeats the one before it when they differ by at most this share of it
+PERIOD_TOLERANCE = 0.1
+# the pairs distinct counts are kept with, by the id of the address
+PAIRS = {'selectors': 'signature', 'counterparties': 'to_address_hash'}
+PAIRS_SCHEMA = pa.schema([('address_id', pa.int64()), ('value', pa.string())])
+# segments appended before the store is compacted into one
+FEATURE_SEGMENTS = int(os.environ.get('FEATURE_SEGMENTS', 16))
+
+'''
+Merge two sets of inter-arrival gaps given as (count, mean, sum of squared deviations).
+'''
+def combine_gaps(count_a, mean_a, m2_a, count_b, mean_b, m2_b):
+    count = count_a + count_b
+    delta = mean_b - mean_a
+    weight = np.divide(count_b, count, out=np.zeros(len(count)), where=count > 0)
+    mean = mean_a + delta * weight
+    m2 = m2_a + m2_b + delta ** 2 * count_a * weight
+    return count, mean, m2
+
+'''
+Merge the gaps of the stored transactions of every address, the gap from its last stored
+transaction to its first new one, and the gaps between its new transactions. Returns the
+mean and variance of all of them, NaN for addresses with a single transaction.
+'''
+def merge_gaps(old_count, old_mean, old_var, boundary, new_count, new_mean, new_m2):
+    old_gaps = np.maximum(old_count - 1, 0)
+    count, mean, m2 = combine_gaps(old_gaps, np.nan_to_num(old_mean), np.nan_to_num(old_var) * old_gaps,
+                                   (old_count > 0).astype(int), boundary, np.zeros(len(old_count)))
+    count, mean, m2 = combine_gaps(count, mean, m2, new_count - 1, new_mean, new_m2)
+    return np.where(count > 0, mean, np.nan), np.where(count > 0, m2 / np.maximum(count, 1), np.nan)
+
+'''
+Whether every gap repeats the gap before it, False where either is missing.
+'''
+def repeats(previous, gaps):
+    with np.errstate(invalid='ignore'):
+        return np.abs(gaps - previous) <= PERIOD_TOLERANCE * previous
+
+def _seconds(timestamps):
+    return pd.to_datetime(timestamps, utc=True).to_numpy(dtype='datetime64[us]').view('int64') / 1e6
+
+'''
+Features of the new transactions of every address on their own, by address id, from one
+sort of the transactions by address and time and one diff of the sorted arrays.
+'''
+def batch_features(transactions_df):
+    ids = transactions_df['address_id'].to_numpy()
+    nanoseconds = transactions_df['block_timestamp'].to_numpy(dtype='datetime64[ns]').view('int64')
+    blocks = transactions_df['block_number'].to_numpy(dtype='int64')
+    order = np.lexsort((blocks, nanoseconds, ids))
+    ids, nanoseconds, blocks = ids[order], nanoseconds[order], blocks[order]
+
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    ends = np.r_[starts[1:], len(ids)] - 1
+    counts = ends - starts + 1
+    groups = np.repeat(np.arange(len(starts)), counts)
+
+    def gap_stats(values):
+        gaps = np.diff(values.astype('float64'), prepend=np.nan)
+        gaps[starts] = np.nan
+        mean = np.add.reduceat(np.nan_to_num(gaps), starts) / np.maximum(counts - 1, 1)
+        m2 = np.add.reduceat(np.nan_to_num((gaps - mean[groups]) ** 2), starts)
+        return gaps, mean, m2
+
+    gaps, gap_mean, gap_m2 = gap_stats(nanoseconds / 1e9)
+    _, block_gap_mean, block_gap_m2 = gap_stats(blocks)
+    several = counts > 1
+    return pd.DataFrame({
+        'tx_count': counts,
+        'gap_mean': gap_mean, 'gap_m2': gap_m2, 'block_gap_mean': block_gap_mean, 'block_gap_m2': block_gap_m2,
+        'periodic_gaps': np.add.reduceat(repeats(np.r_[np.nan, gaps[:-1]], gaps).astype('int64'), starts),
+        'first_gap': np.where(several, gaps[np.minimum(starts + 1, ends)], np.nan),
+        'last_gap': np.where(several, gaps[ends], np.nan),
+        'first_seen_block': blocks[starts], 'last_seen_block': np.maximum.reduceat(blocks, starts),
+        'first_seen': pd.to_datetime(nanoseconds[starts], utc=True),
+        'last_seen': pd.to_datetime(nanoseconds[ends], utc=True),
+    }, index=ids[starts])
+
+class FeatureStore:
+    def __init__(self, directory=FEATURE_STORE_DIR):
+        self.enabled = bool(directory)
+        self.pending = []
+        self.watermark = -1
+        self.sequences = []
+        # the rows of every segment, the row holding the features of every address id, and its address
+        self.segments = FEATURES_SCHEMA.empty_table()
+        self.positions = np.zeros(0, dtype=np.int64)
+        self.addresses = pa.array([], type=pa.string())
+        if not self.enabled:
+            return
+        if '://' in directory:
+            self.filesystem, self.path = fs.FileSystem.from_uri(directory)
+        else:
+            self.filesystem, self.path = fs.LocalFileSystem(), os.path.abspath(directory)
+        self.local = isinstance(self.filesystem, fs.LocalFileSystem)
+        self.filesystem.create_dir(self.path)
+
+        # a segment counts once its features are written, pairs of a run failing before that are left out
+        self.sequences = self._files().get('features', [])
+        if self.sequences:
+            segments = [self._read('features', sequence) for sequence in self.sequences]
+            self.watermark = int(segments[-1].schema.metadata[WATERMARK_KEY])
+            self._index(pa.concat_tables(segment.replace_schema_metadata(None) for segment in segments))
+
+    def _file(self, name, sequence):
+        return f'{self.path}/{name}-{sequence:08d}.arrow'
+
+    '''
+    The sequence numbers of the segment files of every name, in order.
+    '''
+    def _files(self):
+        files = {}
+        for info in self.filesystem.get_file_info(fs.FileSelector(self.path)):
+            name, _, sequence = info.base_name[:-len('.arrow')].rpartition('-')
+            if info.base_name.endswith('.arrow') and sequence.isdigit():
+                files.setdefault(name, []).append(int(sequence))
+        return {name: sorted(sequences) for name, sequences in files.items()}
+
+    def _read(self, name, sequence):
+        path = self._file(name, sequence)
+        source = pa.memory_map(path) if self.local else self.filesystem.open_input_file(path)
+        return pa.ipc.open_file(source).read_all()
+
+    # local files are written aside and moved in place, GCS objects only appear once fully uploaded
+    def _write(self, name, sequence, table):
+        path = self._file(name, sequence)
+        partial = f'{path}.partial' if self.local else path
+        with self.filesystem.open_output_stream(partial) as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        if partial != path:
+            self.filesystem.move(partial, path)
+
+    def _index(self, segments):
+        self.segments = segments
+        ids = segments.column('address_id').to_numpy()
+        # the last row of every id, later segments come later
+        unique, last = np.unique(ids[::-1], return_index=True)
+        self.positions = np.zeros(len(unique), dtype=np.int64)
+        self.positions[unique] = len(ids) - 1 - last
+        self.addresses = segments.column('address').take(pa.array(self.positions)).combine_chunks()
+
+    '''
+    The current features of stored address ids, as a frame indexed by them.
+    '''
+    def _features(self, ids):
+        features_df = self.segments.take(pa.array(self.positions[ids], type=pa.int64())).to_pandas()
+        features_df = features_df.astype({'first_seen': TIMESTAMP_DTYPE, 'last_seen': TIMESTAMP_DTYPE})
+        return features_df.set_index(pd.Index(ids))
+
+    def __len__(self):
+        return len(self.addresses)
+
+    '''
+    Pass record batches of transactions through, keeping the ones above the watermark for update(),
+    in `pending` when given, e.g. by runs reading windows concurrently and folding them in order.
+    '''
+    def observe(self, batches, pending=None):
+        pending = self.pending if pending is None else pending
+        for batch in batches:
+            if self.enabled:
+                new = batch.filter(pc.greater(batch.column('block_number'), self.watermark))
+                if new.num_rows:
+                    pending.append(pa.RecordBatch.from_arrays([new.column(column) for column in TRANSACTION_COLUMNS],
+                                                                   names=TRANSACTION_COLUMNS))
+            yield batch
+
+    '''
+    Fold the observed transactions, or the `pending` ones observe() kept aside, into the store
+    and append them as a segment. Returns the number of addresses whose features changed.
+    '''
+    def update(self, pending=None):
+        pending = self.pending if pending is None else pending
+        if not self.enabled or not pending:
+            return 0
+        transactions_df = pa.Table.from_batches(pending).to_pandas()
+        watermark = int(transactions_df['block_number'].max())
+        transactions_df = transactions_df[transactions_df['from_address_hash'].notna()]
+        transactions_df = transactions_df.assign(
+            block_timestamp=pd.to_datetime(transactions_df['block_timestamp'], utc=True).astype(TIMESTAMP_DTYPE))
+
+        senders = pd.Index(transactions_df['from_address_hash'].unique())
+        # a float copy: without new senders the ids have no nulls and come back as a read-only view
+        sender_ids = self.ids(senders).to_numpy(zero_copy_only=False).astype('float64')
+        added = np.isnan(sender_ids)
+        sender_ids[added] = len(self) + np.arange(added.sum())
+        sender_ids = sender_ids.astype(np.int64)
+        transactions_df = transactions_df.assign(
+            address_id=sender_ids[senders.get_indexer(transactions_df['from_address_hash'])])
+
+        touched = batch_features(transactions_df)
+        ids = touched.index.to_numpy()
+        stored = ids < len(self)
+        new_df = pd.DataFrame({'address_id': sender_ids[added], 'address': senders[added], 'tx_count': 0,
+                               'periodic_gaps': 0, 'distinct_selectors': 0, 'distinct_counterparties': 0},
+                              index=sender_ids[added])
+        current = pd.concat([self._features(ids[stored]), new_df]).loc[ids]
+        features_df = current.copy()
+        old_count = current['tx_count'].to_numpy()
+        new_count = touched['tx_count'].to_numpy()
+        # the gaps from the last stored transaction, new blocks come after it
+        boundary = np.where(stored, (_seconds(touched['first_seen']) - _seconds(current['last_seen'])).clip(0), 0)
+        block_boundary = np.where(stored, (touched['first_seen_block'] - current['last_seen_block']).clip(0), 0)
+
+        features_df['tx_count'] = old_count + new_count
+        features_df['interarrival_mean'], features_df['interarrival_var'] = merge_gaps(
+            old_count, current['interarrival_mean'].to_numpy(dtype='float64'),
+            current['interarrival_var'].to_numpy(dtype='float64'), boundary,
+            new_count, touched['gap_mean'].to_numpy(), touched['gap_m2'].to_numpy())
+        features_df['block_gap_mean'], features_df['block_gap_var'] = merge_gaps(
+            old_count, current['block_gap_mean'].to_numpy(dtype='float64'),
+            current['block_gap_var'].to_numpy(dtype='float64'), block_boundary,
+            new_count, touched['block_gap_mean'].to_numpy(), touched['block_gap_m2'].to_numpy())
+        boundary = np.where(stored, boundary, np.nan)
+        features_df['periodic_gaps'] = (current['periodic_gaps'].to_numpy() + touched['periodic_gaps'].to_numpy()
+                                        + repeats(current['last_gap'].to_numpy(dtype='float64'), boundary)
+                                        + repeats(boundary, touched['first_gap'].to_numpy()))
+        features_df['last_gap'] = touched['last_gap'].fillna(pd.Series(boundary, index=ids))
+        features_df['first_seen_block'] = current['first_seen_block'].fillna(touched['first_seen_block'])
+        features_df['last_seen_block'] = touched['last_seen_block']
+        features_df['first_seen'] = current['first_seen'].fillna(touched['first_seen'])
+        features_df['last_seen'] = touched['last_seen']
+
+        sequence = (self.sequences[-1] if self.sequences else 0) + 1
+        for name, column in PAIRS.items():
+            pairs_df = self._new_pairs(name, column, transactions_df, ids)
+            counts = pairs_df.groupby('address_id').size()
+            features_df.loc[counts.index, f'distinct_{name}'] += counts.to_numpy()
+            self._write(name, sequence, pa.Table.from_pandas(pairs_df, schema=PAIRS_SCHEMA, preserve_index=False))
+
+        # written last, the features make the segment count
+        segment = pa.Table.from_pandas(features_df, schema=FEATURES_SCHEMA, preserve_index=False)
+        self._write('features', sequence, segment.replace_schema_metadata({WATERMARK_KEY: str(watermark).encode()}))
+        self.sequences.append(sequence)
+        self._index(pa.concat_tables([self.segments, segment]))
+        self.watermark = watermark
+        pending.clear()
+        print(f'updated the features of {len(ids)} addresses, {int(added.sum())} new, up to block {watermark}')
+        if len(self.sequences) > FEATURE_SEGMENTS:
+            self.compact()
+        return len(ids)
+
+    '''
+    The stored (address id, value) pairs of `name`, of the given address ids or of all.
+    '''
+    def _pairs(self, name, ids=None):
+        tables = [self._read(name, sequence) for sequence in self.sequences
+                  if self.filesystem.get_file_info(self._file(name, sequence)).type == fs.FileType.File]
+        pairs = pa.concat_tables(tables) if tables else PAIRS_SCHEMA.empty_table()
+        if ids is not None:
+            pairs = pairs.filter(pc.is_in(pairs.column('address_id'), value_set=pa.array(ids, pa.int64())))
+        return pairs
+
+    '''
+    The new (address id, value) pairs of `column`. Only the stored pairs of the addresses the
+    run touched are read.
+    '''
+    def _new_pairs(self, name, column, transactions_df, ids):
+        new_df = (transactions_df[['address_id', column]].dropna().drop_duplicates()
+                      .rename(columns={column: 'value'}).astype({'address_id': 'int64', 'value': object}))
+        stored_df = self._pairs(name, ids).to_pandas().astype({'value': object})
+        added = new_df.merge(stored_df, on=['address_id', 'value'], how='left', indicator=True)
+        return added.loc[added['_merge'] == 'left_only', ['address_id', 'value']]
+
+    '''
+    Rewrite the segments as one, the latest features of every address and all pairs, and
+    remove the files of the older segments.
+    '''
+    def compact(self):
+        if not self.enabled or not self.sequences:
+            return
+        sequence = self.sequences[-1] + 1
+        # a compaction stopped before removing the older files leaves their pairs twice
+        for name in PAIRS:
+            self._write(name, sequence, self._pairs(name).group_by(['address_id', 'value']).aggregate([]))
+        features = self.segments.take(pa.array(self.positions))
+        self._write('features', sequence, features.replace_schema_metadata({WATERMARK_KEY: str(self.watermark).encode()}))
+
+        for name, sequences in self._files().items():
+            for older in sequences:
+                if older < sequence:
+                    self.filesystem.delete_file(self._file(name, older))
+        self.sequences = [sequence]
+        self._index(features)
+        print(f'compacted the features of {len(self)} addresses into one segment')
+
+    '''
+    The stable ids of `addresses`, <NA> for addresses the store has not seen.
+    '''
+    def ids(self, addresses):
+        values = pa.array(pd.Series(addresses, dtype=object), type=pa.string(), from_pandas=True)
+        return pc.index_in(values, value_set=self.addresses)
+
+    '''
+    The features of `addresses` in bulk, one row per address in their order, with missing
+    features for addresses the store has not seen.
+    '''
+    def lookup(self, addresses):
+        addresses = pd.Series(addresses, dtype=object).reset_index(drop=True)
+        ids = self.ids(addresses)
+        positions = pa.array(self.positions).take(ids) if len(self) else pa.nulls(len(ids), pa.int64())
+        features_df = self.segments.select(FEATURE_COLUMNS).take(positions).to_pandas()
+        features_df.insert(0, 'address_id', pd.array(ids.to_numpy(zero_copy_only=False), dtype='Int64'))
+        features_df.insert(0, 'address', addresses)
+        return features_df
+
+NO_FEATURES = FeatureStore(None)
@@ -0,0 +1,87 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from engine import merge_signature_counts
+from ingest import TRANSACTION_COLUMNS, stream_signature_counts
+
+
+WATERMARK_COLUMN = 'block_number'
+WATERMARK_KEY = b'block_number_watermark'
+
+# the 3 day bound keeps partition pruning and the first run identical to a full run
+incremental_query = """
+    select
+        from_address_hash,
+        to_address_hash,
+        SUBSTR(`input`, 1, 10) as signature,
+        block_timestamp,
+        block_number
+    from `celo-testnet-production.1_raw.transactions`
+    where block_timestamp > TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL -3 DAY)
+    and block_number > {watermark}
+"""
+
+INCREMENTAL_COLUMNS = TRANSACTION_COLUMNS + [WATERMARK_COLUMN]
+
+'''
+Load the running signature counts and the last block folded into them. The state is a
+Parquet file (local path or gs:// URL) with the watermark kept in its metadata.
+'''
+def load_state(path):
+    try:
+        table = pq.read_table(path)
+    except FileNotFoundError:
+        return None, -1
+
+    return table.to_pandas(), int(table.schema.metadata[WATERMARK_KEY])
+
+def save_state(path, signature_counts_df, watermark):
+    table = pa.Table.from_pandas(signature_counts_df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[WATERMARK_KEY] = str(watermark).encode()
+    pq.write_table(table.replace_schema_metadata(metadata), path)
+    print(f'saved {len(signature_counts_df.index)} signature counts up to block {watermark} to {path}')
+
+def _new_batches(batches, watermark, seen):
+    for batch in batches:
+        batch = batch.filter(pc.greater(batch.column(WATERMARK_COLUMN), watermark))
+        if batch.num_rows:
+            seen.append(pc.max(batch.column(WATERMARK_COLUMN)).as_py())
+            yield batch
+
+'''
+Count only the transactions above the watermark, returning the counts and the new watermark.
+'''
+def stream_new_signature_counts(batches, watermark, detector=None, addresses=None):
+    seen = []
+    new_counts_df = stream_signature_counts(_new_batches(batches, watermark, seen), detector, addresses)
+    return new_counts_df, max(seen, default=watermark)
+
+'''
+Fold new counts into the running counts. Also returns the running counts of every
+contract the new counts touch, which is what needs to be tagged again.
+'''
+def fold_signature_counts(state_counts_df, new_counts_df):
+    if state_counts_df is None:
+        state_counts_df = new_counts_df
+    else:
+        state_counts_df = merge_signature_counts([state_counts_df, new_counts_df])
+
+    touched = state_counts_df['to_address_hash'].isin(new_counts_df['to_address_hash'])
+    # encoded ids are nullable integers, whose isin never matches <NA>
+    if new_counts_df['to_address_hash'].hasnans:
+        touched |= state_counts_df['to_address_hash'].isna()
+    touched_counts_df = state_counts_df[touched]
+    return state_counts_df, touched_counts_df
+
+'''
+Keep only the signatures and callers whose counts changed in this run.
+'''
+def changed_rows(signatures_df, callers_df, new_counts_df):
+    signature_keys = new_counts_df[['to_address_hash', 'signature']].drop_duplicates()
+    caller_keys = (new_counts_df[['from_address_hash', 'to_address_hash']]
+                       .drop_duplicates()
+                       .rename(columns={'from_address_hash': 'caller'}))
+
+    return (signatures_df.merge(signature_keys, on=['to_address_hash', 'signature']),
+            callers_df.merge(caller_keys, on=['caller', 'to_address_hash']))
@@ -0,0 +1,105 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from engine import SIGNATURE_KEYS, count_signatures, merge_signature_counts
+from encoding import encode_transactions
+
+
+TRANSACTION_COLUMNS = ['from_address_hash', 'to_address_hash', 'input', 'block_timestamp']
+
+# only the columns explore() counts on, with the selector cut server side, and the block
+# number the feature store keeps its watermark by
+signature_query = """
+    select
+        from_address_hash,
+        to_address_hash,
+        SUBSTR(`input`, 1, 10) as signature,
+        block_timestamp,
+        block_number
+    from `celo-testnet-production.1_raw.transactions`
+    where block_timestamp > TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL -3 DAY)
+"""
+
+# the same columns for the transactions of [start, end), for backfills of past windows
+window_signature_query = """
+    select
+        from_address_hash,
+        to_address_hash,
+        SUBSTR(`input`, 1, 10) as signature,
+        block_timestamp,
+        block_number
+    from `celo-testnet-production.1_raw.transactions`
+    where block_timestamp >= TIMESTAMP('{start}')
+    and block_timestamp < TIMESTAMP('{end}')
+"""
+
+def _select(batch, columns):
+    return pa.RecordBatch.from_arrays([batch.column(column) for column in columns], names=columns)
+
+'''
+Replace the raw input with its 4 byte selector, like the BigQuery query does.
+'''
+def project_signature(batch):
+    names = batch.schema.names
+    arrays = [pc.utf8_slice_codeunits(batch.column(name), 0, 10) if name == 'input' else batch.column(name)
+              for name in names]
+    return pa.RecordBatch.from_arrays(arrays, names=['signature' if name == 'input' else name for name in names])
+
+'''
+Stream Arrow record batches of a signature query from BigQuery.
+'''
+def query_batches(client, query_string=signature_query, bqstorage_client=None):
+    rows = client.query(query_string).result()
+    yield from rows.to_arrow_iterable(bqstorage_client=bqstorage_client)
+
+'''
+Stream record batches from a local Parquet or Arrow IPC (Feather) file holding raw
+transactions, reading only the columns explore() needs.
+'''
+def file_batches(path, batch_size=100000, columns=TRANSACTION_COLUMNS):
+    if path.endswith('.parquet'):
+        batches = pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=columns)
+    else:
+        reader = pa.ipc.open_file(pa.memory_map(path))
+        batches = (_select(reader.get_batch(i), columns)
+                   for i in range(reader.num_record_batches))
+
+    for batch in batches:
+        yield project_signature(batch)
+
+'''
+Fold record batches into per (caller, contract, signature) counts. Batch counts are merged
+into the running counts once they outgrow them, so memory follows the number of distinct
+keys rather than raw rows. A rate.RateDetector passed as `detector` sees every batch too.
+With an encoding.AddressDictionary, batches are encoded before they reach pandas.
+With a sketch.SignatureSketch, batches are only added to the sketch, which returns the
+approximate counts of the heavy hitters in bounded memory.
+'''
+def stream_signature_counts(batches, detector=None, addresses=None, sketch=None):
+    counts, pending, pending_rows, rows = [], [], 0, 0
+
+    for batch in batches:
+        rows += batch.num_rows
+        batch_df = batch.to_pandas() if addresses is None else encode_transactions(batch, addresses)
+        if detector is not None:
+            detector.add(batch_df)
+        if sketch is not None:
+            sketch.add(batch_df)
+            continue
+        batch_counts_df = count_signatures(batch_df)
+        pending.append(batch_counts_df)
+        pending_rows += len(batch_counts_df.index)
+
+        if pending_rows >= sum(len(df.index) for df in counts):
+            counts = [merge_signature_counts(counts + pending)]
+            pending, pending_rows = [], 0
+
+    if sketch is not None:
+        return sketch.signature_counts()
+    if pending:
+        counts = [merge_signature_counts(counts + pending)]
+
+    signature_counts_df = counts[0] if counts else pd.DataFrame(columns=SIGNATURE_KEYS + ['invocations', 'block_timestamp'])
+    print(f'streamed {rows} transactions into {len(signature_counts_df.index)} signature counts')
+    return signature_counts_df
@@ -1,29 +1,77 @@
-from google.cloud import bigquery
 import pandas as pd
-import pandas_gbq
-from pandasql import sqldf
 import datetime
 import time
+import os
+from engine import count_signatures, tag_signature_counts, add_creator_contracts, tag_columns, typed_tags, written_confidence
+from ingest import TRANSACTION_COLUMNS, query_batches, file_batches, stream_signature_counts
+from rate import RateDetector, transaction_burst_stats, add_burst_stats, RATE_KEYS, BURST_COLUMNS, pair_keys
+from metrics import stage, instrument, begin_run, write_report
+from encoding import AddressDictionary, encode_transactions, decode_frame
+from sketch import SignatureSketch, add_error_bounds
+from parallel import EXPLORE_WORKERS, parallel_signature_counts
+from query_cache import QUERY_CACHE, cached_client
+from checkpoint import Checkpoints, NO_CHECKPOINTS
+from delta import Snapshot
+from features import FeatureStore
+from pipeline import Pipeline
+from graph import GRAPH_DEPTH, GRAPH_DECAY
+from incremental import (incremental_query, INCREMENTAL_COLUMNS, load_state, save_state,
+                         stream_new_signature_counts, fold_signature_counts, changed_rows)
+
+
+# created by get_client() on first use and kept across warm invocations
+bqclient = None
+# 'pandas' runs explore() natively, 'sketch' only keeps approximate counts of the most invoked
+# signatures in bounded memory (see sketch.py), 'sqldf' keeps the original pandasql queries
+EXPLORE_ENGINE = os.environ.get('EXPLORE_ENGINE', 'pandas')
+# local Parquet/Arrow file of raw transactions to explore instead of BigQuery
+TRANSACTIONS_SOURCE = os.environ.get('TRANSACTIONS_SOURCE')
+# Parquet file (local or gs://) with running counts; set it to only explore blocks added since the last run
+EXPLORE_STATE_PATH = os.environ.get('EXPLORE_STATE_PATH')
 
-
-bqclient = bigquery.Client()
 contracts_schema = [{'name': 'to_address_hash', 'type': 'STRING'},
-                    {'name': 'tags', 'type': 'STRING'},
+                    {'name': 'tag', 'type': 'STRING'},
+                    {'name': 'confidence_level', 'type': 'FLOAT'},
                     {'name': 'block_timestamp', 'type': 'TIMESTAMP'},
                     {'name': 'updated_at', 'type': 'TIMESTAMP'}]
 
 callers_schema = [{'name': 'caller', 'type': 'STRING'},
                   {'name': 'to_address_hash', 'type': 'STRING'},
-                  {'name': 'tags', 'type': 'STRING'},
+                  {'name': 'tag', 'type': 'STRING'},
+                  {'name': 'confidence_level', 'type': 'FLOAT'},
                   {'name': 'block_timestamp', 'type': 'TIMESTAMP'},
-                  {'name': 'updated_at', 'type': 'TIMESTAMP'}]
+                  {'name': 'updated_at', 'type': 'TIMESTAMP'},
+                  {'name': 'max_10s_invocations', 'type': 'INTEGER'},
+                  {'name': 'max_1m_invocations', 'type': 'INTEGER'},
+                  {'name': 'max_1h_invocations', 'type': 'INTEGER'},
+                  {'name': 'bursts', 'type': 'INTEGER'}]
+
+# row keys of the explored tables, appended rows are diffed against the snapshot by them
+TABLE_KEYS = {'contracts': ['to_address_hash'],
+              'signatures': ['to_address_hash', 'signature'],
+              'callers': ['caller', 'to_address_hash']}
 
 signatures_schema = [{'name': 'to_address_hash', 'type': 'STRING'},
-                    {'name': 'tags', 'type': 'STRING'},
+                    {'name': 'tag', 'type': 'STRING'},
+                    {'name': 'confidence_level', 'type': 'FLOAT'},
                     {'name': 'signature', 'type': 'STRING'},
                     {'name': 'invocations', 'type': 'INTEGER'},
                     {'name': 'block_timestamp', 'type': 'TIMESTAMP'},
-                    {'name': 'updated_at', 'type': 'TIMESTAMP'}]
+                    {'name': 'updated_at', 'type': 'TIMESTAMP'},
+                    # only written by the sketch engine
+                    {'name': 'invocations_error', 'type': 'INTEGER'}]
+
+'''
+the BigQuery client, created on first use so that importing main stays cheap on cold starts.
+with QUERY_CACHE_DIR set, SELECTs are read through query_cache.QUERY_CACHE.
+google.cloud.bigquery, pandasql and pandas_gbq are imported by the code paths that need them
+'''
+def get_client():
+    global bqclient
+    if bqclient is None:
+        from google.cloud import bigquery
+        bqclient = bigquery.Client()
+    return cached_client(bqclient)
 
 '''
 pull in rpl_transaction data, and place into a pandas dataframe
@@ -31,84 +79,188 @@ pull in rpl_transaction data, and place into a pandas dataframe
 def get_transactions():
     print(" *** pulling latest transactions data from 1_raw.transactions *** ")
     
+    # explore() only looks at the selector, so the rest of `input` stays in BigQuery
     query_string = """
-        select *
+        select
+            from_address_hash,
+            to_address_hash,
+            SUBSTR(`input`, 1, 10) as input,
+            block_timestamp
         from `celo-testnet-production.1_raw.transactions`
         where block_timestamp > TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL -3 DAY)
     """
 
-    df = (bqclient.query(query_string)
-                    .result().to_dataframe(create_bqstorage_client=True))
+    with stage('explore.get_transactions') as current:
+        df = current.output(current.query_job(get_client().query(query_string))
+                                .result().to_dataframe(create_bqstorage_client=True))
     
     return df
 
-def explore(transactions_df):
-    start_time = time.time()
-    
-    print('transactions_df')
-    print(len(transactions_df.index))
+'''
+stream the latest transactions as Arrow batches, keeping only per (caller, contract, signature) counts
+and per (caller, contract) burst stats, both keyed by the ids of the returned address dictionary.
+with a SignatureSketch, only the counts of the heavy hitters are kept. with more than one worker,
+the encoded batches are partitioned by contract and counted by a process pool instead.
+with FEATURE_STORE_DIR set, the streamed transactions past its watermark also update the per address features
+'''
+def get_signature_counts(source=TRANSACTIONS_SOURCE, sketch=None, workers=EXPLORE_WORKERS, features=None):
+    print(" *** streaming latest signature counts from {} *** ".format(source or '1_raw.transactions'))
+    detector = RateDetector()
+    addresses = AddressDictionary()
+    features = FeatureStore() if features is None else features
+
+    if source:
+        batches = file_batches(source, columns=INCREMENTAL_COLUMNS if features.enabled else TRANSACTION_COLUMNS)
+    else:
+        from google.cloud import bigquery_storage
+        batches = query_batches(get_client(), bqstorage_client=bigquery_storage.BigQueryReadClient())
+    batches = features.observe(batches)
+
+    if workers > 1 and sketch is None:
+        with stage('explore.parallel_signature_counts') as current:
+            signature_counts_df, burst_stats_df = current.output(parallel_signature_counts(
+                (encode_transactions(batch, addresses) for batch in batches), workers))
+    else:
+        with stage('explore.stream_signature_counts') as current:
+            signature_counts_df = current.output(stream_signature_counts(batches, detector, addresses, sketch))
+        with stage('explore.burst_stats') as current:
+            burst_stats_df = current.output(detector.stats())
+    if features.enabled:
+        with stage('explore.update_features'):
+            features.update()
+    return signature_counts_df, burst_stats_df, addresses
 
-    '''
-    Identify the most frequently called function signatures. Tag them as “suspicious”.
-    most frequently = top 100
+'''
+pull in every contract creation of the last week, or of [start, end) for backfills, the creation
+edges suspicion travels along. filtering them by contract never reduced the bytes scanned, only the rows returned
+'''
+def get_contract_creations(start=None, end=None):
+    if start is None:
+        window = "block_timestamp > TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL -7 DAY)"
+    else:
+        window = f"block_timestamp >= TIMESTAMP('{start}') and block_timestamp < TIMESTAMP('{end}')"
+    query_string = f"""
+        SELECT from_address_hash, created_contract_address_hash, block_timestamp
+        FROM `celo-testnet-production.1_raw.transactions`
+        where created_contract_address_hash is not null
+        and {window}
+    """
+
+    with stage('explore.get_contract_creations') as current:
+        df = current.output(current.query_job(get_client().query(query_string))
+                                .result().to_dataframe(create_bqstorage_client=True))
+
+    return df
+
+'''
+counts of transactions already in memory, encoded with a new address dictionary. with more than one
+worker the encoded transactions are partitioned by contract and counted by a process pool, with a
+SignatureSketch only the counts of the heavy hitters are kept
+'''
+def count_transactions(transactions_df, sketch=None, workers=EXPLORE_WORKERS):
+    addresses = AddressDictionary()
+    with stage('explore.encode', transactions_df) as current:
+        encoded_df = current.output(encode_transactions(transactions_df, addresses))
+    if workers > 1 and sketch is None:
+        with stage('explore.parallel_signature_counts', encoded_df) as current:
+            signature_counts_df, burst_stats_df = current.output(parallel_signature_counts([encoded_df], workers))
+        return signature_counts_df, burst_stats_df, addresses
+
+    with stage('explore.count_signatures', encoded_df) as current:
+        if sketch is None:
+            signature_counts_df = current.output(count_signatures(encoded_df))
+        else:
+            sketch.add(encoded_df)
+            signature_counts_df = current.output(sketch.signature_counts())
+    with stage('explore.burst_stats', encoded_df) as current:
+        burst_stats_df = current.output(transaction_burst_stats(encoded_df))
+    return signature_counts_df, burst_stats_df, addresses
+
+'''
+explore as a stage DAG: counting runs next to the contract creations query, and every stage after it
+reads the per (caller, contract, signature) counts. counts are encoded with `addresses`, the explored
+tables are hex. runs skip the stages whose outputs they pass in, e.g. counts resumed from a checkpoint
+'''
+explore_pipeline = Pipeline('explore')
+EXPLORED = ['contracts', 'signatures', 'callers']
+
+'''
+the counts of `transactions`, or of the latest transactions streamed from TRANSACTIONS_SOURCE or BigQuery
+'''
+@explore_pipeline.stage(outputs=['signature_counts', 'burst_stats', 'addresses'], measure=False)
+def count(transactions, sketch, workers):
+    if transactions is None:
+        return get_signature_counts(sketch=sketch, workers=workers)
+    return count_transactions(transactions, sketch, workers)
+
+'''
+the last week's contract creations, queried while the transactions are counted
+'''
+@explore_pipeline.stage('get_contract_creations', outputs=['creations'], measure=False)
+def fetch_creations():
+    return get_contract_creations()
 
-    to_address_hash -> contract_address_hash  
-    '''
+@explore_pipeline.stage('tag_signature_counts', outputs=['tagged_contracts', 'tagged_signatures', 'tagged_callers'])
+def tag(signature_counts):
+    return tag_signature_counts(signature_counts, pd.Timestamp.now(tz='UTC'))
+
+'''
+counts of a SignatureSketch get the sketch's signature totals and their error bounds
+'''
+@explore_pipeline.stage('add_error_bounds', outputs=['bounded_signatures'])
+def bound_errors(tagged_signatures, signature_counts, sketch):
+    return tagged_signatures if sketch is None else add_error_bounds(tagged_signatures, signature_counts, sketch)
+
+@explore_pipeline.stage('add_burst_stats', outputs=['burst_callers'])
+def add_bursts(tagged_callers, burst_stats):
+    return add_burst_stats(tagged_callers, burst_stats)
+
+@explore_pipeline.stage('add_creator_contracts', outputs=['creator_contracts'])
+def add_creators(tagged_contracts, creations, addresses):
     print(' ')
-    print(" *** finding frequently called signatures *** ")
-    frequent_signatures_query = """
-        select
-            to_address_hash as contract_address_hash,
-            SUBSTR(`input`, 0, 10) as signature,
-            COUNT(1) as invocations,
-            '1' as confidence_level,
-            'suspicious' as tag,
-            block_timestamp
-        from transactions_df
-        group by 1, 2, 4, 5, 6
-        order by 2 DESC
-        limit 10
-    """
-    frequent_signatures_df = sqldf(frequent_signatures_query)
+    print(" *** finding creators of smart contracts *** ")
+    return add_creator_contracts(tagged_contracts, encode_transactions(creations, addresses))
 
-    print('frequent_signatures_df')
-    print(len(frequent_signatures_df.index))
+@explore_pipeline.stage(outputs=EXPLORED)
+def decode(creator_contracts, bounded_signatures, burst_callers, addresses):
+    explored = [decode_frame(df, addresses) for df in (creator_contracts, bounded_signatures, burst_callers)]
+    for name, df in zip(('contracts_df', 'signatures_df', 'callers_df'), explored):
+        print(name)
+        print(len(df.index))
+    return explored
 
-    signature_contracts_query = """
-        select distinct
-            from_address_hash,
-            to_address_hash, 
-            SUBSTR(`input`, 0, 10) as signature            
-        from transactions_df
-    """
-    signature_contracts_df = sqldf(signature_contracts_query)
+'''
+tag suspicious signatures, contracts and callers from per (caller, contract, signature) counts,
+adding the burst stats of every caller. counts are encoded with `addresses`, the results are hex.
+counts of a SignatureSketch get the sketch's signature totals and their error bounds.
+contract creations are the last week's unless given
+'''
+def explore_signature_counts(signature_counts_df, burst_stats_df, addresses, sketch=None, creations_df=None):
+    values = {'signature_counts': signature_counts_df, 'burst_stats': burst_stats_df, 'addresses': addresses,
+              'sketch': sketch}
+    if creations_df is not None:
+        values['creations'] = creations_df
+    return explore_pipeline.run(EXPLORED, values)
 
-    print('signature_contracts_df')
-    print(len(signature_contracts_df.index))
+'''
+the original pandasql queries of explore(), kept as the sqldf engine to check the pandas engine against.
+every query reads the frames named like its parameters; the tagged signatures are computed once and
+read by the contracts, callers and signature totals queries
+'''
+sqldf_pipeline = Pipeline('explore.sqldf')
 
-    signatures_query = """
-        select
-            s.from_address_hash,
-            s.to_address_hash,
-            s.signature,
-            f.invocations,
-            f.confidence_level,
-            f.tag,
-            f.block_timestamp
-        from signature_contracts_df s
-        join frequent_signatures_df f
-        on s.signature = f.signature
-        and s.to_address_hash = f.contract_address_hash
-    """
-    signatures_df = sqldf(signatures_query)  
-    
-    print('signatures_df')
-    print(len(signatures_df.index))
+@sqldf_pipeline.stage('get_transactions', outputs=['transactions_df'], measure=False)
+def fetch_transactions():
+    return get_transactions()
 
-    signatures_df['updated_at'] = pd.Timestamp.utcnow() 
-    signatures_df['updated_at'] = pd.to_datetime(signatures_df['updated_at'])
-    signatures_df['tags'] = signatures_df[['tag', 'confidence_level']].apply(tuple, axis=1)
-    signatures_df['tags'] = signatures_df['tags'].astype(str)
+sqldf_pipeline.add(fetch_creations, 'get_contract_creations', outputs=['creations_df'], measure=False)
+
+'''
+Identify the most frequently called function signatures, per caller. Tag them as “suspicious”.
+'''
+@sqldf_pipeline.stage('signatures', outputs=['signatures_df'])
+def sqldf_signatures(transactions_df):
+    from pandasql import sqldf
 
     print(' ')
     print(" *** finding frequently called signatures *** ")
@@ -116,11 +268,11 @@ def explore(transactions_df):
         select
             from_address_hash,
             to_address_hash, 
-            SUBSTR(`input`, 0, 10) as signature,
+            SUBSTR(`input`, 1, 10) as signature,
             COUNT(1) as invocations,
             '1' as confidence_level,
             'suspicious' as tag,
-            block_timestamp
+            max(block_timestamp) as block_timestamp
         from transactions_df
         group by 1, 2, 3 
         order by 4 DESC
@@ -132,43 +284,58 @@ def explore(transactions_df):
 
     signatures_df['updated_at'] = pd.Timestamp.utcnow() 
     signatures_df['updated_at'] = pd.to_datetime(signatures_df['updated_at'])
-    signatures_df['tags'] = signatures_df[['tag', 'confidence_level']].apply(tuple, axis=1)
-    signatures_df['tags'] = signatures_df['tags'].astype(str)
+    return signatures_df
+
+'''
+Tag smart contracts that functions belong to as “suspicious”.
+'''
+@sqldf_pipeline.stage('contracts', outputs=['suspicious_contracts_df'])
+def sqldf_contracts(signatures_df):
+    from pandasql import sqldf
 
-    '''
-    Tag smart contracts that functions belong to as “suspicious”.
-    '''
     print(' ')
     print(" *** finding smart contracts of frequent functions *** ")
     contract_query = """
         select distinct
             to_address_hash,
-            tags,
+            tag,
+            confidence_level,
             block_timestamp,
             updated_at
         from signatures_df
     """
-
     contracts_df = sqldf(contract_query)
 
     print('contracts_df')
     print(len(contracts_df.index))
+    return contracts_df
+
+'''
+Measure how often every caller calls each contract within sliding windows.
+'''
+@sqldf_pipeline.stage('burst_stats', outputs=['burst_stats_df'])
+def sqldf_burst_stats(transactions_df):
+    return transaction_burst_stats(transactions_df)
+
+'''
+Tag all the addresses that call these functions a lot of times as “suspicious”.
+'''
+@sqldf_pipeline.stage('callers', outputs=['callers'])
+def sqldf_callers(signatures_df, burst_stats_df):
+    from pandasql import sqldf
 
-    '''
-    Tag all the addresses that call these functions a lot of times as “suspicious”.
-    '''
     print(' ')
     print(" *** finding frequent functions callers *** ")
     callers_query = """
         select          
             from_address_hash as caller,
             to_address_hash, 
-            tags,
+            tag,
+            confidence_level,
             block_timestamp,
             updated_at
         from signatures_df
     """
-    
     callers_df = sqldf(callers_query)
 
     print('callers_df')
@@ -177,117 +344,274 @@ def explore(transactions_df):
     callers_df['block_timestamp'] = pd.to_datetime(callers_df['block_timestamp'])
     callers_df['updated_at'] = pd.to_datetime(callers_df['updated_at'])
     callers_df = callers_df.sort_values('block_timestamp').drop_duplicates(['caller', 'to_address_hash'], keep='last')
-    
-    '''
-    Tag creators of “suspicious” smart contracts as “suspicious”.
-    '''
-    print(' ')
-    print(" *** finding creators of smart contracts *** ")
-
-    suspicious_contracts_query = """
-        SELECT *
-        FROM `celo-testnet-production.1_raw.transactions`
-        where created_contract_address_hash in {}
-        and block_timestamp > TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL -7 DAY)
-    """.format(tuple(contracts_df['to_address_hash'].tolist()))
-    print(suspicious_contracts_query)
-    suspicious_contracts_df = bqclient.query(suspicious_contracts_query)\
-                                .result().to_dataframe(create_bqstorage_client=True)
- 
-    creators_query = """
-        select 
-            from_address_hash,
-            '1' as confidence_level,
-            'suspicious' as tag,
-            block_timestamp
-        from suspicious_contracts_df
-    """
-    creators_df = sqldf(creators_query)
+    return add_burst_stats(typed_tags(callers_df), burst_stats_df)
 
-    print('creators_df')
-    print(len(creators_df.index))
-
-    creators_df['updated_at'] = pd.Timestamp.utcnow() 
-    creators_df['updated_at'] = pd.to_datetime(creators_df['updated_at'])
-    creators_df['tags'] = creators_df[['tag', 'confidence_level']].apply(tuple, axis=1)
-    creators_df['tags'] = creators_df['tags'].astype(str)
+'''
+Tag all other smart contracts created by creators of “suspicious” smart contracts as “suspicious”.
+Suspicion travels over the creation edges both ways for GRAPH_DEPTH hops in a recursive query,
+losing GRAPH_DECAY per hop, so it checks the propagation of the pandas engine independently.
+'''
+@sqldf_pipeline.stage('add_creator_contracts', outputs=['contracts'])
+def sqldf_creator_contracts(suspicious_contracts_df, creations_df):
+    from pandasql import sqldf
 
-    '''
-    Tag all other smart contracts created by creators of “suspicious” smart contracts as “suspicious”.
-    '''
     print(' ')
-    print(" *** finding smart contracts of suspicious creators *** ")
-    suspicious_creator_contract_query = """
+    print(" *** finding creators of smart contracts *** ")
+    contracts_df = typed_tags(suspicious_contracts_df.assign(
+        block_timestamp=pd.to_datetime(suspicious_contracts_df['block_timestamp'], utc=True),
+        updated_at=pd.to_datetime(suspicious_contracts_df['updated_at'], utc=True)))
+    edges_df = creations_df[['created_contract_address_hash', 'from_address_hash']].dropna()
+    seeds_df = contracts_df[['to_address_hash', 'confidence_level']]
+
+    reached_query = f"""
+        with recursive
+        edges as (
+            select created_contract_address_hash as source, from_address_hash as target from edges_df
+            union
+            select from_address_hash as source, created_contract_address_hash as target from edges_df
+        ),
+        reached(node, confidence, hops) as (
+            select to_address_hash, confidence_level, 0 from seeds_df
+            union all
+            select e.target, r.confidence * {GRAPH_DECAY}, r.hops + 1
+            from reached r
+            join edges e on e.source = r.node
+            where r.hops < {GRAPH_DEPTH}
+        )
         select
-            created_contract_address_hash as to_address_hash,
-            '1' as confidence_level,
-            'suspicious' as tag,
-            block_timestamp
-        from suspicious_contracts_df 
-        where from_address_hash in ((select from_address_hash from creators_df))
+            node as created_contract_address_hash,
+            max(confidence) as confidence_level
+        from reached
+        group by 1
     """
+    reached_df = sqldf(reached_query)
 
-    suspicious_creator_contract_df = sqldf(suspicious_creator_contract_query)
-
-    print('suspicious_creator_contract_df')
-    print(len(suspicious_creator_contract_df.index))    
-
-    suspicious_creator_contract_df['tags'] = suspicious_creator_contract_df[['tag', 'confidence_level']].apply(tuple, axis=1)
-    suspicious_creator_contract_df['tags'] = suspicious_creator_contract_df['tags'].astype(str)
-    suspicious_creator_contract_df['updated_at'] = None 
-    
-    contracts_df = pd.concat([contracts_df, suspicious_creator_contract_df])
-    contracts_df = contracts_df.drop(columns=['confidence_level', 'tag'])
+    creator_contracts_df = (creations_df.merge(reached_df, on='created_contract_address_hash')
+                                .rename(columns={'created_contract_address_hash': 'to_address_hash'})
+                                .assign(updated_at=pd.NaT))
+    creator_contracts_df = tag_columns(creator_contracts_df, 'suspicious', creator_contracts_df['confidence_level'])
+    contracts_df = pd.concat([contracts_df, creator_contracts_df[contracts_df.columns]])
     contracts_df['block_timestamp'] = pd.to_datetime(contracts_df['block_timestamp'])
     contracts_df['updated_at'] = pd.to_datetime(contracts_df['updated_at'])
     contracts_df = contracts_df.sort_values('block_timestamp').drop_duplicates(['to_address_hash'], keep='last')
 
     print('contracts_df')
-    print(len(contracts_df.index))    
+    print(len(contracts_df.index))
+    return contracts_df
+
+@sqldf_pipeline.stage('signature_totals', outputs=['signatures'])
+def sqldf_signature_totals(signatures_df):
+    from pandasql import sqldf
 
-    signatures_df = signatures_df.drop(columns=['confidence_level', 'tag', 'from_address_hash'])
+    signatures_df = signatures_df.drop(columns=['from_address_hash'])
     signatures_df = sqldf("""
         select
             to_address_hash, 
             signature,
-            invocations,
-            tags,
-            block_timestamp,
+            sum(invocations) as invocations,
+            tag,
+            confidence_level,
+            max(block_timestamp) as block_timestamp,
             updated_at
         from signatures_df
         group by 1, 2
         order by 3 DESC
     """)
-    
+
     print('signatures_df')
-    print(len(signatures_df.index))    
+    print(len(signatures_df.index))
 
     signatures_df['block_timestamp'] = pd.to_datetime(signatures_df['block_timestamp'])
     signatures_df['updated_at'] = pd.to_datetime(signatures_df['updated_at'])
     signatures_df = signatures_df.sort_values('block_timestamp').drop_duplicates(['to_address_hash', 'signature'], keep='last')
+    return typed_tags(signatures_df)
+
+@instrument('explore')
+def explore(transactions_df, engine=EXPLORE_ENGINE, workers=EXPLORE_WORKERS):
+    start_time = time.time()
+    
+    print('transactions_df')
+    print(len(transactions_df.index))
+
+    if engine == 'sqldf':
+        results = sqldf_pipeline.run(EXPLORED, {'transactions_df': transactions_df})
+    else:
+        sketch = SignatureSketch() if engine == 'sketch' else None
+        results = explore_pipeline.run(EXPLORED, {'transactions': transactions_df, 'sketch': sketch,
+                                                  'workers': workers})
 
     print("successfully explored transaction data --- %s seconds ---" % (time.time() - start_time))
-    return contracts_df, signatures_df, callers_df
+    return results
 
 def write_df(transactions_df, table_name, schema):
     project_id = 'celo-testnet-production'
     table_id = '1_attributions.' + table_name
 
-    pandas_gbq.to_gbq(transactions_df, table_id, project_id=project_id, if_exists='append', table_schema=schema)
+    # optional columns, e.g. the error bounds of the sketch engine, are only written when present
+    schema = [field for field in schema if field['name'] in transactions_df]
+    if 'confidence_level' in transactions_df:
+        transactions_df = transactions_df.assign(confidence_level=written_confidence(transactions_df['confidence_level']))
+    import pandas_gbq
+    with stage(f'explore.write.{table_name}', transactions_df):
+        pandas_gbq.to_gbq(transactions_df, table_id, project_id=project_id, if_exists='append', table_schema=schema)
     print("successfully wrote data to {}".format(project_id + '.' + table_id))
 
 
+'''
+signature counts and burst stats, checkpointed decoded as the aggregate stage and encoded again
+with a fresh dictionary, so a resumed run does not stream the transactions again. burst stats
+are keyed by a hash of the encoded pair, so they are checkpointed with the caller and contract
+of their key and hashed again once encoded, like backfill.merge_windows() does
+'''
+def checkpointed_signature_counts(checkpoints):
+    def aggregate():
+        signature_counts_df, burst_stats_df, addresses = get_signature_counts()
+        pairs_df = signature_counts_df[RATE_KEYS].drop_duplicates()
+        burst_stats_df = (burst_stats_df
+                              .merge(pairs_df.assign(key=pair_keys(pairs_df)), on='key')
+                              .drop(columns='key'))
+        return decode_frame(signature_counts_df, addresses), decode_frame(burst_stats_df, addresses)
+
+    addresses = AddressDictionary()
+    signature_counts_df, burst_stats_df = checkpoints.stage('aggregate', aggregate)
+    signature_counts_df = encode_transactions(signature_counts_df, addresses)
+    burst_stats_df = encode_transactions(burst_stats_df, addresses)
+    burst_stats_df = burst_stats_df.assign(key=pair_keys(burst_stats_df))
+    return signature_counts_df, burst_stats_df.astype({column: 'int64' for column in BURST_COLUMNS}), addresses
+
+'''
+explore the latest transactions, streaming them unless the sqldf engine needs the full frame.
+with checkpoints, a rerun resumes from the tagged tables or the aggregated counts
+'''
+def explore_latest(checkpoints=NO_CHECKPOINTS):
+    if EXPLORE_ENGINE == 'sqldf':
+        return checkpoints.stage('tag', lambda: sqldf_pipeline.run(EXPLORED))
+
+    def tag():
+        start_time = time.time()
+        sketch = SignatureSketch() if EXPLORE_ENGINE == 'sketch' else None
+        values = {'transactions': None, 'sketch': sketch, 'workers': EXPLORE_WORKERS}
+        if sketch is None and checkpoints.enabled:
+            values.update(zip(['signature_counts', 'burst_stats', 'addresses'], checkpointed_signature_counts(checkpoints)))
+        results = explore_pipeline.run(EXPLORED, values)
+        print("successfully explored transaction data --- %s seconds ---" % (time.time() - start_time))
+        return results
+
+    return checkpoints.stage('tag', tag)
+
+'''
+append only the rows of a table that are new or changed since the snapshot, then record them in it.
+updated_at is left out of the content compared, it changes on every run
+'''
+def write_delta(df, table_name, schema, snapshot):
+    keys = TABLE_KEYS[table_name]
+    columns = [field['name'] for field in schema if field['name'] in df and field['name'] not in keys + ['updated_at']]
+    delta = snapshot.diff(table_name, df, keys, columns)
+    delta.report()
+    if not delta.rows.empty:
+        write_df(delta.rows, table_name, schema)
+    snapshot.commit(delta, keys)
+
+'''
+append the explored tables, skipping the ones a previous attempt over the same window already appended.
+with SNAPSHOT_DIR set, rows appended before with the same content are skipped too
+'''
+def write_tables(contracts_df, signatures_df, callers_df, checkpoints=NO_CHECKPOINTS, snapshot=None):
+    snapshot = snapshot or Snapshot('explore')
+    for df, table_name, schema in ((contracts_df, 'contracts', contracts_schema),
+                                   (signatures_df, 'signatures', signatures_schema),
+                                   (callers_df, 'callers', callers_schema)):
+        checkpoints.once(f'write.{table_name}', lambda: write_delta(df, table_name, schema, snapshot))
+
+'''
+count the blocks after the watermark and fold them into the running counts. returns the changed
+rows to write, the decoded running counts and the new watermark, or None without new transactions.
+with FEATURE_STORE_DIR set, the new transactions also update the per address features analyze reads
+'''
+def explore_new_blocks(state_counts_df, watermark, addresses, source=TRANSACTIONS_SOURCE, features=None):
+    start_time = time.time()
+    features = FeatureStore() if features is None else features
+    if source:
+        batches = file_batches(source, columns=INCREMENTAL_COLUMNS)
+    else:
+        from google.cloud import bigquery_storage
+        batches = query_batches(get_client(), incremental_query.format(watermark=watermark),
+                                bqstorage_client=bigquery_storage.BigQueryReadClient())
+    batches = features.observe(batches)
+
+    detector = RateDetector()
+    with stage('explore.stream_signature_counts') as current:
+        new_counts_df, new_watermark = stream_new_signature_counts(batches, watermark, detector, addresses)
+        current.output(new_counts_df)
+    if features.enabled:
+        with stage('explore.update_features'):
+            features.update()
+    if new_counts_df.empty:
+        print("no new transactions since block {}".format(watermark))
+        return None
+
+    with stage('explore.fold_signature_counts', [state_counts_df, new_counts_df]) as current:
+        state_counts_df, touched_counts_df = fold_signature_counts(state_counts_df, new_counts_df)
+        current.output(touched_counts_df)
+    with stage('explore.burst_stats') as current:
+        burst_stats_df = current.output(detector.stats())
+    contracts_df, signatures_df, callers_df = explore_signature_counts(touched_counts_df, burst_stats_df, addresses)
+    with stage('explore.changed_rows', [signatures_df, callers_df]) as current:
+        signatures_df, callers_df = current.output(
+            changed_rows(signatures_df, callers_df, decode_frame(new_counts_df, addresses)))
+    print("successfully explored transaction data --- %s seconds ---" % (time.time() - start_time))
+
+    return (contracts_df, signatures_df, callers_df, decode_frame(state_counts_df, addresses),
+            pd.DataFrame({'watermark': [new_watermark]}))
+
+'''
+fold the blocks added since the last run into the running counts and write only the rows that changed.
+the state is saved after the writes, so a failed run is retried from the same watermark, and with
+checkpoints the retry resumes the tagged rows and skips the tables already written.
+burst stats only cover the new blocks, windows spanning the watermark are not counted.
+the running counts are exact, the sketch engine only applies to full runs.
+'''
+def run_incremental(state_path, source=TRANSACTIONS_SOURCE):
+    addresses = AddressDictionary()
+    with stage('explore.load_state') as current:
+        state_counts_df, watermark = load_state(state_path)
+        if state_counts_df is not None:
+            state_counts_df = encode_transactions(state_counts_df, addresses)
+        current.output(state_counts_df)
+    print(" *** exploring transactions after block {} *** ".format(watermark))
+
+    checkpoints = Checkpoints('explore_incremental', window=watermark, settings={'state': state_path, 'source': source})
+    results = checkpoints.stage('tag', lambda: explore_new_blocks(state_counts_df, watermark, addresses, source))
+    if results is None:
+        return
+
+    contracts_df, signatures_df, callers_df, state_counts_df, watermark_df = results
+    write_tables(contracts_df, signatures_df, callers_df, checkpoints)
+    with stage('explore.save_state', state_counts_df):
+        save_state(state_path, state_counts_df, int(watermark_df['watermark'].iloc[0]))
+    checkpoints.clear()
+
+'''
+explore the latest transactions and append the results, resuming an earlier attempt over the same
+window from its checkpoints when CHECKPOINT_DIR is set
+'''
+def explore_and_write():
+    checkpoints = Checkpoints('explore', settings={'engine': EXPLORE_ENGINE, 'source': TRANSACTIONS_SOURCE})
+    write_tables(*explore_latest(checkpoints), checkpoints)
+    checkpoints.clear()
+
 def run(request='request', context='context'):
-    df_results = get_transactions()
-    contracts_df, signatures_df, callers_df = explore(df_results)
-    write_df(contracts_df, 'contracts', contracts_schema)
-    write_df(signatures_df, 'signatures', signatures_schema) 
-    write_df(callers_df, 'callers', callers_schema)
+    begin_run()
+    if EXPLORE_STATE_PATH:
+        run_incremental(EXPLORE_STATE_PATH)
+    else:
+        explore_and_write()
+    write_report('explore')
+    QUERY_CACHE.report()
 
 # for testing purposes (run locally via command line)
 if __name__ == '__main__':
-    df_results = get_transactions()
-    contracts_df, signatures_df, callers_df = explore(df_results)
-    write_df(contracts_df, 'contracts', contracts_schema)
-    write_df(signatures_df, 'signatures', signatures_schema) 
-    write_df(callers_df, 'callers', callers_schema)
\ No newline at end of file
+    begin_run()
+    explore_and_write()
+    write_report('explore')
+    QUERY_CACHE.report()
@@ -0,0 +1,78 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from engine import SIGNATURE_KEYS, count_signatures
+from rate import RateDetector, transaction_burst_stats
+
+
+# processes counting partitions of the transactions, 1 counts them in this process
+EXPLORE_WORKERS = int(os.environ.get('EXPLORE_WORKERS', 1))
+# partitions are handed to the workers as Arrow IPC files in shared memory where there is one
+PARTITION_DIR = os.environ.get('PARTITION_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else None)
+
+'''
+Partition of every transaction, by a hash of its contract. All rows of a contract, and so of
+each (caller, contract, signature) and (caller, contract) key, end up in the same partition.
+'''
+def partition_codes(transactions_df, partitions):
+    return pd.util.hash_pandas_object(transactions_df['to_address_hash'], index=False).to_numpy() % np.uint64(partitions)
+
+'''
+Spools encoded transaction frames into one Arrow IPC file per partition.
+'''
+class PartitionWriter:
+    def __init__(self, directory, partitions):
+        self.paths = [os.path.join(directory, f'partition-{i}.arrow') for i in range(partitions)]
+        self.writers = None
+        self.rows = 0
+
+    def add(self, transactions_df):
+        table = pa.Table.from_pandas(transactions_df, preserve_index=False)
+        if self.writers is None:
+            self.writers = [pa.ipc.new_file(path, table.schema) for path in self.paths]
+
+        codes = partition_codes(transactions_df, len(self.paths))
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(self.paths) + 1))
+        table = table.take(order)
+        for writer, start, end in zip(self.writers, bounds[:-1], bounds[1:]):
+            writer.write_table(table.slice(start, end - start))
+        self.rows += len(transactions_df.index)
+
+    def close(self):
+        for writer in self.writers or []:
+            writer.close()
+        return self.paths if self.writers else []
+
+'''
+Count one partition in a worker process, memory mapping its Arrow IPC file.
+'''
+def count_partition(path):
+    with pa.memory_map(path) as source:
+        transactions_df = pa.ipc.open_file(source).read_all().to_pandas()
+    return count_signatures(transactions_df), transaction_burst_stats(transactions_df)
+
+'''
+Signature counts and burst stats of encoded transaction frames, counted by `workers`
+processes on partitions by contract. Partitions share no key, so their results are only
+concatenated.
+'''
+def parallel_signature_counts(frames, workers=EXPLORE_WORKERS):
+    with tempfile.TemporaryDirectory(dir=PARTITION_DIR) as directory:
+        writer = PartitionWriter(directory, workers)
+        for transactions_df in frames:
+            writer.add(transactions_df)
+        paths = writer.close()
+        print(f'partitioned {writer.rows} transactions for {workers} workers')
+
+        if not paths:
+            return pd.DataFrame(columns=SIGNATURE_KEYS + ['invocations', 'block_timestamp']), RateDetector().stats()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(count_partition, paths))
+
+    return (pd.concat([signature_counts_df for signature_counts_df, _ in results], ignore_index=True),
+            pd.concat([burst_stats_df for _, burst_stats_df in results], ignore_index=True))
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+
+RATE_KEYS = ['from_address_hash', 'to_address_hash']
+# sliding windows (in seconds) the max invocations per caller and contract are reported for
+RATE_WINDOWS = {'10s': 10, '1m': 60, '1h': 3600}
+# more than 5 transactions to one contract within any minute is an inhumane frequency
+BURST_WINDOW = '1m'
+BURST_THRESHOLD = 5
+BURST_COLUMNS = [f'max_{name}_invocations' for name in RATE_WINDOWS] + ['bursts']
+
+'''
+64 bit hash of every (caller, contract) pair, so the detector keeps 8 bytes per
+transaction instead of two address strings. Null addresses hash consistently.
+'''
+def pair_keys(df, columns=RATE_KEYS):
+    return pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+
+def epoch_seconds(timestamps):
+    timestamps = pd.to_datetime(timestamps, utc=True).dt.tz_convert(None)
+    return timestamps.to_numpy().astype('datetime64[s]').astype(np.int64)
+
+'''
+Transactions in the sliding window (t - window, t] ending at every row. Rows are sorted
+by (key, second) and keys are dense codes.
+'''
+def window_counts(codes, seconds, window):
+    # codes and seconds folded into one sorted position, so one searchsorted finds every window start
+    position = codes * (seconds.max() - seconds.min() + window + 1) + (seconds - seconds.min())
+    return np.arange(1, len(position) + 1) - np.searchsorted(position, position - (window - 1), side='left')
+
+'''
+Burst statistics per (caller, contract) key: total invocations, the most invocations
+within each sliding window, and the number of bursts, i.e. separate runs in which the
+burst window held more than `threshold` transactions.
+Rows that are not `counted` only fill the sliding windows of the rows after them, e.g. the
+transactions just before a backfill window, and are left out of the statistics.
+'''
+def burst_stats(keys, seconds, windows=RATE_WINDOWS, burst_window=BURST_WINDOW, threshold=BURST_THRESHOLD,
+                counted=None):
+    columns = ['key', 'invocations'] + [f'max_{name}_invocations' for name in windows] + ['bursts']
+    if not len(keys):
+        return pd.DataFrame(columns=columns)
+
+    order = np.lexsort((seconds, keys))
+    keys, seconds = keys[order], seconds[order]
+    first = np.concatenate(([True], keys[1:] != keys[:-1]))
+    codes = np.cumsum(first) - 1
+
+    kept = slice(None) if counted is None else np.asarray(counted, dtype=bool)[order]
+    kept_keys = keys[kept]
+    if not len(kept_keys):
+        return pd.DataFrame(columns=columns)
+    starts = np.flatnonzero(np.concatenate(([True], kept_keys[1:] != kept_keys[:-1])))
+
+    stats_df = pd.DataFrame({'key': kept_keys[starts], 'invocations': np.diff(np.append(starts, len(kept_keys)))})
+    for name, window in windows.items():
+        counts = window_counts(codes, seconds, window)
+        stats_df[f'max_{name}_invocations'] = np.maximum.reduceat(counts[kept], starts)
+        if name == burst_window:
+            over = counts > threshold
+            rising = over & (first | ~np.roll(over, 1))
+            stats_df['bursts'] = np.add.reduceat(rising[kept].astype(np.int64), starts)
+
+    return stats_df[columns]
+
+'''
+Collects (caller, contract) keys and timestamps of transactions as they are streamed,
+for burst_stats() once the stream ends. Memory is 17 bytes per transaction.
+'''
+class RateDetector:
+    def __init__(self):
+        self.keys = []
+        self.seconds = []
+        self.counted = []
+
+    def add(self, transactions_df, counted=True):
+        self.keys.append(pair_keys(transactions_df))
+        self.seconds.append(epoch_seconds(transactions_df['block_timestamp']))
+        self.counted.append(np.full(len(transactions_df.index), counted))
+
+    def stats(self, **kwargs):
+        if not self.keys:
+            return burst_stats(np.array([], dtype=np.uint64), np.array([], dtype=np.int64), **kwargs)
+        counted = np.concatenate(self.counted)
+        return burst_stats(np.concatenate(self.keys), np.concatenate(self.seconds),
+                           counted=None if counted.all() else counted, **kwargs)
+
+'''
+Burst statistics of transactions already in memory.
+'''
+def transaction_burst_stats(transactions_df, **kwargs):
+    detector = RateDetector()
+    detector.add(transactions_df)
+    return detector.stats(**kwargs)
+
+'''
+Add the burst statistics of every caller to the callers frame, with zeros for callers
+without any.
+'''
+def add_burst_stats(callers_df, burst_stats_df):
+    callers_df = callers_df.assign(key=pair_keys(callers_df, ['caller', 'to_address_hash']))
+    callers_df = callers_df.merge(burst_stats_df[['key'] + BURST_COLUMNS], on='key', how='left').drop(columns='key')
+    return callers_df.fillna({column: 0 for column in BURST_COLUMNS}).astype({column: 'int64' for column in BURST_COLUMNS})
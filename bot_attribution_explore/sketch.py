@@ -0,0 +1,178 @@
+import math
+import os
+
+import numpy as np
+import pandas as pd
+from engine import SIGNATURE_KEYS, count_signatures
+from rate import pair_keys
+
+
+# Space-Saving counters kept for (caller, contract, signature) triples; every triple called
+# more than N / SKETCH_CAPACITY times out of N transactions is among them
+SKETCH_CAPACITY = int(os.environ.get('SKETCH_CAPACITY', 10000))
+# Count-Min totals per (contract, signature) overcount by at most SKETCH_EPSILON * N,
+# with probability 1 - SKETCH_DELTA
+SKETCH_EPSILON = float(os.environ.get('SKETCH_EPSILON', 0.0001))
+SKETCH_DELTA = float(os.environ.get('SKETCH_DELTA', 0.01))
+
+TOTAL_KEYS = ['to_address_hash', 'signature']
+COUNTER_COLUMNS = SIGNATURE_KEYS + ['block_timestamp', 'count', 'error']
+
+'''
+Count-Min sketch of invocations per 64 bit key. Estimates never undercount and overcount
+by at most epsilon * total with probability 1 - delta, in depth x width counters whatever
+the number of keys. Sketches of the same shape merge by adding their counters.
+'''
+class CountMinSketch:
+    def __init__(self, epsilon=SKETCH_EPSILON, delta=SKETCH_DELTA):
+        self.epsilon = epsilon
+        self.delta = delta
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self.total = 0
+
+    def _columns(self, keys):
+        # double hashing on the two 32 bit halves of the key
+        keys = np.asarray(keys, dtype=np.uint64)
+        first, second = keys >> np.uint64(32), (keys & np.uint64(0xffffffff)) | np.uint64(1)
+        return [((first + np.uint64(row) * second) % np.uint64(self.width)).astype(np.intp)
+                for row in range(self.depth)]
+
+    def add(self, keys, counts):
+        counts = np.asarray(counts, dtype=np.int64)
+        for row, columns in enumerate(self._columns(keys)):
+            self.table[row] += np.bincount(columns, weights=counts, minlength=self.width).astype(np.int64)
+        self.total += int(counts.sum())
+
+    def estimate(self, keys):
+        columns = self._columns(keys)
+        if not columns[0].size:
+            return np.zeros(0, dtype=np.int64)
+        return np.min([self.table[row][row_columns] for row, row_columns in enumerate(columns)], axis=0)
+
+    def error_bound(self):
+        return self.epsilon * self.total
+
+    def merge(self, other):
+        if self.table.shape != other.table.shape:
+            raise ValueError(f'cannot merge Count-Min sketches of shape {self.table.shape} and {other.table.shape}')
+        self.table += other.table
+        self.total += other.total
+        return self
+
+'''
+Space-Saving summary of the `capacity` most invoked (caller, contract, signature) triples.
+A counter overcounts its triple by at most its `error`, which is at most N / capacity, and
+any triple missing from a full summary was invoked at most `floor` times.
+
+Summaries merge like in parallel Space-Saving: a triple missing from one side is counted
+with that side's floor, and the `capacity` largest counters are kept.
+'''
+class SpaceSaving:
+    def __init__(self, capacity=SKETCH_CAPACITY):
+        self.capacity = capacity
+        self.counters = pd.DataFrame(columns=COUNTER_COLUMNS, index=pd.Index([], dtype=np.uint64, name='key'))
+
+    def __len__(self):
+        return len(self.counters.index)
+
+    @property
+    def floor(self):
+        return int(self.counters['count'].min()) if len(self) >= self.capacity else 0
+
+    '''
+    Add exact counts of a batch: signature counts with a `key` column.
+    '''
+    def add(self, signature_counts_df):
+        counters = (signature_counts_df
+                        .rename(columns={'invocations': 'count'})
+                        .assign(error=0)
+                        .set_index('key')[COUNTER_COLUMNS])
+        self._merge(counters, 0)
+
+    def merge(self, other):
+        self._merge(other.counters, other.floor)
+        return self
+
+    def _merge(self, counters, floor):
+        if not len(counters.index):
+            return
+        if not len(self):
+            self.counters = counters.nlargest(self.capacity, 'count') if len(counters.index) > self.capacity else counters
+            return
+
+        index = self.counters.index.union(counters.index)
+        totals = {column: (self.counters[column].reindex(index, fill_value=self.floor)
+                           + counters[column].reindex(index, fill_value=floor)).astype(np.int64)
+                  for column in ('count', 'error')}
+        kept = totals['count'].nlargest(self.capacity).index if len(index) > self.capacity else index
+
+        # only the kept counters look up their triple and latest timestamp on either side
+        ours, theirs = self.counters.reindex(kept), counters.reindex(kept)
+        self.counters = (ours[SIGNATURE_KEYS]
+                            .combine_first(theirs[SIGNATURE_KEYS])
+                            .assign(block_timestamp=pd.concat([ours['block_timestamp'], theirs['block_timestamp']],
+                                                              axis=1).max(axis=1),
+                                    count=totals['count'].reindex(kept),
+                                    error=totals['error'].reindex(kept)))
+
+'''
+Sketch of streamed transactions in bounded memory: Space-Saving over (caller, contract,
+signature) triples finds the heavy hitters and Count-Min estimates the totals of every
+(contract, signature) over all callers. Sketches of separate batches or workers merge.
+'''
+class SignatureSketch:
+    def __init__(self, capacity=SKETCH_CAPACITY, epsilon=SKETCH_EPSILON, delta=SKETCH_DELTA):
+        self.triples = SpaceSaving(capacity)
+        self.totals = CountMinSketch(epsilon, delta)
+
+    @property
+    def transactions(self):
+        return self.totals.total
+
+    def add(self, transactions_df):
+        self.add_counts(count_signatures(transactions_df))
+
+    def add_counts(self, signature_counts_df):
+        self.triples.add(signature_counts_df.assign(key=pair_keys(signature_counts_df, SIGNATURE_KEYS)))
+        self.totals.add(pair_keys(signature_counts_df, TOTAL_KEYS), signature_counts_df['invocations'])
+
+    def merge(self, other):
+        self.triples.merge(other.triples)
+        self.totals.merge(other.totals)
+        return self
+
+    '''
+    Signature counts of the heavy hitters, like count_signatures() returns them, with the
+    overcount of every count as `invocations_error`.
+    '''
+    def signature_counts(self):
+        counters = self.triples.counters
+        print(f'sketched {self.transactions} transactions into {len(counters.index)} signature counts, '
+              f'keeping every triple invoked more than {self.transactions / self.triples.capacity:.0f} times')
+        return (counters
+                    .rename(columns={'count': 'invocations', 'error': 'invocations_error'})
+                    .reset_index(drop=True)
+                    [SIGNATURE_KEYS + ['invocations', 'invocations_error', 'block_timestamp']])
+
+'''
+Replace the invocations of tagged signatures, which only sum the heavy hitter callers, by
+the Count-Min totals over all callers. The true totals lie within
+[invocations - invocations_error, invocations]: the lower end sums the guaranteed counts of
+the heavy hitters, the upper end is the Count-Min estimate, which never undercounts.
+'''
+def add_error_bounds(signatures_df, signature_counts_df, sketch):
+    lower = (signature_counts_df
+                .assign(key=pair_keys(signature_counts_df, TOTAL_KEYS),
+                        lower=signature_counts_df['invocations'] - signature_counts_df['invocations_error'])
+                .groupby('key', sort=False)['lower'].sum())
+
+    keys = pair_keys(signatures_df, TOTAL_KEYS)
+    upper = sketch.totals.estimate(keys)
+    print(f'signature totals overcount by at most {sketch.totals.error_bound():.0f} invocations '
+          f'with probability {1 - sketch.totals.delta:g}')
+    return (signatures_df
+                .assign(invocations=upper,
+                        invocations_error=upper - lower.reindex(keys, fill_value=0).to_numpy())
+                .sort_values('invocations', ascending=False))
@@ -0,0 +1,9 @@
+-- Sliding-window burst stats explore writes for every (caller, contract). analyze tags
+-- callers with bursts > 0 as bots. Run once before deploying the functions that write
+-- the new columns; older rows keep NULLs.
+
+ALTER TABLE `celo-testnet-production.1_attributions.callers`
+    ADD COLUMN IF NOT EXISTS max_10s_invocations INT64,
+    ADD COLUMN IF NOT EXISTS max_1m_invocations INT64,
+    ADD COLUMN IF NOT EXISTS max_1h_invocations INT64,
+    ADD COLUMN IF NOT EXISTS bursts INT64;
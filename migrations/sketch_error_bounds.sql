@@ -0,0 +1,7 @@
+-- Error bounds the sketch engine of explore (EXPLORE_ENGINE=sketch) writes next to the
+-- approximate invocations of every signature: the true total lies within
+-- [invocations - invocations_error, invocations]. Run once before deploying explore with
+-- the sketch engine; exact runs leave the column NULL.
+
+ALTER TABLE `celo-testnet-production.1_attributions.signatures`
+    ADD COLUMN IF NOT EXISTS invocations_error INT64;
@@ -0,0 +1,30 @@
+-- Move 1_attributions.* from stringified tag tuples, e.g. "('suspicious', '1')",
+-- to typed tag / confidence_level columns. Run once before deploying the functions
+-- that write the new columns; the legacy `tags` column is kept for older readers.
+
+ALTER TABLE `celo-testnet-production.1_attributions.contracts`
+    ADD COLUMN IF NOT EXISTS tag STRING,
+    ADD COLUMN IF NOT EXISTS confidence_level FLOAT64;
+
+ALTER TABLE `celo-testnet-production.1_attributions.signatures`
+    ADD COLUMN IF NOT EXISTS tag STRING,
+    ADD COLUMN IF NOT EXISTS confidence_level FLOAT64;
+
+ALTER TABLE `celo-testnet-production.1_attributions.callers`
+    ADD COLUMN IF NOT EXISTS tag STRING,
+    ADD COLUMN IF NOT EXISTS confidence_level FLOAT64;
+
+UPDATE `celo-testnet-production.1_attributions.contracts`
+SET tag = REGEXP_EXTRACT(tags, r"^\('(\w+)'"),
+    confidence_level = CAST(REGEXP_EXTRACT(tags, r",\s*'?([0-9.]+)'?\)$") AS FLOAT64)
+WHERE tag IS NULL AND tags IS NOT NULL;
+
+UPDATE `celo-testnet-production.1_attributions.signatures`
+SET tag = REGEXP_EXTRACT(tags, r"^\('(\w+)'"),
+    confidence_level = CAST(REGEXP_EXTRACT(tags, r",\s*'?([0-9.]+)'?\)$") AS FLOAT64)
+WHERE tag IS NULL AND tags IS NOT NULL;
+
+UPDATE `celo-testnet-production.1_attributions.callers`
+SET tag = REGEXP_EXTRACT(tags, r"^\('(\w+)'"),
+    confidence_level = CAST(REGEXP_EXTRACT(tags, r",\s*'?([0-9.]+)'?\)$") AS FLOAT64)
+WHERE tag IS NULL AND tags IS NOT NULL;
@@ -1,15 +1,34 @@
-from google.cloud import bigquery
 import pandas as pd
-import pandas_gbq
-from pandasql import sqldf
+from metrics import stage, begin_run, write_report
+from pipeline import Pipeline
 
 
-bqclient = bigquery.Client()
+# created by get_client() on first use and kept across warm invocations
+bqclient = None
+
+'''
+the BigQuery client, created on first use so that importing main stays cheap on cold starts.
+pandasql and pandas_gbq are imported by the stages that need them
+'''
+def get_client():
+    global bqclient
+    if bqclient is None:
+        from google.cloud import bigquery
+        bqclient = bigquery.Client()
+    return bqclient
+
+'''
+A job declares its stages on a Pipeline. Every stage reads the values named like its parameters
+and returns the values named in `outputs`. pipeline.run() computes each value once, however many
+stages read it, and runs the stages that do not depend on each other at the same time.
+'''
+pipeline = Pipeline('template')
 
 '''
 pull in rpl_transaction data, and place into pandas dataframe
 '''
-def get_data(context):
+@pipeline.stage(outputs=['input_df'], measure=False)
+def get_data():
     print(" *** get data from appropriate source tables *** ")
     
     # Download query results.
@@ -19,23 +38,26 @@ def get_data(context):
         limit 10000
     """
 
-    df = (bqclient.query(query_string)
-                    .result().to_dataframe(create_bqstorage_client=True))
+    with stage('template.get_data') as current:
+        df = current.output(current.query_job(get_client().query(query_string))
+                                .result().to_dataframe(create_bqstorage_client=True))
     return df
-    
-
 
+'''
+Below is an example of how to use pandasql to query existing data frames: the parameters of a
+stage are the frames its queries can read
+'''
+@pipeline.stage(outputs=['signatures_df'])
 def analyze_data(input_df):
-    '''
-    Below is an example of how to use pandasql to query existing data frames
-    '''
+    from pandasql import sqldf
+
     print(' ')
     print(" *** finding frequently called signatures *** ")
     signatures_query = """
         select          
             from_address_hash, 
             to_address_hash, 
-            SUBSTR(`input`, 0, 10) as signature,
+            SUBSTR(`input`, 1, 10) as signature,
             COUNT(1) as invocations,
             'suspicious' as tag 
         from input_df
@@ -44,25 +66,50 @@ def analyze_data(input_df):
         limit 10
     """
 
+    return sqldf(signatures_query)
 
-    signatures_df = sqldf(signatures_query)
-    return contracts_df
+'''
+signatures_df is computed once and read by both stages below, which run concurrently
+'''
+@pipeline.stage(outputs=['contracts_df'])
+def find_contracts(signatures_df):
+    from pandasql import sqldf
+
+    return sqldf("""
+        select distinct to_address_hash, tag
+        from signatures_df
+    """)
 
+@pipeline.stage(outputs=['callers_df'])
+def find_callers(signatures_df):
+    from pandasql import sqldf
+
+    return sqldf("""
+        select distinct from_address_hash as caller, to_address_hash, tag
+        from signatures_df
+    """)
 
 
 def write_df(input_df, table_name):
     '''
     This function converts the contents of your dataframe (including headers) into a BQ table
     '''
+    import pandas_gbq
     project_id = 'celo-testnet-production'
     table_id = 'dataset_name.' + table_name
 
-    pandas_gbq.to_gbq(input_df, table_id, project_id=project_id, if_exists='append')
+    with stage(f'template.write.{table_name}', input_df):
+        pandas_gbq.to_gbq(input_df, table_id, project_id=project_id, if_exists='append')
     print("successfully wrote data to {}".format(project_id + '.' + table_id))
 
 
+def run(request='request', context='context'):
+    begin_run()
+    contracts_df, callers_df = pipeline.run(['contracts_df', 'callers_df'])
+    write_df(contracts_df, 'contracts')
+    write_df(callers_df, 'callers')
+    write_report('template')
+
 
 if __name__ == '__main__':
-    df_results = get_data(context='context')
-    df_to_table = explore(df_results)
-    write_df(df_to_table, 'table_name')
\ No newline at end of file
+    run()
@@ -0,0 +1,153 @@
+'''
+Stage DAG runner, kept identical in bot_attribution_explore, bot_attribution_analyze and template.
+
+A job declares its stages on a Pipeline: every stage is a function whose parameters name
+the values it reads, and which returns the values it names as outputs. run() only computes
+the stages its targets need, skips stages whose outputs are passed in, computes every
+intermediate once however many stages read it, and runs stages whose inputs are ready
+concurrently. A stage registered twice with the same function and inputs is detected and
+computed once under both names.
+
+    pipeline = Pipeline('job')
+
+    @pipeline.stage()
+    def transactions():
+        ...
+
+    @pipeline.stage(outputs=['callers', 'contracts'])
+    def tag(transactions):
+        ...
+
+    callers_df, contracts_df = pipeline.run(['callers', 'contracts'])
+'''
+import inspect
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from metrics import stage
+
+
+# stages of a run computed at the same time, 1 computes them one after another
+PIPELINE_WORKERS = int(os.environ.get('PIPELINE_WORKERS', 4))
+
+class Node:
+    def __init__(self, name, func, inputs, outputs, measure):
+        self.name = name
+        self.func = func
+        self.inputs = inputs
+        self.outputs = outputs
+        self.measure = measure
+
+class Pipeline:
+    def __init__(self, name, max_workers=PIPELINE_WORKERS):
+        self.name = name
+        self.max_workers = max_workers
+        self.nodes = {}
+        # value name -> the node computing it
+        self.producers = {}
+        # value name -> the value of an identical stage registered before
+        self.aliases = {}
+
+    '''
+    Decorator adding a function as a stage. Inputs default to its parameter names and the
+    output to its name. Stages measuring themselves (e.g. to report BigQuery bytes) pass
+    measure=False, the others are measured as a <pipeline>.<stage> stage.
+    '''
+    def stage(self, name=None, inputs=None, outputs=None, measure=True):
+        def decorator(func):
+            self.add(func, name, inputs, outputs, measure)
+            return func
+        return decorator
+
+    def add(self, func, name=None, inputs=None, outputs=None, measure=True):
+        name = name or func.__name__
+        inputs = list(inputs if inputs is not None else inspect.signature(func).parameters)
+        outputs = list(outputs or [name])
+
+        for node in self.nodes.values():
+            if node.func is func and [self.resolve(value) for value in node.inputs] == \
+                    [self.resolve(value) for value in inputs] and len(node.outputs) == len(outputs):
+                print(f'{self.name}.{name} repeats {self.name}.{node.name}, computing it once')
+                self.aliases.update(zip(outputs, node.outputs))
+                return node
+
+        for value in outputs:
+            if value in self.producers or value in self.aliases:
+                raise ValueError(f'{self.name}: {value} is already computed by another stage')
+        node = self.nodes[name] = Node(name, func, inputs, outputs, measure)
+        self.producers.update((value, node) for value in outputs)
+        return node
+
+    def resolve(self, value):
+        while value in self.aliases:
+            value = self.aliases[value]
+        return value
+
+    '''
+    The stages computing `targets` from `values`, each after the stages it reads from.
+    '''
+    def plan(self, targets, values=()):
+        order, visiting = [], set()
+
+        def visit(value):
+            value = self.resolve(value)
+            if value in values:
+                return
+            if value not in self.producers:
+                raise ValueError(f'{self.name}: no stage computes {value} and it was not passed in')
+            node = self.producers[value]
+            if node in order:
+                return
+            if node.name in visiting:
+                raise ValueError(f'{self.name}: stage {node.name} depends on itself')
+            visiting.add(node.name)
+            for input_value in node.inputs:
+                visit(input_value)
+            visiting.discard(node.name)
+            order.append(node)
+
+        for target in targets:
+            visit(target)
+        return order
+
+    def _compute(self, node, memo):
+        args = [memo[self.resolve(value)] for value in node.inputs]
+        if not node.measure:
+            result = node.func(*args)
+        else:
+            with stage(f'{self.name}.{node.name}', [arg for arg in args if arg is not None]) as current:
+                result = current.output(node.func(*args))
+        return dict(zip(node.outputs, result if len(node.outputs) > 1 else [result]))
+
+    '''
+    Compute `targets` (a value name or a list of them), starting from the given `values`.
+    Returns the value, or a tuple of the values in the order of the targets. The first
+    failing stage raises once the stages running next to it finished.
+    '''
+    def run(self, targets, values=None):
+        memo = {self.resolve(name): value for name, value in (values or {}).items()}
+        names = [targets] if isinstance(targets, str) else list(targets)
+        order = self.plan(names, memo)
+
+        waiting = {node: {self.producers[self.resolve(value)] for value in node.inputs
+                          if self.resolve(value) not in memo} for node in order}
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as pool:
+            running = {}
+            while waiting or running:
+                for node in [node for node, needs in waiting.items() if not needs]:
+                    del waiting[node]
+                    running[pool.submit(self._compute, node, memo)] = node
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    if future.exception() is not None:
+                        for pending in running:
+                            pending.cancel()
+                        wait(running)
+                        raise future.exception()
+                    memo.update(future.result())
+                    for needs in waiting.values():
+                        needs.discard(node)
+
+        results = tuple(memo[self.resolve(name)] for name in names)
+        return results[0] if isinstance(targets, str) else results
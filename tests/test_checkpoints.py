@@ -0,0 +1,65 @@
+'''
+Resuming explore from its stage checkpoints, see benchmarks/bench_checkpoints.py.
+'''
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.bench_checkpoints import bench_explore
+from benchmarks.fakes import load_stage
+from benchmarks.synthetic import addresses, generate_transactions
+
+
+explore = load_stage('explore')
+# importable once load_stage() put the stage on sys.path
+from checkpoint import Checkpoints
+from encoding import AddressDictionary, decode_frame, encode_transactions
+from engine import count_signatures
+from rate import RateDetector, add_burst_stats
+
+
+def test_explore_resumes(tmp_path):
+    timings = bench_explore(generate_transactions(30000), str(tmp_path))
+    assert set(timings) == {'clean', 'failed', 'resumed', 'from_aggregate'}
+
+
+def test_resume_from_aggregate_read_in_chunks(tmp_path, monkeypatch):
+    # Parquet reads more than 2^17 rows back in several chunks
+    rng = np.random.RandomState(0)
+    callers, contracts = addresses(rng, 5000), addresses(rng, 500)
+    rows = 200000
+    # a second apart, so the few pairs taking most transactions burst
+    transactions_df = pd.DataFrame({'from_address_hash': callers[np.minimum(rng.zipf(1.5, rows), len(callers)) - 1],
+                                    'to_address_hash': contracts[np.minimum(rng.zipf(1.5, rows), len(contracts)) - 1],
+                                    'signature': ['0x%08x' % value for value in rng.randint(0, 2 ** 31, rows)],
+                                    'block_timestamp': pd.Timestamp('2022-01-01', tz='UTC')
+                                                       + pd.to_timedelta(np.arange(rows), unit='s')})
+    # encoded batch by batch like a stream, so ids follow the transactions rather than the counts
+    encoded, detector = AddressDictionary(), RateDetector()
+    batches = [encode_transactions(transactions_df.iloc[start:start + 50000], encoded) for start in range(0, rows, 50000)]
+    for batch in batches:
+        detector.add(batch)
+    aggregated = (count_signatures(pd.concat(batches, ignore_index=True)), detector.stats(), encoded)
+    expected_df = burst_callers(*aggregated)
+    assert expected_df['bursts'].sum() > 0
+
+    checkpoints = lambda: Checkpoints('explore', window='test', directory=str(tmp_path))
+    monkeypatch.setattr(explore, 'get_signature_counts', lambda: aggregated)
+    first = explore.checkpointed_signature_counts(checkpoints())
+    monkeypatch.setattr(explore, 'get_signature_counts', lambda: pytest.fail('aggregated again'))
+    resumed = explore.checkpointed_signature_counts(checkpoints())
+
+    for signature_counts_df, burst_stats_df, ids in (first, resumed):
+        assert len(signature_counts_df.index) > 2 ** 17
+        pd.testing.assert_frame_equal(decode_frame(signature_counts_df, ids), decode_frame(aggregated[0], encoded),
+                                      check_dtype=False)
+        # the burst stats match the callers again once encoded with a fresh dictionary
+        pd.testing.assert_frame_equal(burst_callers(signature_counts_df, burst_stats_df, ids), expected_df)
+
+
+def burst_callers(signature_counts_df, burst_stats_df, ids):
+    callers_df = (signature_counts_df[['from_address_hash', 'to_address_hash']].drop_duplicates()
+                      .rename(columns={'from_address_hash': 'caller'}))
+    return (decode_frame(add_burst_stats(callers_df, burst_stats_df), ids)
+                .sort_values(['caller', 'to_address_hash'])
+                .reset_index(drop=True))
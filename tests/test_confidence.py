@@ -0,0 +1,39 @@
+'''
+Confidence levels are float32 in memory and written as the FLOAT64 the tables hold.
+'''
+from unittest import mock
+
+import pandas as pd
+
+from benchmarks.fakes import FakeWriter, load_stage
+
+
+explore = load_stage('explore')
+load_stage('analyze')
+# importable once load_stage() put both stages on sys.path
+from tagging import tag_columns
+from writer import staging_frame
+
+CONFIDENCE = [0.95, 0.7, 0.6, 0.36]
+
+
+def tagged():
+    callers_df = pd.DataFrame({'caller': [f'0x{caller:040x}' for caller in range(4)], 'to_address_hash': '0x' + 'c' * 40})
+    return tag_columns(callers_df, 'bot', CONFIDENCE)
+
+
+def test_staged_as_float64():
+    callers_df = tagged()
+    assert callers_df['confidence_level'].dtype == 'float32'
+    staging_df = staging_frame({'callers': callers_df})
+    assert staging_df['confidence_level'].dtype == 'float64'
+    assert staging_df['confidence_level'].tolist() == CONFIDENCE
+
+
+def test_explore_writes_float64():
+    writer = FakeWriter()
+    with mock.patch('pandas_gbq.to_gbq', writer.to_gbq):
+        explore.write_df(tagged(), 'callers', explore.callers_schema)
+    written_df, = writer.tables['1_attributions.callers']
+    assert written_df['confidence_level'].dtype == 'float64'
+    assert written_df['confidence_level'].tolist() == CONFIDENCE
@@ -0,0 +1,50 @@
+'''
+Delta writes of explore and analyze against their snapshots, see benchmarks/bench_delta.py.
+'''
+import os
+
+import pandas as pd
+
+from benchmarks.fakes import load_stage
+
+
+load_stage('analyze')
+# importable once load_stage() put the stage on sys.path
+from delta import Snapshot
+from writer import TABLES, LocalBackend, write_results
+
+KEYS = TABLES['callers']['keys']
+CALLERS = pd.DataFrame({'caller': ['0x' + 'a' * 40, '0x' + 'b' * 40], 'to_address_hash': ['0x' + 'c' * 40] * 2,
+                        'tag': 'bot', 'confidence_level': [1.0, 0.6]})
+
+
+def write(snapshot, callers_df, keys):
+    delta = snapshot.diff('callers', callers_df, KEYS, keys)
+    snapshot.commit(delta, KEYS)
+    return delta
+
+
+def test_stages_keep_their_own_snapshots(tmp_path):
+    explore, analyze = Snapshot('explore', str(tmp_path)), Snapshot('analyze', str(tmp_path))
+    # explore hashes more columns than analyze merges
+    assert write(explore, CALLERS.assign(bursts=[3, 0]), ['tag', 'confidence_level', 'bursts']).new == 2
+    assert write(analyze, CALLERS, ['tag', 'confidence_level']).new == 2
+
+    assert sorted(os.listdir(tmp_path)) == ['analyze', 'explore']
+    assert write(explore, CALLERS.assign(bursts=[3, 0]), ['tag', 'confidence_level', 'bursts']).skipped == 2
+    assert write(analyze, CALLERS, ['tag', 'confidence_level']).skipped == 2
+
+
+def test_analyze_merges_appended_keys_again(tmp_path):
+    snapshot, backend = Snapshot('analyze', str(tmp_path)), LocalBackend()
+    contracts, signatures = (pd.DataFrame(columns=TABLES[table]['insert']) for table in ('contracts', 'signatures'))
+    assert write_results(backend, contracts, signatures, CALLERS, snapshot=snapshot) == {
+        'contracts': 0, 'signatures': 0, 'callers': 2}
+    assert write_results(backend, contracts, signatures, CALLERS, snapshot=snapshot) == {}
+
+    # explore appended a suspicious row for the first caller, read by the next analyze run
+    appended = CALLERS.head(1).assign(tag='suspicious', confidence_level=1.0)
+    backend.tables['callers'].loc[0, 'tag'] = 'suspicious'
+    counts = write_results(backend, contracts, signatures, CALLERS, snapshot=snapshot, stale={'callers': appended})
+    assert counts['callers'] == 1
+    assert (backend.tables['callers']['tag'] == 'bot').all()
@@ -0,0 +1,68 @@
+'''
+Address and selector encoding of explore, on frames read back from Arrow in several chunks.
+'''
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from benchmarks.fakes import load_stage
+from benchmarks.synthetic import generate_transactions
+
+
+explore = load_stage('explore')
+# importable once load_stage() put the stage on sys.path
+from encoding import AddressDictionary, decode_frame, encode_transactions
+from incremental import load_state, save_state
+
+
+def calls(n):
+    # contract creations have no to_address_hash to compare
+    transactions_df = generate_transactions(n)
+    return transactions_df[transactions_df['to_address_hash'].notna()].reset_index(drop=True)
+
+
+def round_trip(df):
+    addresses = AddressDictionary()
+    decoded = decode_frame(encode_transactions(df, addresses), addresses)
+    return decoded[['from_address_hash', 'to_address_hash', 'signature']]
+
+
+def expected(df):
+    return df[['from_address_hash', 'to_address_hash']].assign(signature=df['input'].str.slice(0, 10))
+
+
+def test_multi_row_group_parquet(tmp_path):
+    transactions_df = calls(20000)
+    path = os.path.join(tmp_path, 'transactions.parquet')
+    transactions_df.to_parquet(path, row_group_size=5000)
+    assert pq.ParquetFile(path).num_row_groups > 1
+
+    read_df = pd.read_parquet(path)
+    pd.testing.assert_frame_equal(round_trip(read_df), expected(transactions_df), check_dtype=False)
+
+
+def test_concatenated_tables():
+    transactions_df = calls(20000)
+    table = pa.concat_tables(pa.Table.from_pandas(part, preserve_index=False)
+                             for part in (transactions_df.iloc[:10000], transactions_df.iloc[10000:]))
+    pd.testing.assert_frame_equal(round_trip(table.to_pandas()), expected(transactions_df), check_dtype=False)
+
+
+def test_state_with_several_row_groups(tmp_path):
+    transactions_df = generate_transactions(20000)
+    counts_df = (transactions_df.assign(signature=transactions_df['input'].str.slice(0, 10))
+                     .groupby(['from_address_hash', 'to_address_hash', 'signature']).size()
+                     .rename('transaction_count').reset_index())
+    path = os.path.join(tmp_path, 'state.parquet')
+    save_state(path, counts_df, 42)
+    # a grown state is written in several row groups
+    pq.write_table(pq.read_table(path), path, row_group_size=1000)
+    assert pq.ParquetFile(path).num_row_groups > 1
+
+    state_df, watermark = load_state(path)
+    addresses = AddressDictionary()
+    decoded = decode_frame(encode_transactions(state_df, addresses), addresses)
+    assert watermark == 42
+    pd.testing.assert_frame_equal(decoded, counts_df, check_dtype=False)
@@ -0,0 +1,13 @@
+'''
+The pandas engine of explore() against the original sqldf queries, see
+benchmarks/compare_explore_engines.py for their timings.
+'''
+import pytest
+
+from benchmarks.compare_explore_engines import compare
+
+
+@pytest.mark.parametrize('transactions', [500, 5000])
+def test_engines_match(transactions):
+    # compare() asserts the contracts, signatures and callers of both engines are the same
+    compare(transactions)
@@ -0,0 +1,118 @@
+'''
+Updates of the feature store appended as segments, and fed by full and backfill runs, see
+benchmarks/bench_features.py.
+'''
+import os
+import sys
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from benchmarks.fakes import load_stage, transactions_client
+from benchmarks.synthetic import START, generate_transactions
+
+
+explore = load_stage('explore')
+# backfill imports main by its Cloud Function name, so it shares the patched stage
+sys.modules['main'] = explore
+# importable once load_stage() put the stage on sys.path
+import backfill
+import features
+from features import TRANSACTION_COLUMNS, FeatureStore
+from ingest import query_batches, window_signature_query
+
+
+def transactions():
+    transactions_df = generate_transactions(20000)
+    transactions_df['signature'] = transactions_df['input'].str.slice(0, 10)
+    return transactions_df
+
+
+def fold(store, transactions_df):
+    table = pa.Table.from_pandas(transactions_df[TRANSACTION_COLUMNS], preserve_index=False)
+    for _ in store.observe(table.to_batches(max_chunksize=5000)):
+        pass
+    return store.update()
+
+
+def increments(transactions_df, runs):
+    blocks = transactions_df['block_number'].to_numpy()
+    cuts = blocks.searchsorted(blocks[np.linspace(0, len(blocks), runs + 1).astype(int)[1:] - 1], side='right')
+    return [transactions_df.iloc[:cut] for cut in cuts]
+
+
+def files(directory):
+    return {entry.name: entry.stat().st_mtime_ns for entry in os.scandir(directory)}
+
+
+def test_updates_append_segments(tmp_path):
+    transactions_df = transactions()
+    directory = str(tmp_path / 'incremental')
+    written = {}
+    for increment in increments(transactions_df, 3):
+        fold(FeatureStore(directory), increment)
+        current = files(directory)
+        # earlier segments are left as they were
+        assert all(current[name] == modified for name, modified in written.items())
+        written = current
+    assert sorted(written) == [f'{name}-{sequence:08d}.arrow' for name in ('counterparties', 'features', 'selectors')
+                               for sequence in (1, 2, 3)]
+
+    once = FeatureStore(str(tmp_path / 'once'))
+    fold(once, transactions_df)
+    callers = transactions_df['from_address_hash'].dropna().drop_duplicates()
+    pd.testing.assert_frame_equal(FeatureStore(directory).lookup(callers), once.lookup(callers))
+
+
+def test_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(features, 'FEATURE_SEGMENTS', 2)
+    transactions_df = transactions()
+    directory = str(tmp_path / 'incremental')
+    for increment in increments(transactions_df, 5):
+        fold(FeatureStore(directory), increment)
+    store = FeatureStore(directory)
+    # segments 1 to 3 compacted into 4, then 4 to 6 into 7
+    assert store.sequences == [7]
+    assert sorted(files(directory)) == [f'{name}-00000007.arrow' for name in ('counterparties', 'features', 'selectors')]
+
+    once = FeatureStore(str(tmp_path / 'once'))
+    fold(once, transactions_df)
+    callers = transactions_df['from_address_hash'].dropna().drop_duplicates()
+    pd.testing.assert_frame_equal(store.lookup(callers), once.lookup(callers))
+
+
+def built_once(directory, transactions_df):
+    once = FeatureStore(directory)
+    fold(once, transactions_df)
+    callers = transactions_df['from_address_hash'].dropna().drop_duplicates()
+    return once.lookup(callers), callers
+
+
+def test_full_runs(tmp_path):
+    transactions_df = transactions()
+    source = str(tmp_path / 'transactions.parquet')
+    directory = str(tmp_path / 'full')
+    # full runs read overlapping windows, the blocks folded already are skipped
+    for first, last in ((0, 12000), (6000, None)):
+        transactions_df.iloc[first:last].drop(columns='signature').to_parquet(source)
+        explore.get_signature_counts(source, workers=1, features=FeatureStore(directory))
+
+    expected_df, callers = built_once(str(tmp_path / 'once'), transactions_df)
+    pd.testing.assert_frame_equal(FeatureStore(directory).lookup(callers), expected_df)
+
+
+def test_backfill(tmp_path):
+    transactions_df = transactions()
+    client = transactions_client(transactions_df)
+    read_window = lambda start, end: query_batches(client, window_signature_query.format(start=start, end=end))
+    end = transactions_df['block_timestamp'].max() + pd.Timedelta(seconds=1)
+    directory = str(tmp_path / 'backfill')
+    with mock.patch.object(explore, 'bqclient', client):
+        backfill.count_windows(read_window, START, end, '6h', workers=4, features=FeatureStore(directory))
+
+    store = FeatureStore(directory)
+    assert len(store.sequences) == len(backfill.split_windows(START, end, '6h'))
+    expected_df, callers = built_once(str(tmp_path / 'once'), transactions_df)
+    pd.testing.assert_frame_equal(store.lookup(callers), expected_df)
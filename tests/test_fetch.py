@@ -0,0 +1,64 @@
+'''
+Concurrent fetches of get_tagged_data() under fake query latency, see benchmarks/bench_fetch.py
+for their timings.
+'''
+import threading
+from unittest import mock
+
+import pandas as pd
+
+from benchmarks import fakes
+from benchmarks.bench_fetch import tagged_tables
+from benchmarks.fakes import load_stage, transactions_client
+from benchmarks.synthetic import generate_smart_contracts, generate_transactions
+
+
+analyze = load_stage('analyze')
+
+
+class InFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+
+    def wrap(self, result):
+        def counted(job, timeout=None):
+            with self.lock:
+                self.current += 1
+                self.peak = max(self.peak, self.current)
+            try:
+                return result(job, timeout)
+            finally:
+                with self.lock:
+                    self.current -= 1
+        return counted
+
+
+def fetch(client, workers, directory):
+    in_flight = InFlight()
+    with mock.patch.object(analyze, 'bqclient', client), \
+         mock.patch.object(fakes.FakeQueryJob, 'result', in_flight.wrap(fakes.FakeQueryJob.result)):
+        results = analyze.get_tagged_data(max_workers=workers, whitelist_path=str(directory / 'smart_contracts.parquet'),
+                                          fingerprint_path=str(directory / 'fingerprints.parquet'))
+    return results, in_flight.peak
+
+
+def test_concurrent_fetch_matches_sequential(tmp_path):
+    transactions_df = generate_transactions(20000)
+    smart_contracts_df = generate_smart_contracts(transactions_df)
+    client = transactions_client(transactions_df, smart_contracts_df, tagged_tables(transactions_df, smart_contracts_df),
+                                 latency=0.2)
+
+    (*sequential, sequential_whitelist, sequential_fingerprints), sequential_peak = fetch(client, 1, tmp_path)
+    queried = len(client.queries)
+    # the second run finds the whitelist and fingerprint caches warm
+    (*concurrent, concurrent_whitelist, concurrent_fingerprints), concurrent_peak = fetch(client, 4, tmp_path)
+
+    assert sequential_peak == 1
+    assert concurrent_peak > 1
+    assert len(client.queries) == 2 * queried
+    for sequential_df, concurrent_df in zip(sequential, concurrent):
+        pd.testing.assert_frame_equal(sequential_df, concurrent_df)
+    assert sequential_whitelist.addresses.equals(concurrent_whitelist.addresses)
+    pd.testing.assert_frame_equal(sequential_fingerprints.fingerprints_df, concurrent_fingerprints.fingerprints_df)
@@ -0,0 +1,46 @@
+'''
+Refreshing the byte code fingerprint store with the contract creations after the stored ones.
+'''
+import os
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.fakes import load_stage, transactions_client
+from benchmarks.synthetic import generate_transactions
+
+
+load_stage('analyze')
+# importable once load_stage() put the stage on sys.path
+import fingerprints
+
+
+def test_empty_store_reads_a_bounded_window():
+    query = fingerprints.delta_query(fingerprints.read_store('/nonexistent/fingerprints.parquet'))
+    assert f'block_timestamp >= TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL -{fingerprints.FINGERPRINT_WINDOW_DAYS} DAY)' in query
+    assert 'block_number > -1' in query
+
+
+def test_refresh_reads_after_the_stored_creations(tmp_path):
+    transactions_df = generate_transactions(50000)
+    creations_df = transactions_df[transactions_df['created_contract_address_hash'].notna()]
+    cut = creations_df['block_number'].iloc[len(creations_df.index) // 2]
+    path = os.path.join(tmp_path, 'fingerprints.parquet')
+
+    client = transactions_client(transactions_df[transactions_df['block_number'] <= cut])
+    store_df = fingerprints.read_store(path)
+    fingerprints.update_store(store_df, client.query(fingerprints.delta_query(store_df)).result().to_dataframe(), path)
+
+    store_df = fingerprints.read_store(path)
+    query = fingerprints.delta_query(store_df)
+    last_seen = creations_df.loc[creations_df['block_number'] <= cut, 'block_timestamp'].max()
+    assert f"block_timestamp >= TIMESTAMP('{last_seen:%Y-%m-%d %H:%M:%S.%f+00}')" in query
+    assert f'block_number > {cut}' in query
+
+    delta_df = transactions_client(transactions_df).query(query).result().to_dataframe()
+    assert np.array_equal(delta_df['block_number'], creations_df.loc[creations_df['block_number'] > cut, 'block_number'])
+    store = fingerprints.update_store(store_df, delta_df, path)
+    assert len(store) == len(creations_df.index)
+    pd.testing.assert_series_equal(fingerprints.read_store(path)['address_hash'],
+                                   creations_df['created_contract_address_hash'].reset_index(drop=True),
+                                   check_names=False, check_dtype=False)
@@ -0,0 +1,77 @@
+'''
+Incremental runs folding a day of transactions in two passes against one full explore() of the day.
+'''
+from unittest import mock
+
+import pandas as pd
+
+from benchmarks.fakes import load_stage, transactions_client
+from benchmarks.synthetic import generate_transactions
+
+
+explore = load_stage('explore')
+# importable once load_stage() put the stage on sys.path
+from encoding import AddressDictionary, encode_transactions
+from features import NO_FEATURES
+from incremental import load_state, save_state
+
+
+def latest(frames, columns):
+    return pd.concat(frames, ignore_index=True).drop_duplicates(columns, keep='last')
+
+
+# contract creations have no to_address_hash
+def keys(df, columns):
+    return set(df[columns].fillna('').itertuples(index=False, name=None))
+
+
+def invocations(signatures_df):
+    return (signatures_df.set_index(['to_address_hash', 'signature'])['invocations']
+                .astype('int64')
+                .sort_index())
+
+
+def passes(transactions_df, middle, source, state_path):
+    written, watermarks = [], []
+    # the second pass reads the whole day again, the blocks below the watermark are skipped
+    for day_df in (transactions_df[transactions_df['block_number'] <= middle], transactions_df):
+        day_df.to_parquet(source)
+        addresses = AddressDictionary()
+        state_counts_df, watermark = load_state(state_path)
+        if state_counts_df is not None:
+            state_counts_df = encode_transactions(state_counts_df, addresses)
+        contracts_df, signatures_df, callers_df, state_counts_df, watermark_df = explore.explore_new_blocks(
+            state_counts_df, watermark, addresses, source, NO_FEATURES)
+        save_state(state_path, state_counts_df, int(watermark_df['watermark'].iloc[0]))
+        written.append((contracts_df, signatures_df, callers_df))
+        watermarks.append(int(watermark_df['watermark'].iloc[0]))
+    return written, watermarks
+
+
+def test_two_passes_match_a_full_run(tmp_path):
+    transactions_df = generate_transactions(20000).sort_values('block_number', kind='stable').reset_index(drop=True)
+    middle = transactions_df['block_number'].iloc[len(transactions_df.index) // 2]
+    source, state_path = str(tmp_path / 'transactions.parquet'), str(tmp_path / 'state.parquet')
+
+    with mock.patch.object(explore, 'bqclient', transactions_client(transactions_df)):
+        written, watermarks = passes(transactions_df, middle, source, state_path)
+        _, full_signatures_df, full_callers_df = explore.explore(transactions_df)
+    assert watermarks == [middle, transactions_df['block_number'].max()]
+
+    # the running counts are the counts of the full day
+    state_counts_df, _ = load_state(state_path)
+    assert state_counts_df['invocations'].sum() == len(transactions_df.index)
+    # and the last row written per signature holds the invocations a full run finds
+    signatures_df = latest([signatures_df for _, signatures_df, _ in written], ['to_address_hash', 'signature'])
+    pd.testing.assert_series_equal(invocations(signatures_df), invocations(full_signatures_df))
+    callers_df = latest([callers_df for _, _, callers_df in written], ['caller', 'to_address_hash'])
+    assert keys(callers_df, ['caller', 'to_address_hash']) == keys(full_callers_df, ['caller', 'to_address_hash'])
+
+    # the second pass only writes the rows the second half of the day changed
+    second_half_df = transactions_df[transactions_df['block_number'] > middle].assign(
+        signature=lambda df: df['input'].str.slice(0, 10), caller=lambda df: df['from_address_hash'])
+    _, second_signatures_df, second_callers_df = written[1]
+    assert keys(second_signatures_df, ['to_address_hash', 'signature']) <= \
+        keys(second_half_df, ['to_address_hash', 'signature'])
+    assert keys(second_callers_df, ['caller', 'to_address_hash']) <= keys(second_half_df, ['caller', 'to_address_hash'])
+    assert len(second_signatures_df.index) < len(signatures_df.index)
@@ -0,0 +1,54 @@
+'''
+Counting transactions streamed in batches from the offline sources against counting them in memory.
+'''
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from benchmarks.fakes import load_stage
+from benchmarks.synthetic import generate_transactions
+
+
+load_stage('explore')
+# importable once load_stage() put the stage on sys.path
+import ingest
+from encoding import AddressDictionary, decode_frame
+from engine import SIGNATURE_KEYS, count_signatures
+from ingest import TRANSACTION_COLUMNS, file_batches, stream_signature_counts
+
+
+# both sources in several row groups or record batches
+def write_source(transactions_df, path):
+    table = pa.Table.from_pandas(transactions_df[TRANSACTION_COLUMNS], preserve_index=False)
+    if path.endswith('.parquet'):
+        pq.write_table(table, path, row_group_size=3000)
+    else:
+        with pa.ipc.new_file(path, table.schema) as writer:
+            writer.write_table(table, max_chunksize=3000)
+
+
+def sorted_counts(signature_counts_df):
+    return signature_counts_df.sort_values(SIGNATURE_KEYS).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('name', ['transactions.parquet', 'transactions.arrow'])
+@pytest.mark.parametrize('encoded', [False, True])
+def test_streamed_counts_match_in_memory(tmp_path, monkeypatch, name, encoded):
+    transactions_df = generate_transactions(30000)
+    path = str(tmp_path / name)
+    write_source(transactions_df, path)
+
+    merges = []
+    merge_signature_counts = ingest.merge_signature_counts
+    monkeypatch.setattr(ingest, 'merge_signature_counts',
+                        lambda frames: merges.append(len(frames)) or merge_signature_counts(frames))
+    addresses = AddressDictionary() if encoded else None
+    streamed_df = stream_signature_counts(file_batches(path, batch_size=2000), addresses=addresses)
+    if encoded:
+        streamed_df = decode_frame(streamed_df, addresses)
+
+    # the running counts were merged several times, not only once at the end
+    assert len(merges) > 1
+    expected_df = count_signatures(transactions_df.assign(signature=transactions_df['input'].str.slice(0, 10)))
+    pd.testing.assert_frame_equal(sorted_counts(streamed_df), sorted_counts(expected_df), check_dtype=False)
@@ -0,0 +1,93 @@
+'''
+The stage DAG runner shared by explore, analyze and the template, see benchmarks/bench_pipeline.py.
+'''
+import collections
+import filecmp
+import os
+import threading
+
+import pytest
+
+from benchmarks.fakes import ROOT, load_stage
+
+
+load_stage('explore')
+# importable once load_stage() put the stage on sys.path
+from pipeline import Pipeline
+
+
+def diamond(calls, max_workers=4, barrier=None):
+    pipeline = Pipeline('diamond', max_workers=max_workers)
+
+    def called(name, value):
+        calls[name] += 1
+        return value
+
+    @pipeline.stage()
+    def source():
+        return called('source', 1)
+
+    # the two sides only read the source, so they can run at the same time
+    @pipeline.stage()
+    def left(source):
+        if barrier is not None:
+            barrier.wait()
+        return called('left', source + 1)
+
+    @pipeline.stage()
+    def right(source):
+        if barrier is not None:
+            barrier.wait()
+        return called('right', source * 10)
+
+    @pipeline.stage()
+    def sink(left, right):
+        return called('sink', left + right)
+
+    return pipeline
+
+
+def test_shared_stages_run_once():
+    calls = collections.Counter()
+    assert diamond(calls).run(['sink', 'left', 'source']) == (12, 2, 1)
+    assert calls == {'source': 1, 'left': 1, 'right': 1, 'sink': 1}
+
+
+def test_passed_values_skip_their_stages():
+    calls = collections.Counter()
+    assert diamond(calls).run('sink', {'source': 2}) == 23
+    assert calls == {'left': 1, 'right': 1, 'sink': 1}
+
+
+def test_independent_stages_overlap():
+    # both sides wait for each other, which only returns when they run at the same time
+    barrier = threading.Barrier(2, timeout=5)
+    assert diamond(collections.Counter(), barrier=barrier).run('sink') == 12
+    with pytest.raises(threading.BrokenBarrierError):
+        diamond(collections.Counter(), max_workers=1, barrier=threading.Barrier(2, timeout=0.2)).run('sink')
+
+
+def test_failing_stage_raises():
+    pipeline = diamond(collections.Counter())
+
+    @pipeline.stage()
+    def broken(left):
+        raise RuntimeError('broken stage')
+
+    with pytest.raises(RuntimeError, match='broken stage'):
+        pipeline.run(['broken', 'right'])
+
+
+def test_repeated_stage_is_aliased():
+    calls = collections.Counter()
+    pipeline = diamond(calls)
+    # the same function over the same inputs under another name
+    pipeline.add(pipeline.nodes['left'].func, name='left_again')
+    assert pipeline.run(['left', 'left_again']) == (2, 2)
+    assert calls == {'source': 1, 'left': 1}
+
+
+def test_copies_are_identical():
+    copies = [os.path.join(ROOT, directory, 'pipeline.py')
+              for directory in ('bot_attribution_explore', 'bot_attribution_analyze', 'template')]
+    assert all(filecmp.cmp(copies[0], copy, shallow=False) for copy in copies[1:])
@@ -0,0 +1,63 @@
+'''
+Propagation of bot tags from the known bots in analyze, in the local and the pushdown engine.
+'''
+import sqlite3
+
+import pandas as pd
+
+from benchmarks.fakes import load_stage
+
+
+analyze = load_stage('analyze')
+# importable once load_stage() put the stage on sys.path
+import pushdown
+
+TRANSFER = '0xa9059cbb'
+SEED, TOKEN = '0x' + '1' * 40, '0x' + '2' * 40
+BOT, HUMAN = '0x' + 'b' * 40, '0x' + 'c' * 40
+
+
+def suspicious(df):
+    return df.assign(tag='suspicious', confidence_level=1.0)
+
+
+# a known bot, one of the contracts of the 1000 most invoked signatures, sharing only the
+# transfer selector with a token a human calls
+SIGNATURES = suspicious(pd.DataFrame({
+    'to_address_hash': [SEED] * 1000 + [TOKEN],
+    'signature': [TRANSFER] + ['0x%08x' % selector for selector in range(1, 1000)] + [TRANSFER],
+    'invocations': list(range(2000, 1000, -1)) + [3]}))
+CALLERS = suspicious(pd.DataFrame({'caller': [BOT, HUMAN], 'to_address_hash': [SEED, TOKEN], 'bursts': [0, 0]}))
+
+
+def tags(df, keys):
+    return dict(zip(df[keys].itertuples(index=False, name=None), df['confidence_level'].astype('float64').round(6)))
+
+
+def expected_signatures():
+    return {**{(SEED, signature): 1.0 for signature in SIGNATURES['signature'].iloc[:1000]}, (TOKEN, TRANSFER): 0.6}
+
+
+def test_shared_signature_does_not_tag_callers():
+    signatures_df, callers_df = analyze.analyze_pipeline.run(
+        ['propagated_signatures', 'propagated_callers'],
+        {'signatures': SIGNATURES, 'callers': CALLERS})
+
+    assert tags(signatures_df, ['to_address_hash', 'signature']) == expected_signatures()
+    assert tags(callers_df, ['caller', 'to_address_hash']) == {(BOT, SEED): 1.0}
+
+
+def test_pushdown_shared_signature_does_not_tag_callers():
+    connection = sqlite3.connect(':memory:')
+    SIGNATURES.to_sql('signatures', connection, index=False)
+    CALLERS.to_sql('callers', connection, index=False)
+    SIGNATURES[['to_address_hash', 'tag']].head(0).to_sql('contracts', connection, index=False)
+    pd.DataFrame({'address_hash': []}).to_sql('smart_contracts', connection, index=False)
+    for statement in pushdown.heuristic_statements({table: table for table in
+                                                    ('contracts', 'signatures', 'callers', 'smart_contracts')}):
+        connection.execute(statement)
+
+    signatures_df = pd.read_sql('select * from bot_signatures_candidates', connection)
+    callers_df = pd.read_sql('select * from bot_callers_candidates', connection)
+    assert tags(signatures_df, ['to_address_hash', 'signature']) == expected_signatures()
+    assert tags(callers_df, ['caller', 'to_address_hash']) == {(BOT, SEED): 1.0}
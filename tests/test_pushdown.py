@@ -0,0 +1,34 @@
+'''
+The BigQuery script of the pushdown engine. Its heuristics are checked against the local
+engine on SQLite by benchmarks/compare_analyze_engines.py.
+'''
+import re
+
+from benchmarks.fakes import load_stage
+
+
+analyze = load_stage('analyze')
+# importable once load_stage() put the stage on sys.path
+from pushdown import analyze_script
+from writer import TABLES
+
+
+def statements(script):
+    return [statement.strip() for statement in script.split(';') if statement.strip()]
+
+
+def test_declarations_open_the_script():
+    script = statements(analyze_script('project', 'dataset'))
+    declared = [statement.startswith('DECLARE') for statement in script]
+    assert sum(declared) == len(TABLES)
+    assert declared == sorted(declared, reverse=True)
+
+
+def test_script_merges_and_drops_the_staging_table():
+    script = analyze_script('project', 'dataset')
+    for table in TABLES:
+        assert re.search(rf'merge into `project\.dataset\.{table}` as t\s+using \(select \* from `analyze_staging`', script)
+        assert f'SET {table}_rows = @@row_count' in script
+    assert script.index('create temp table analyze_staging') < script.index('merge into')
+    assert 'DROP TABLE IF EXISTS `analyze_staging`;' in script
+    assert statements(script)[-1] == 'SELECT ' + ', '.join(f'{table}_rows as {table}' for table in TABLES)
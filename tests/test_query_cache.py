@@ -0,0 +1,91 @@
+'''
+Hits, misses, expiry and eviction of the query-result cache, see benchmarks/bench_query_cache.py.
+'''
+import os
+
+import pandas as pd
+
+from benchmarks.fakes import FakeBigQueryClient, load_stage
+
+
+load_stage('explore')
+# importable once load_stage() put the stage on sys.path
+from query_cache import QueryCache, cached_client
+
+TRANSACTIONS = """
+    select from_address_hash, to_address_hash
+    from `celo-testnet-production.1_raw.transactions`
+    where block_timestamp > TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL -{days} DAY)
+"""
+CALLERS = "select * from `celo-testnet-production.1_attributions.callers` where tag = 'suspicious'"
+
+
+def fake_client():
+    transactions_df = pd.DataFrame({'from_address_hash': [f'0x{caller:040x}' for caller in range(1000)],
+                                    'to_address_hash': '0x' + 'c' * 40})
+    return (FakeBigQueryClient()
+                .route('1_attributions.callers', transactions_df.rename(columns={'from_address_hash': 'caller'}))
+                .route('1_raw.transactions', transactions_df))
+
+
+def read(client, query_string):
+    return client.query(query_string).result().to_dataframe()
+
+
+def test_hit_and_miss(tmp_path):
+    client, cache = fake_client(), QueryCache(str(tmp_path))
+    cached = cached_client(client, cache)
+    first = read(cached, TRANSACTIONS.format(days=3))
+    # formatting does not miss, another window does
+    pd.testing.assert_frame_equal(read(cached, '  ' + TRANSACTIONS.format(days=3) + ';'), first)
+    read(cached, TRANSACTIONS.format(days=7))
+
+    assert cache.report() == {'hits': 1, 'misses': 2, 'hit_rate': 0.333,
+                              'bytes_saved': int(first.memory_usage(deep=True).sum())}
+    # BigQuery gets the SQL as written, CURRENT_TIMESTAMP() included
+    assert client.queries == [TRANSACTIONS.format(days=3), TRANSACTIONS.format(days=7)]
+
+
+def test_written_tables_are_not_cached(tmp_path):
+    client, cache = fake_client(), QueryCache(str(tmp_path))
+    cached = cached_client(client, cache)
+    for _ in range(2):
+        read(cached, CALLERS)
+    assert client.queries == [CALLERS, CALLERS]
+    assert cache.report() == {'hits': 0, 'misses': 0, 'hit_rate': None, 'bytes_saved': 0}
+
+
+def test_keys_change_with_the_period(tmp_path):
+    cache, now = QueryCache(str(tmp_path), resolution='1h'), pd.Timestamp('2022-07-01 10:05', tz='UTC')
+    query_string = TRANSACTIONS.format(days=3)
+    assert cache.key(query_string, now) == cache.key(query_string, now + pd.Timedelta('50min'))
+    assert cache.key(query_string, now) != cache.key(query_string, now + pd.Timedelta('1h'))
+
+
+def test_expired_results_are_queried_again(tmp_path):
+    client = fake_client()
+    read(cached_client(client, QueryCache(str(tmp_path))), TRANSACTIONS.format(days=3))
+    expired = QueryCache(str(tmp_path), ttl=0)
+    read(cached_client(client, expired), TRANSACTIONS.format(days=3))
+    assert len(client.queries) == 2
+    assert expired.report()['misses'] == 1
+
+
+def test_least_recently_read_is_evicted(tmp_path):
+    client, cache = fake_client(), QueryCache(str(tmp_path))
+    cached = cached_client(client, cache)
+    read(cached, TRANSACTIONS.format(days=1))
+    size = max(entry.stat().st_size for entry in os.scandir(tmp_path))
+    # room for two results
+    cache.max_bytes = int(2.5 * size)
+    read(cached, TRANSACTIONS.format(days=2))
+    # reading the first again makes the second the least recently read
+    read(cached, TRANSACTIONS.format(days=1))
+    read(cached, TRANSACTIONS.format(days=3))
+    assert len(os.listdir(tmp_path)) == 2
+    cache.report()
+
+    for days in (1, 3, 2):
+        read(cached, TRANSACTIONS.format(days=days))
+    assert cache.report()['misses'] == 1
+    assert client.queries[-1] == TRANSACTIONS.format(days=2)
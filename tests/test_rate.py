@@ -0,0 +1,77 @@
+'''
+Burst statistics of the sliding-window rate detector against counting every window by brute force.
+'''
+import numpy as np
+import pandas as pd
+
+from benchmarks.fakes import load_stage
+
+
+load_stage('explore')
+# importable once load_stage() put the stage on sys.path
+from rate import BURST_THRESHOLD, BURST_WINDOW, RATE_WINDOWS, RateDetector, burst_stats, pair_keys
+
+
+def transactions(rows, seed=0):
+    random = np.random.default_rng(seed)
+    callers = [f'0x{caller:040x}' for caller in range(8)]
+    contracts = [f'0x{contract + 100:040x}' for contract in range(3)]
+    # bursts of a few seconds apart between long pauses, so every window fills and empties
+    gaps = np.where(random.random(rows) < 0.9, random.integers(0, 8, rows), random.integers(60, 4000, rows))
+    return pd.DataFrame({'from_address_hash': random.choice(callers, rows),
+                         'to_address_hash': random.choice(contracts, rows),
+                         'block_timestamp': pd.Timestamp('2022-01-01', tz='UTC')
+                                            + pd.to_timedelta(np.cumsum(gaps), unit='s')})
+
+
+'''
+The statistics of every key, counting the transactions of every window one by one.
+'''
+def brute_force(keys, seconds, counted):
+    rows = {}
+    for key in np.unique(keys):
+        times = np.sort(seconds[keys == key], kind='stable')
+        kept = counted[keys == key][np.argsort(seconds[keys == key], kind='stable')]
+        if not kept.any():
+            continue
+        stats = {'invocations': int(kept.sum())}
+        for name, window in RATE_WINDOWS.items():
+            counts = np.array([sum(1 for earlier in times[:row + 1] if earlier > times[row] - window)
+                               for row in range(len(times))])
+            stats[f'max_{name}_invocations'] = int(counts[kept].max())
+            if name == BURST_WINDOW:
+                over = counts > BURST_THRESHOLD
+                rising = over & np.r_[True, ~over[:-1]]
+                stats['bursts'] = int(rising[kept].sum())
+        rows[key] = stats
+    return pd.DataFrame.from_dict(rows, orient='index').rename_axis('key').sort_index()
+
+
+def seconds_of(transactions_df):
+    timestamps = transactions_df['block_timestamp'].dt.tz_convert(None)
+    return timestamps.to_numpy().astype('datetime64[s]').astype(np.int64)
+
+
+def test_windows_match_brute_force():
+    transactions_df = transactions(3000)
+    keys, seconds = pair_keys(transactions_df), seconds_of(transactions_df)
+    stats_df = burst_stats(keys, seconds).set_index('key').sort_index()
+
+    expected_df = brute_force(keys, seconds, np.ones(len(keys), dtype=bool))
+    assert expected_df['bursts'].sum() > 0
+    pd.testing.assert_frame_equal(stats_df.astype('int64'), expected_df[stats_df.columns].astype('int64'))
+
+
+def test_lead_in_only_fills_windows():
+    transactions_df = transactions(3000, seed=1)
+    lead_in = transactions_df['block_timestamp'] < transactions_df['block_timestamp'].iloc[1000]
+    detector = RateDetector()
+    detector.add(transactions_df[lead_in], counted=False)
+    # the counted transactions streamed in several batches
+    counted_df = transactions_df[~lead_in]
+    for start in range(0, len(counted_df.index), 500):
+        detector.add(counted_df.iloc[start:start + 500])
+    stats_df = detector.stats().set_index('key').sort_index()
+
+    expected_df = brute_force(pair_keys(transactions_df), seconds_of(transactions_df), ~lead_in.to_numpy())
+    pd.testing.assert_frame_equal(stats_df.astype('int64'), expected_df[stats_df.columns].astype('int64'))
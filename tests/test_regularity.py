@@ -0,0 +1,46 @@
+'''
+Timing regularity of callers scored from the feature store, see benchmarks/bench_regularity.py.
+'''
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from benchmarks.fakes import load_stage
+from benchmarks.synthetic import START
+
+
+load_stage('analyze')
+# importable once load_stage() put the stage on sys.path
+from features import TRANSACTION_COLUMNS, FeatureStore
+from regularity import CONFIDENCE, regularity_scores
+
+BOT, HUMAN = '0x' + 'b' * 40, '0x' + 'a' * 40
+# seconds per block
+BLOCK_TIME = 5
+
+
+def calls(caller, gaps):
+    seconds = np.cumsum(gaps).astype('int64')
+    return pd.DataFrame({'from_address_hash': caller, 'to_address_hash': '0x' + 'c' * 40, 'signature': '0xa9059cbb',
+                         'block_timestamp': pd.Timestamp(START) + pd.to_timedelta(seconds, unit='s'),
+                         'block_number': seconds // BLOCK_TIME})
+
+
+def test_fixed_interval_caller_is_regular(tmp_path):
+    random = np.random.default_rng(0)
+    transactions_df = (pd.concat([calls(BOT, np.full(50, 60)), calls(HUMAN, random.exponential(600, 50) + 1)])
+                           .sort_values('block_number', kind='stable')
+                           .reset_index(drop=True))
+    store = FeatureStore(str(tmp_path))
+    # folded in two updates, so the gaps across them are merged too
+    for half in np.array_split(np.arange(len(transactions_df.index)), 2):
+        table = pa.Table.from_pandas(transactions_df.iloc[half][TRANSACTION_COLUMNS], preserve_index=False)
+        for _ in store.observe(table.to_batches()):
+            pass
+        store.update()
+
+    scores = regularity_scores(store.lookup([BOT, HUMAN])).set_index('address')
+    assert scores.loc[BOT, 'signals'] == 3
+    assert scores.loc[BOT, 'confidence_level'] == CONFIDENCE[3]
+    assert scores.loc[HUMAN, 'signals'] == 0
+    assert np.isnan(scores.loc[HUMAN, 'confidence_level'])
@@ -0,0 +1,54 @@
+'''
+Bytecode similarity tags of SimilarityIndex against the pairwise SequenceMatcher loop, see
+benchmarks/bench_similarity.py.
+'''
+import numpy as np
+
+from benchmarks.bench_similarity import mutate, pairwise_scores, random_addresses
+from benchmarks.fakes import load_stage
+
+
+load_stage('analyze')
+# importable once load_stage() put the stage on sys.path
+from similarity import SIMILARITY_THRESHOLD, SimilarityIndex, lcs_lengths, match_masks
+
+
+def lcs(left, right):
+    lengths = np.zeros((len(left) + 1, len(right) + 1), dtype=int)
+    for row, left_char in enumerate(left, 1):
+        for column, right_char in enumerate(right, 1):
+            lengths[row, column] = (lengths[row - 1, column - 1] + 1 if left_char == right_char
+                                    else max(lengths[row - 1, column], lengths[row, column - 1]))
+    return lengths[-1, -1]
+
+
+def test_lcs_lengths():
+    rng = np.random.RandomState(0)
+    alphabet = np.array(list('0123abcX'))
+    items = [''.join(alphabet[rng.randint(0, 8, size)]) for size in rng.randint(1, 65, 30)] + ['a' * 64]
+    values = [''.join(alphabet[rng.randint(0, 8, size)]) for size in rng.randint(0, 65, 30)] + ['a' * 64]
+    item_lengths = np.array([len(item) for item in items])
+    chunks = list(lcs_lengths(values, match_masks(items), item_lengths))
+
+    lengths = np.concatenate([chunk for _, chunk in chunks])
+    assert [start for start, _ in chunks] == list(range(0, len(values), len(chunks[0][1])))
+    assert lengths.tolist() == [[lcs(value, item) for item in items] for value in values]
+
+
+def test_tags_match_pairwise():
+    rng = np.random.RandomState(1)
+    bot_contracts = random_addresses(rng, 100)
+    # the more edits, the closer near-duplicates score to the threshold, and below it
+    duplicates = [address for edits in range(4, 22, 2)
+                  for address in mutate(rng, [bot_contracts[i] for i in rng.randint(0, 100, 15)], edits)]
+    suspicious = random_addresses(rng, 60) + duplicates
+
+    index = SimilarityIndex()
+    index.add(bot_contracts)
+    scores = index.best_scores(suspicious)
+    expected = pairwise_scores(suspicious, bot_contracts)
+
+    tagged = expected >= SIMILARITY_THRESHOLD
+    assert 0 < tagged.sum() < len(duplicates)
+    assert ((scores >= SIMILARITY_THRESHOLD) == tagged).all()
+    assert (scores[tagged] == expected[tagged]).all()
@@ -0,0 +1,93 @@
+'''
+Error bounds of the sketch engine against the exact counts of the same transactions.
+'''
+import numpy as np
+import pandas as pd
+
+from benchmarks.fakes import load_stage
+
+
+load_stage('explore')
+# importable once load_stage() put the stage on sys.path
+from engine import SIGNATURE_KEYS, count_signatures
+from rate import pair_keys
+from sketch import TOTAL_KEYS, CountMinSketch, SignatureSketch, add_error_bounds
+
+
+def transactions(rows, seed=0):
+    random = np.random.default_rng(seed)
+    # heavy tailed, a few triples take most transactions
+    callers = random.zipf(1.3, rows) % 3000
+    contracts = random.zipf(1.5, rows) % 200
+    return pd.DataFrame({'from_address_hash': [f'0x{caller:040x}' for caller in callers],
+                         'to_address_hash': [f'0x{contract:040x}' for contract in contracts],
+                         'signature': [f'0x{selector:08x}' for selector in (callers + contracts) % 7],
+                         'block_timestamp': pd.Timestamp('2022-01-01', tz='UTC')
+                                            + pd.to_timedelta(np.arange(rows), unit='s')})
+
+
+def split(df, parts):
+    bounds = np.linspace(0, len(df.index), parts + 1).astype(int)
+    return [df.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def sketched(transactions_df, capacity, parts=1):
+    sketches = []
+    for part in split(transactions_df, parts):
+        sketch = SignatureSketch(capacity=capacity, epsilon=0.001)
+        for batch in split(part, 5):
+            sketch.add(batch)
+        sketches.append(sketch)
+    for other in sketches[1:]:
+        sketches[0].merge(other)
+    return sketches[0]
+
+
+def check_heavy_hitters(transactions_df, sketch):
+    exact = count_signatures(transactions_df).set_index(SIGNATURE_KEYS)['invocations']
+    counts = sketch.signature_counts().set_index(SIGNATURE_KEYS)
+    bound = len(transactions_df.index) / sketch.triples.capacity
+    # more triples than counters, so the summary evicted some
+    assert len(exact.index) > sketch.triples.capacity
+
+    # counts never undercount, and overcount by at most their error, itself at most N / capacity
+    true = exact.reindex(counts.index).to_numpy()
+    assert (counts['invocations'] >= true).all()
+    assert (counts['invocations'] - counts['invocations_error'] <= true).all()
+    assert (counts['invocations_error'] <= bound).all()
+    # every triple invoked more than N / capacity times is kept
+    assert exact[exact > bound].index.isin(counts.index).all()
+
+
+def test_space_saving_bounds():
+    transactions_df = transactions(50000)
+    check_heavy_hitters(transactions_df, sketched(transactions_df, capacity=500))
+
+
+def test_merged_space_saving_bounds():
+    transactions_df = transactions(50000, seed=1)
+    check_heavy_hitters(transactions_df, sketched(transactions_df, capacity=500, parts=4))
+
+
+def test_count_min_bounds():
+    signature_counts_df = count_signatures(transactions(50000, seed=2))
+    totals = signature_counts_df.groupby(TOTAL_KEYS)['invocations'].sum()
+    sketch = CountMinSketch(epsilon=0.001, delta=0.01)
+    sketch.add(pair_keys(signature_counts_df, TOTAL_KEYS), signature_counts_df['invocations'])
+
+    overcount = sketch.estimate(pair_keys(totals.reset_index(), TOTAL_KEYS)) - totals.to_numpy()
+    assert (overcount >= 0).all()
+    # each total overcounts by more than epsilon * N with probability at most delta
+    assert (overcount > sketch.error_bound()).mean() <= sketch.delta
+
+
+def test_error_bounds_hold_the_totals():
+    transactions_df = transactions(50000, seed=3)
+    sketch = sketched(transactions_df, capacity=500)
+    signature_counts_df = sketch.signature_counts()
+    signatures_df = signature_counts_df[TOTAL_KEYS].drop_duplicates()
+    bounded_df = add_error_bounds(signatures_df, signature_counts_df, sketch).set_index(TOTAL_KEYS)
+
+    totals = transactions_df.groupby(TOTAL_KEYS).size().reindex(bounded_df.index).to_numpy()
+    assert (bounded_df['invocations'] >= totals).all()
+    assert (bounded_df['invocations'] - bounded_df['invocations_error'] <= totals).all()
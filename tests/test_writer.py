@@ -0,0 +1,43 @@
+'''
+Upserts of the analyze writer applied by LocalBackend, the in-memory stand-in of the MERGE script.
+'''
+import pandas as pd
+
+from benchmarks.fakes import load_stage
+
+
+load_stage('analyze')
+# importable once load_stage() put the stage on sys.path
+from tagging import tag_columns
+from writer import LocalBackend, staging_frame
+
+CONTRACT = '0x' + 'c' * 40
+
+
+def callers(confidence):
+    callers_df = pd.DataFrame({'caller': [f'0x{caller:040x}' for caller in range(len(confidence))],
+                               'to_address_hash': CONTRACT})
+    return tag_columns(callers_df, 'bot', confidence)
+
+
+def contracts():
+    return tag_columns(pd.DataFrame({'to_address_hash': [CONTRACT]}), 'bot', 0.95)
+
+
+def test_upserts_insert_update_and_skip():
+    backend = LocalBackend()
+    counts = backend.upsert(staging_frame({'contracts': contracts(), 'callers': callers([0.6, 0.7, 0.8])}))
+    assert counts == {'contracts': 1, 'signatures': 0, 'callers': 3}
+    assert backend.tables['callers']['updated_at'].isna().all()
+
+    # the first caller changed, the second did not, the last is new; the contract is the same
+    counts = backend.upsert(staging_frame({'contracts': contracts(), 'callers': callers([0.95, 0.7, 0.8, 0.6])}))
+    assert counts == {'contracts': 0, 'signatures': 0, 'callers': 2}
+
+    callers_df = backend.tables['callers'].sort_values('caller').reset_index(drop=True)
+    assert callers_df['caller'].tolist() == callers([0.95, 0.7, 0.8, 0.6])['caller'].tolist()
+    assert callers_df['confidence_level'].tolist() == [0.95, 0.7, 0.8, 0.6]
+    # only the changed row got a new updated_at, inserted rows get theirs from the table default
+    assert callers_df['updated_at'].notna().tolist() == [True, False, False, False]
+    assert len(backend.tables['contracts'].index) == 1
+    assert backend.tables['contracts']['updated_at'].isna().all()